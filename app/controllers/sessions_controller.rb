@@ -82,6 +82,14 @@ class SessionsController < ApplicationController
     return
   end
 
+  # The face service already holds every encoding; send only the probe image,
+  # matched first against the configured event shard, then everyone
+  if FaceRecognitionService.gallery_mode?
+    shard = FaceRecognitionService.default_shard
+    render_face_authentication_result(FaceRecognitionService.authenticate_face(image_data, shard: shard, fallback: true))
+    return
+  end
+
   # Get all users with face encodings
   users_with_faces = User.where.not(face_encoding_data: [ nil, "" ])
 
@@ -93,6 +101,9 @@ class SessionsController < ApplicationController
   # Prepare known encodings for the Python service
   known_encodings = users_with_faces.map do |user|
     begin
+      # Packed encodings are forwarded untouched; the face service decodes them
+      next { user_id: user.id, encoding: user.face_encoding_data } if FaceEncodingCodec.packed?(user.face_encoding_data)
+
       # Handle double-encoded JSON (string containing JSON string)
       encoding_data = user.face_encoding_data
 
@@ -130,26 +141,7 @@ class SessionsController < ApplicationController
 
   # Call Python service for authentication
   result = FaceRecognitionService.authenticate_face(image_data, known_encodings)
-
-  if result[:success] && result[:authenticated]
-    # Log the user in
-    user = User.find(result[:user_id])
-    session[:user_id] = user.id
-
-    render json: {
-      success: true,
-      authenticated: true,
-      user_id: user.id,
-      user_name: user.name,
-      confidence: result[:confidence]
-    }
-  else
-    render json: {
-      success: false,
-      authenticated: false,
-      error: result[:error] || "Face authentication failed"
-    }, status: :unauthorized
-  end
+  render_face_authentication_result(result)
 
   rescue => e
     Rails.logger.error "Face authentication error: #{e.message}"
@@ -161,4 +153,28 @@ class SessionsController < ApplicationController
     @speaker = @session.speaker
     @current_user = current_user
   end
+
+  private
+
+  def render_face_authentication_result(result)
+    if result[:success] && result[:authenticated]
+      # Log the user in
+      user = User.find(result[:user_id])
+      session[:user_id] = user.id
+
+      render json: {
+        success: true,
+        authenticated: true,
+        user_id: user.id,
+        user_name: user.name,
+        confidence: result[:confidence]
+      }
+    else
+      render json: {
+        success: false,
+        authenticated: false,
+        error: result[:error] || "Face authentication failed"
+      }, status: :unauthorized
+    end
+  end
 end
@@ -22,15 +22,22 @@ class User < ApplicationRecord
     face_encoding_data.present?
   end
 
+  # Stored either in the face service's packed format or as a legacy JSON array
   def face_encoding
     return nil unless has_face_encoding?
-    JSON.parse(face_encoding_data)
-  rescue JSON::ParserError
+    FaceEncodingCodec.decode(face_encoding_data)
+  rescue JSON::ParserError, ArgumentError
     nil
   end
 
-  def face_encoding=(encoding_array)
-    self.face_encoding_data = encoding_array.to_json
+  # Strings (packed encodings from the face service) are stored as-is; arrays are packed as float32
+  def face_encoding=(encoding)
+    self.face_encoding_data = encoding.is_a?(String) ? encoding : FaceEncodingCodec.pack(encoding)
+  end
+
+  # The face service accepts packed encodings directly, so skip decoding them
+  def face_encoding_for_service
+    FaceEncodingCodec.packed?(face_encoding_data) ? face_encoding_data : face_encoding
   end
 
   # Methods
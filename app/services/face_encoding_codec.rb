@@ -0,0 +1,57 @@
+require "base64"
+require "json"
+
+# Reads and writes the face service's packed encoding format: an 8-byte
+# little-endian header ("FE", format version, dtype, backend, model version,
+# dimension) followed by float32 or float16 values, stored base64-encoded.
+# Legacy JSON float arrays are still read.
+module FaceEncodingCodec
+  MAGIC = "FE".b
+  FORMAT_VERSION = 1
+  HEADER = "a2CCCCv"
+  HEADER_SIZE = 8
+  FLOAT32 = 1
+  FLOAT16 = 2
+
+  def self.packed?(data)
+    return false unless data.is_a?(String) && data.length >= 4
+    Base64.strict_decode64(data[0, 4]).start_with?(MAGIC)
+  rescue ArgumentError
+    false
+  end
+
+  # Packs floats as float32 with an "unknown" backend tag
+  def self.pack(values)
+    header = [ MAGIC, FORMAT_VERSION, FLOAT32, 0, 0, values.size ].pack(HEADER)
+    Base64.strict_encode64(header + values.map(&:to_f).pack("e*"))
+  end
+
+  def self.unpack(data)
+    bytes = Base64.strict_decode64(data)
+    magic, version, dtype, _backend, _model_version, dimension = bytes.unpack(HEADER)
+    raise ArgumentError, "Not a packed face encoding" unless magic == MAGIC && version == FORMAT_VERSION
+
+    body = bytes.byteslice(HEADER_SIZE..)
+    case dtype
+    when FLOAT32 then body.unpack("e#{dimension}")
+    when FLOAT16 then body.unpack("v#{dimension}").map { |half| half_to_float(half) }
+    else raise ArgumentError, "Unknown packed encoding dtype #{dtype}"
+    end
+  end
+
+  # Array of floats from either the packed format or a JSON array
+  def self.decode(data)
+    packed?(data) ? unpack(data) : JSON.parse(data)
+  end
+
+  def self.half_to_float(half)
+    sign = (half >> 15).zero? ? 1.0 : -1.0
+    exponent = (half >> 10) & 0x1f
+    fraction = half & 0x3ff
+    return sign * fraction * 2.0**-24 if exponent.zero?
+    return fraction.zero? ? sign * Float::INFINITY : Float::NAN if exponent == 0x1f
+
+    sign * (1 + fraction / 1024.0) * 2.0**(exponent - 15)
+  end
+  private_class_method :half_to_float
+end
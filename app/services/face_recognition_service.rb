@@ -1,44 +1,173 @@
 require "net/http"
 require "uri"
 require "json"
+require "base64"
 
 class FaceRecognitionService
   SERVICE_URL = ENV.fetch("FACE_SERVICE_URL", "http://localhost:8001")
 
-  def self.encode_face(image_base64)
+  # encoding_format "float32"/"float16" returns :encoding_packed (base64) instead of a float array
+  def self.encode_face(image_base64, encoding_format: "json")
     uri = URI.parse("#{SERVICE_URL}/encode")
     req = Net::HTTP::Post.new(uri)
     req["Content-Type"] = "application/json"
-    req.body = { image_base64: image_base64 }.to_json
+    req.body = { image_base64: image_base64, encoding_format: encoding_format }.to_json
 
-    res = http_request(uri, req)
+    res = http_request(uri, req, idempotent: true)
     JSON.parse(res.body, symbolize_names: true)
   rescue => e
     Rails.logger.error("FaceRecognitionService.encode_face error: #{e.message}")
     { success: false, error: "Service error" }
   end
 
-  def self.authenticate_face(image_base64, known_encodings)
-    uri = URI.parse("#{SERVICE_URL}/authenticate")
-    req = Net::HTTP::Post.new(uri)
+  # When true, the face service matches against its resident gallery and
+  # /authenticate no longer needs every known encoding in the request body.
+  def self.gallery_mode?
+    ENV.fetch("FACE_SERVICE_GALLERY", "false") == "true"
+  end
+
+  # Gallery shard that check-ins match against by default (e.g. the current
+  # event's roster, kept in sync with sync_shard); nil matches everyone.
+  def self.default_shard
+    ENV["FACE_SERVICE_SHARD"].presence
+  end
+
+  # Pass known_encodings = nil to match against the resident gallery; the
+  # image is then sent as raw bytes instead of base64 JSON.
+  # shard: / candidates: (user ids) limit the match to that roster;
+  # fallback: true retries against everyone when nobody in it matches.
+  def self.authenticate_face(image_base64, known_encodings = nil, shard: nil, candidates: nil, fallback: false)
+    scope = { shard: shard, candidates: candidates, fallback: (fallback if shard || candidates) }.compact
+    if known_encodings.nil?
+      uri = URI.parse("#{SERVICE_URL}/authenticate/raw")
+      uri.query = URI.encode_www_form(scope) if scope.any?
+      req = Net::HTTP::Post.new(uri)
+      req["Content-Type"] = "application/octet-stream"
+      req.body = Base64.decode64(image_base64.sub(/\Adata:[^,]*,/, ""))
+    else
+      uri = URI.parse("#{SERVICE_URL}/authenticate")
+      req = Net::HTTP::Post.new(uri)
+      req["Content-Type"] = "application/json"
+      req.body = { image_base64: image_base64, known_encodings: known_encodings }.merge(scope).to_json
+    end
+
+    res = http_request(uri, req, idempotent: true)
+    JSON.parse(res.body, symbolize_names: true)
+  rescue => e
+    Rails.logger.error("FaceRecognitionService.authenticate_face error: #{e.message}")
+    { success: false, error: "Service error" }
+  end
+
+  # Group check-in: identifies every face in the image, each user at most
+  # once. Returns { faces: [{ box:, authenticated:, user_id:, confidence: }] }.
+  def self.authenticate_group(image_base64, known_encodings = nil)
+    if known_encodings.nil?
+      uri = URI.parse("#{SERVICE_URL}/authenticate/group/raw")
+      req = Net::HTTP::Post.new(uri)
+      req["Content-Type"] = "application/octet-stream"
+      req.body = Base64.decode64(image_base64.sub(/\Adata:[^,]*,/, ""))
+    else
+      uri = URI.parse("#{SERVICE_URL}/authenticate/group")
+      req = Net::HTTP::Post.new(uri)
+      req["Content-Type"] = "application/json"
+      req.body = { image_base64: image_base64, known_encodings: known_encodings }.to_json
+    end
+
+    res = http_request(uri, req, idempotent: true)
+    JSON.parse(res.body, symbolize_names: true)
+  rescue => e
+    Rails.logger.error("FaceRecognitionService.authenticate_group error: #{e.message}")
+    { success: false, error: "Service error" }
+  end
+
+  # Enroll or replace a user's encoding in the resident gallery
+  def self.enroll_face(user_id, encoding)
+    uri = URI.parse("#{SERVICE_URL}/gallery/#{user_id}")
+    req = Net::HTTP::Put.new(uri)
+    req["Content-Type"] = "application/json"
+    req.body = { encoding: encoding }.to_json
+
+    res = http_request(uri, req)
+    if res.code == "404"
+      uri = URI.parse("#{SERVICE_URL}/gallery")
+      req = Net::HTTP::Post.new(uri)
+      req["Content-Type"] = "application/json"
+      req.body = { user_id: user_id, encoding: encoding }.to_json
+      res = http_request(uri, req)
+    end
+    JSON.parse(res.body, symbolize_names: true)
+  rescue => e
+    Rails.logger.error("FaceRecognitionService.enroll_face error: #{e.message}")
+    { success: false, error: "Service error" }
+  end
+
+  # Create or replace a gallery shard's membership, e.g. an event's attendees
+  def self.sync_shard(name, user_ids)
+    uri = URI.parse("#{SERVICE_URL}/gallery/shards/#{URI.encode_www_form_component(name)}")
+    req = Net::HTTP::Put.new(uri)
     req["Content-Type"] = "application/json"
-    req.body = {
-      image_base64: image_base64,
-      known_encodings: known_encodings
-    }.to_json
+    req.body = { user_ids: user_ids }.to_json
 
     res = http_request(uri, req)
     JSON.parse(res.body, symbolize_names: true)
   rescue => e
-    Rails.logger.error("FaceRecognitionService.authenticate_face error: #{e.message}")
+    Rails.logger.error("FaceRecognitionService.sync_shard error: #{e.message}")
+    { success: false, error: "Service error" }
+  end
+
+  def self.remove_face(user_id)
+    uri = URI.parse("#{SERVICE_URL}/gallery/#{user_id}")
+    req = Net::HTTP::Delete.new(uri)
+
+    res = http_request(uri, req)
+    JSON.parse(res.body, symbolize_names: true)
+  rescue => e
+    Rails.logger.error("FaceRecognitionService.remove_face error: #{e.message}")
     { success: false, error: "Service error" }
   end
 
   private
 
-  def self.http_request(uri, req)
-    Net::HTTP.start(uri.host, uri.port, use_ssl: uri.scheme == "https", open_timeout: 5, read_timeout: 10) do |http|
-      http.request(req)
+  # Errors that mean the kept-alive connection was closed under us
+  STALE_CONNECTION_ERRORS = [EOFError, Errno::ECONNRESET, Errno::EPIPE, IOError].freeze
+
+  # Reuses one kept-alive connection per thread and service host instead of a
+  # TCP (and TLS) handshake per call. On a stale connection an idempotent
+  # request is retried once on a fresh one; anything else (e.g. POST /gallery)
+  # is not, since the reset may have come after the service applied it.
+  # Read-only POSTs (encode, authenticate) pass idempotent: true.
+  def self.http_request(uri, req, idempotent: !req.is_a?(Net::HTTP::Post))
+    attempts = 0
+    begin
+      attempts += 1
+      connection(uri).request(req)
+    rescue *STALE_CONNECTION_ERRORS
+      reset_connection(uri)
+      retry if idempotent && attempts < 2
+      raise
     end
   end
+
+  def self.connection(uri)
+    connections = Thread.current[:face_service_connections] ||= {}
+    key = [uri.scheme, uri.host, uri.port]
+    http = connections[key]
+    return http if http&.started?
+
+    http = Net::HTTP.new(uri.host, uri.port)
+    http.use_ssl = uri.scheme == "https"
+    http.open_timeout = 5
+    http.read_timeout = 10
+    http.keep_alive_timeout = 30
+    http.start
+    connections[key] = http
+  end
+
+  def self.reset_connection(uri)
+    connections = Thread.current[:face_service_connections] || {}
+    http = connections.delete([uri.scheme, uri.host, uri.port])
+    http.finish if http&.started?
+  rescue IOError
+    nil
+  end
 end
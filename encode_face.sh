@@ -4,7 +4,7 @@
 # Ensures virtual environment is activated before running encode_sample.py
 
 if [ $# -ne 1 ]; then
-    echo "Usage: $0 <path_to_image>"
+    echo "Usage: $0 <path_to_image | path_to_image_directory>"
     echo "Example: $0 /path/to/face_photo.jpg"
     exit 1
 fi
@@ -15,8 +15,8 @@ IMAGE_PATH="$1"
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 cd "$SCRIPT_DIR"
 
-# Check if image exists
-if [ ! -f "$IMAGE_PATH" ]; then
+# Check if image (or image directory) exists
+if [ ! -e "$IMAGE_PATH" ]; then
     echo "❌ Image file not found: $IMAGE_PATH"
     exit 1
 fi
@@ -45,8 +45,20 @@ echo "✅ Face Recognition API is running"
 # Run the encoding script
 echo "🎯 Encoding face from: $IMAGE_PATH"
 python python_services/encode_sample.py "$IMAGE_PATH"
+STATUS=$?
 
-if [ $? -eq 0 ] && [ -f "face_encoding.json" ]; then
+if [ -d "$IMAGE_PATH" ]; then
+    if [ $STATUS -eq 0 ]; then
+        echo ""
+        echo "🎉 Success! Face encodings saved to: encodings.jsonl"
+    else
+        echo ""
+        echo "❌ No face encodings were generated"
+    fi
+    exit $STATUS
+fi
+
+if [ $STATUS -eq 0 ] && [ -f "face_encoding.json" ]; then
     echo ""
     echo "🎉 Success! Face encoding saved to: face_encoding.json"
     echo ""
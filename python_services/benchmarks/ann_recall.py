@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Recall@1 / latency benchmark for the IVF ANN index against the exact scan.
+
+Builds a synthetic gallery of unit-ish 128-d "identities", probes it with
+noisy copies of enrolled vectors and reports, for each nprobe setting, how
+often ANN search plus exact re-rank returns the same top-1 as a brute-force
+scan, alongside the per-query latency of both.
+
+Usage: python benchmarks/ann_recall.py [--size 100000] [--nlist 1024] [--nprobe 1,4,16,64] [--noise 0.02]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from face_service.ann import IVFFlatIndex  # noqa: E402
+from face_service.matching import EncodingMatrix  # noqa: E402
+
+
+def synthetic_gallery(size, dimension, seed=0):
+    rng = np.random.default_rng(seed)
+    # Loose clusters, like embeddings of people who look somewhat alike
+    centers = rng.normal(size=(max(1, size // 100), dimension)).astype(np.float32)
+    gallery = centers[rng.integers(0, len(centers), size)] + rng.normal(scale=0.6, size=(size, dimension)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True) * 2
+    return gallery.astype(np.float32)
+
+
+def run(size, dimension, nlist, nprobes, queries, rerank_k, metric, noise=0.02, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    gallery = synthetic_gallery(size, dimension, seed)
+    ids = list(range(size))
+    targets = rng.integers(0, size, queries)
+    probes = gallery[targets] + rng.normal(scale=noise, size=(queries, dimension)).astype(np.float32)
+
+    exact = EncodingMatrix(gallery)
+    started = time.perf_counter()
+    if metric == "euclidean":
+        truth = [int(np.argmin(exact.euclidean_distances(p))) for p in probes]
+    else:
+        truth = [int(np.argmax(exact.cosine_similarities(p))) for p in probes]
+    exact_ms = (time.perf_counter() - started) * 1000 / queries
+
+    index = IVFFlatIndex(nlist=nlist)
+    started = time.perf_counter()
+    index.build(ids, gallery, metric)
+    build_s = time.perf_counter() - started
+
+    results = []
+    for nprobe in nprobes:
+        hits = 0
+        started = time.perf_counter()
+        for probe, expected in zip(probes, truth):
+            shortlist = index.search(probe, rerank_k, nprobe=nprobe)
+            if not shortlist:
+                continue
+            rows = EncodingMatrix(gallery[shortlist])
+            if metric == "euclidean":
+                best = shortlist[int(np.argmin(rows.euclidean_distances(probe)))]
+            else:
+                best = shortlist[int(np.argmax(rows.cosine_similarities(probe)))]
+            hits += best == expected
+        results.append({
+            "nprobe": nprobe,
+            "recall_at_1": hits / queries,
+            "query_ms": (time.perf_counter() - started) * 1000 / queries,
+        })
+
+    return {
+        "size": size,
+        "dimension": dimension,
+        "metric": metric,
+        "nlist": nlist,
+        "rerank_k": rerank_k,
+        "queries": queries,
+        "noise": noise,
+        "build_s": build_s,
+        "exact_query_ms": exact_ms,
+        "ann": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=128)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", default="1,4,16,64")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rerank-k", type=int, default=32)
+    parser.add_argument("--metric", choices=["euclidean", "cosine"], default="euclidean")
+    parser.add_argument("--noise", type=float, default=0.02, help="per-dimension probe noise")
+    args = parser.parse_args()
+
+    report = run(
+        args.size, args.dimension, args.nlist,
+        [int(n) for n in args.nprobe.split(",")],
+        args.queries, args.rerank_k, args.metric, args.noise,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
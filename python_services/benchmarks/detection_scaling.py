@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Detection latency versus recall across input sizes and detection policies.
+
+Each scene holds several synthetic faces of known position and size (from
+small to large), rendered at several resolutions. For every combination of
+max detection side and Haar scale factor the script reports the median
+detection latency and the fraction of ground-truth faces recovered
+(IoU >= 0.5), which is what FACE_DETECT_MAX_SIDE and the per-request
+max_detect_side / scale_factor / min_face_size overrides trade off.
+
+With --images DIR, real photos are used instead and ground truth is what the
+legacy full-resolution, scaleFactor=1.05 detection finds in them.
+
+Usage: python benchmarks/detection_scaling.py [--sizes 640,1280,2560,4000] [--max-sides 0,1280,960,640]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.synthetic_faces import scene  # noqa: E402
+from face_service.detection import DetectionPolicy, detect_haar  # noqa: E402
+from face_service.face_service import FaceService  # noqa: E402
+
+# Face centres and sizes relative to the image's short side
+FACE_LAYOUT = [((0.2, 0.3), 0.18), ((0.5, 0.55), 0.35), ((0.8, 0.35), 0.25)]
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    return inter / float(aw * ah + bw * bh - inter) if inter else 0.0
+
+
+def recall(found, truth):
+    if not truth:
+        return 1.0
+    return sum(1 for t in truth if any(iou(t, f) >= 0.5 for f in found)) / len(truth)
+
+
+def synthetic_cases(sizes):
+    for longest in sizes:
+        width, height = longest, longest * 3 // 4
+        gray = np.zeros((height, width), dtype=np.uint8)
+        truth = []
+        for (px, py), rel in FACE_LAYOUT:
+            face_size = int(rel * height)
+            gray = np.maximum(gray, scene(width, height, face_size, [(px, py)], background=0)[..., 0])
+            # The drawn face occupies roughly the central 60% of its tile
+            truth.append((int(px * width - 0.3 * face_size), int(py * height - 0.35 * face_size),
+                          int(0.6 * face_size), int(0.7 * face_size)))
+        gray[gray == 0] = 170
+        yield f"synthetic-{width}x{height}", gray, truth
+
+
+def photo_cases(directory, cascade):
+    legacy = DetectionPolicy(max_side=None, scale_factor=1.05, min_face_size=100, min_neighbors=5)
+    for name in sorted(os.listdir(directory)):
+        image = cv2.imread(os.path.join(directory, name), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            continue
+        yield name, image, detect_haar(cascade, image, legacy)
+
+
+def time_detection(cascade, gray, policy, repeats):
+    timings = []
+    found = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        found = detect_haar(cascade, gray, policy)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="640,1280,2560,4000", help="longest image side for synthetic scenes")
+    parser.add_argument("--max-sides", default="0,1280,960,640", help="detection max_side values (0 = full resolution)")
+    parser.add_argument("--scale-factors", default="1.05,1.1,1.2")
+    parser.add_argument("--min-face-size", type=int, default=60)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--images", help="directory of real photos to use instead of synthetic scenes")
+    args = parser.parse_args()
+
+    cascade = FaceService().face_cascade
+    if args.images:
+        cases = list(photo_cases(args.images, cascade))
+    else:
+        cases = list(synthetic_cases([int(v) for v in args.sizes.split(",")]))
+
+    rows = []
+    for name, gray, truth in cases:
+        for max_side in (int(v) for v in args.max_sides.split(",")):
+            for scale_factor in (float(v) for v in args.scale_factors.split(",")):
+                policy = DetectionPolicy(max_side=max_side or None, scale_factor=scale_factor,
+                                         min_face_size=args.min_face_size, min_neighbors=5)
+                latency, found = time_detection(cascade, gray, policy, args.repeats)
+                rows.append({
+                    "image": name,
+                    "max_side": max_side or None,
+                    "scale_factor": scale_factor,
+                    "latency_ms": round(latency, 2),
+                    "faces": len(truth),
+                    "recall": round(recall(found, truth), 3),
+                })
+                print(f"{name:>24}  max_side={str(max_side or 'full'):>5}  scale={scale_factor:<4}  "
+                      f"{latency:9.1f} ms  recall={rows[-1]['recall']:.2f}", file=sys.stderr)
+
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
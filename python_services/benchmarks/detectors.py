@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Latency and detection rate of each face detector backend.
+
+Runs every detector this host can load (Haar always; HOG when
+face_recognition is installed; YuNet when FACE_YUNET_MODEL or --yunet-model
+points at its ONNX file) through FaceService.locate_faces on the same sample
+set, and reports median/p95 latency and detection rate per backend. With
+--min-rate it also names the fastest detector that meets that rate, which is
+the one to put in FACE_DETECTOR.
+
+The default samples are the synthetic multi-face scenes of
+detection_scaling.py, scored as the fraction of ground-truth faces found
+(IoU >= 0.5). With --images DIR, real photos are used and each is expected to
+hold at least one face (e.g. enrollment photos), so the rate is the fraction
+of photos with a detection.
+
+Usage: python benchmarks/detectors.py [--sizes 640,1280] [--images DIR] [--yunet-model face_detection_yunet.onnx]
+                                      [--min-rate 0.95]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.detection_scaling import recall, synthetic_cases  # noqa: E402
+from face_service.detection import DETECTORS, DetectionPolicy  # noqa: E402
+from face_service.face_service import FaceService  # noqa: E402
+from face_service.models import MODELS  # noqa: E402
+
+
+def synthetic_samples(sizes):
+    for name, gray, truth in synthetic_cases(sizes):
+        yield name, cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB), truth
+
+
+def photo_samples(directory):
+    for name in sorted(os.listdir(directory)):
+        image = cv2.imread(os.path.join(directory, name))
+        if image is not None:
+            yield name, cv2.cvtColor(image, cv2.COLOR_BGR2RGB), None
+
+
+def run(service, detector, samples, max_side, min_face_size, repeats):
+    policy = DetectionPolicy(detector=detector, max_side=max_side or None, scale_factor=1.1,
+                             min_face_size=min_face_size, min_neighbors=5)
+    # First call loads the model (dlib, ONNX) outside the timings
+    service.locate_faces(samples[0][1], policy)
+    timings, rates = [], []
+    for _, image, truth in samples:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            found = service.locate_faces(image, policy)
+            timings.append((time.perf_counter() - started) * 1000)
+        rates.append(recall(found, truth) if truth is not None else float(bool(found)))
+    timings.sort()
+    return {
+        "detector": detector,
+        "median_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(0.95 * len(timings)))], 2),
+        "detection_rate": round(statistics.mean(rates), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="640,1280,2560", help="longest image side for synthetic scenes")
+    parser.add_argument("--images", help="directory of real photos, each holding at least one face")
+    parser.add_argument("--detectors", default=",".join(DETECTORS))
+    parser.add_argument("--yunet-model", help="YuNet ONNX model (defaults to FACE_YUNET_MODEL)")
+    parser.add_argument("--max-side", type=int, default=1280, help="detection max_side (0 = full resolution)")
+    parser.add_argument("--min-face-size", type=int, default=60)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--min-rate", type=float, help="report the fastest detector with at least this detection rate")
+    args = parser.parse_args()
+
+    if args.yunet_model:
+        MODELS.yunet_path = args.yunet_model
+    if args.images:
+        samples = list(photo_samples(args.images))
+    else:
+        samples = list(synthetic_samples([int(v) for v in args.sizes.split(",")]))
+    if not samples:
+        parser.error("no readable images")
+
+    service = FaceService()
+    report = {"samples": len(samples), "max_side": args.max_side or None, "detectors": [], "unavailable": []}
+    for detector in args.detectors.split(","):
+        if not MODELS.detector_available(detector):
+            report["unavailable"].append(detector)
+            continue
+        row = run(service, detector, samples, args.max_side, args.min_face_size, args.repeats)
+        report["detectors"].append(row)
+        print(f"{detector:>6}  median={row['median_ms']:8.1f} ms  p95={row['p95_ms']:8.1f} ms  "
+              f"rate={row['detection_rate']:.3f}", file=sys.stderr)
+
+    if args.min_rate is not None:
+        passing = [row for row in report["detectors"] if row["detection_rate"] >= args.min_rate]
+        report["recommended"] = min(passing, key=lambda row: row["median_ms"])["detector"] if passing else None
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Throughput/latency trade-off of request-level micro-batching.
+
+Closed-loop load test of the /authenticate/raw pipeline without the HTTP
+layer: each of --concurrency clients repeatedly encodes a synthetic face
+photo through the API's cache-less encode path (executor, or the encode
+micro-batcher) and matches it against a resident gallery (directly, or
+through the match micro-batcher), back to back for --duration seconds.
+Every combination of --max-batch and --max-wait-ms is run at every
+concurrency, with max batch 1 as the unbatched baseline.
+
+Reports requests/s, p50/p95/p99 latency and the mean batch size actually
+formed, as JSON.
+
+Usage: python benchmarks/microbatching.py [--executor thread|process] [--workers 4] [--min-chunk 4]
+                                          [--concurrency 1,8,32] [--max-batch 1,4,8,16] [--max-wait-ms 2,5]
+                                          [--duration 5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def parse_ints(text):
+    return [int(value) for value in text.split(",") if value]
+
+
+def parse_floats(text):
+    return [float(value) for value in text.split(",") if value]
+
+
+async def load(api, images, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        nonlocal errors
+        i = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                encoding = await api._encode_cached(images[i % len(images)])
+                if encoding is not None:
+                    await api._match_probe(encoding)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            i += concurrency
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--executor", choices=["thread", "process"], default="process")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--min-chunk", type=int, default=4, help="smallest chunk of a batch sent to one worker")
+    parser.add_argument("--concurrency", type=parse_ints, default=[1, 8, 32])
+    parser.add_argument("--max-batch", type=parse_ints, default=[1, 4, 8, 16])
+    parser.add_argument("--max-wait-ms", type=parse_floats, default=[2.0, 5.0])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per run")
+    parser.add_argument("--gallery", type=int, default=10000)
+    parser.add_argument("--width", type=int, default=640, help="photo width in pixels")
+    args = parser.parse_args()
+
+    # Configure the API module before it is imported; the cache would turn repeats into lookups
+    os.environ.update({
+        "FACE_EXECUTOR": args.executor,
+        "FACE_EXECUTOR_WORKERS": str(args.workers),
+        "FACE_BATCH_MIN_CHUNK": str(args.min_chunk),
+        "FACE_EXECUTOR_MAX_PENDING": "100000",
+        "FACE_CACHE_ENABLED": "false",
+    })
+    from benchmarks.suite import face_image, synthetic_gallery
+    from face_service import api
+    from face_service.batching import MicroBatcher
+
+    images = [face_image(args.width + 8 * i) for i in range(4)]
+    probe = api.face_service.encode_face(images[0])
+    if probe is None:
+        parser.error(f"no face found at width {args.width}; try a larger --width")
+    api.face_executor.start()
+    for user_id, encoding in enumerate(synthetic_gallery(args.gallery, probe)):
+        api.face_service.gallery.upsert(user_id, encoding)
+
+    runs = []
+    settings = [(1, 0.0)] + [(b, w) for b in args.max_batch if b > 1 for w in args.max_wait_ms]
+    for concurrency in args.concurrency:
+        for max_batch, max_wait_ms in settings:
+            api.encode_batcher = MicroBatcher(
+                lambda requests: api.face_executor.run_chunked("analyze_face_batch", requests), max_batch, max_wait_ms / 1000
+            )
+            api.match_batcher = MicroBatcher(api._match_gallery_batch, max_batch, max_wait_ms / 1000)
+            result = asyncio.run(load(api, images, concurrency, args.duration))
+            result.update({
+                "concurrency": concurrency,
+                "max_batch": max_batch,
+                "max_wait_ms": max_wait_ms,
+                "mean_encode_batch": api.encode_batcher.stats()["mean_batch_size"] or 1.0,
+            })
+            runs.append(result)
+            print(f"c={concurrency:<3} batch={max_batch:<3} wait={max_wait_ms:<4} "
+                  f"{result['throughput_per_s']:8.1f} req/s  p50={result['p50_ms']:7.1f}  "
+                  f"p95={result['p95_ms']:7.1f}  p99={result['p99_ms']:7.1f} ms  "
+                  f"batch~{result['mean_encode_batch']}", file=sys.stderr)
+
+    api.face_executor.shutdown()
+    print(json.dumps({
+        "executor": args.executor,
+        "workers": args.workers,
+        "min_chunk": args.min_chunk,
+        "backend": api.face_service.backend,
+        "gallery": args.gallery,
+        "width": args.width,
+        "runs": runs,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
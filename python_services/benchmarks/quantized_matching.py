@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Accuracy, latency and memory of product-quantized coarse-to-fine matching.
+
+Enrolls a synthetic gallery twice, once scanned exactly in float32 and once
+behind a PQIndex whose shortlist is re-scored exactly, and probes both
+through FaceService.match_encoding with noisy copies of enrolled vectors
+(plus impostor probes with shuffled dimensions). Reports how often the two
+agree on user_id and authenticated for each kind of probe, the per-query
+latency of each, and the resident memory per million users of the float32
+matrix against the PQ codes.
+
+Usage: python benchmarks/quantized_matching.py [--size 100000] [--dimension 128] [--subspaces 8,16,32]
+                                               [--rerank-k 32,64] [--metric euclidean|cosine]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.ann_recall import synthetic_gallery  # noqa: E402
+from face_service import face_service as face_service_module  # noqa: E402
+from face_service.ann import PQIndex  # noqa: E402
+from face_service.face_service import FaceService  # noqa: E402
+from face_service.gallery import FaceGallery  # noqa: E402
+
+MILLION = 1_000_000
+
+
+def load(gallery, matrix):
+    for user_id, vector in enumerate(matrix):
+        gallery.upsert(user_id, vector)
+    return gallery
+
+
+def timed_matches(service, probes):
+    started = time.perf_counter()
+    results = [service.match_encoding(probe) for probe in probes]
+    return results, (time.perf_counter() - started) * 1000 / len(probes)
+
+
+def run(size, dimension, subspaces, rerank_ks, metric, queries, noise, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    matrix = synthetic_gallery(size, dimension, seed)
+    if metric == "cosine":
+        # OpenCV-style non-negative features, compared by cosine similarity
+        matrix = np.abs(matrix)
+    targets = rng.integers(0, size, queries)
+    genuine = matrix[targets] + rng.normal(scale=noise, size=(queries, dimension)).astype(np.float32)
+    impostors = rng.permutation(matrix[rng.integers(0, size, queries // 4)].T).T
+    probes = [probe.tolist() for probe in np.concatenate([genuine, impostors])]
+
+    # dlib-style 128-d vectors are matched by Euclidean distance only on the face_recognition backend
+    face_service_module.USE_FACE_RECOGNITION = metric == "euclidean"
+    if metric == "euclidean":
+        face_service_module.face_recognition = _distance_only_face_recognition()
+
+    exact = FaceService(gallery=load(FaceGallery(initial_capacity=size), matrix), tolerance=0.6)
+    expected, exact_ms = timed_matches(exact, probes)
+
+    float_bytes = matrix.itemsize * dimension
+    report = {
+        "size": size,
+        "dimension": dimension,
+        "metric": metric,
+        "queries": len(probes),
+        "exact_query_ms": round(exact_ms, 3),
+        "float32_mb_per_million": round(float_bytes * MILLION / 2**20, 1),
+        "pq": [],
+    }
+    for m in subspaces:
+        index = PQIndex(subspaces=m)
+        gallery = load(FaceGallery(initial_capacity=size, index=index, index_min_size=0), matrix)
+        started = time.perf_counter()
+        gallery.build_index("euclidean" if metric == "euclidean" else "cosine")
+        build_s = time.perf_counter() - started
+        for rerank_k in rerank_ks:
+            gallery.rerank_k = rerank_k
+            service = FaceService(gallery=gallery, tolerance=0.6)
+            results, query_ms = timed_matches(service, probes)
+            agree = [
+                (a.get("user_id"), a.get("authenticated")) == (b.get("user_id"), b.get("authenticated"))
+                for a, b in zip(results, expected)
+            ]
+            report["pq"].append({
+                "subspaces": m,
+                "rerank_k": rerank_k,
+                "genuine_agreement": round(float(np.mean(agree[:queries])), 4),
+                "impostor_agreement": round(float(np.mean(agree[queries:])), 4),
+                "query_ms": round(query_ms, 3),
+                "build_s": round(build_s, 2),
+                "codes_mb_per_million": round(m * MILLION / 2**20, 1),
+                "compression": round(float_bytes / m, 1),
+            })
+    return report
+
+
+def _distance_only_face_recognition():
+    import types
+
+    def face_distance(faces, face):
+        return np.linalg.norm(np.asarray(faces) - face, axis=1)
+
+    def compare_faces(faces, face, tolerance=0.6):
+        return list(face_distance(faces, face) <= tolerance)
+
+    return types.SimpleNamespace(face_distance=face_distance, compare_faces=compare_faces)
+
+
+def parse_ints(text):
+    return [int(value) for value in text.split(",") if value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=128)
+    parser.add_argument("--subspaces", type=parse_ints, default=[8, 16, 32])
+    parser.add_argument("--rerank-k", type=parse_ints, default=[32, 64])
+    parser.add_argument("--metric", choices=["euclidean", "cosine"], default="euclidean")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.02, help="per-dimension probe noise")
+    args = parser.parse_args()
+
+    report = run(args.size, args.dimension, args.subspaces, args.rerank_k, args.metric, args.queries, args.noise)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Reproducible latency/throughput benchmark of the face service hot paths.
+
+Drives FaceService.encode_face, compare_faces, match_encoding and
+authenticate_face directly, and the FastAPI endpoints in-process through a
+test client, on synthetic faces at several resolutions and resident
+galleries of 100 to 1M encodings. Each backend (face_recognition and the
+OpenCV fallback) runs separately; face_recognition is reported as skipped
+when it is not installed.
+
+Every scenario reports p50/p95/p99/mean latency in ms, throughput and the
+process's peak RSS so far, as JSON. --save writes the report as a baseline;
+--compare checks a run against one and exits 1 when any scenario's p50 or
+p95 grew (or throughput fell) by more than --tolerance.
+
+Usage: python benchmarks/suite.py [--backends opencv,face_recognition] [--quick]
+                                  [--save baseline.json | --compare baseline.json [--tolerance 0.15]]
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.synthetic_faces import scene  # noqa: E402
+from face_service import face_service as face_service_module  # noqa: E402
+from face_service.face_service import FaceService  # noqa: E402
+from face_service.gallery import FaceGallery  # noqa: E402
+
+BACKENDS = ("opencv", "face_recognition")
+# Metrics compared against a baseline; True when larger is worse
+COMPARED_METRICS = {"p50_ms": True, "p95_ms": True, "throughput_per_s": False}
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def measure(fn, iterations, warmup):
+    """Latency percentiles and throughput of iterations calls to fn()"""
+    for _ in range(warmup):
+        fn()
+    timings = np.empty(iterations)
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - t0
+    elapsed = time.perf_counter() - started
+    p50, p95, p99 = np.percentile(timings * 1000, [50, 95, 99])
+    return {
+        "iterations": iterations,
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "mean_ms": round(float(timings.mean() * 1000), 4),
+        "throughput_per_s": round(iterations / elapsed, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def jpeg(image, quality=90):
+    buf = io.BytesIO()
+    Image.fromarray(image).save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def face_image(width):
+    """JPEG bytes of a 4:3 scene with one face filling ~40% of the short side"""
+    height = width * 3 // 4
+    return jpeg(scene(width, height, int(height * 0.4)))
+
+
+def synthetic_gallery(size, probe, seed=0):
+    """size encodings shaped like probe; user 0 is a near-copy of probe"""
+    rng = np.random.default_rng(seed)
+    probe = np.asarray(probe, dtype=np.float32)
+    gallery = probe + rng.normal(scale=float(probe.std()) + 1e-3, size=(size, len(probe))).astype(np.float32)
+    if probe.min() >= 0:
+        # OpenCV fallback features are non-negative histograms
+        np.abs(gallery, out=gallery)
+    gallery[0] = probe + 0.001
+    return gallery
+
+
+def load_gallery(matrix):
+    gallery = FaceGallery(initial_capacity=len(matrix))
+    for user_id, encoding in enumerate(matrix):
+        gallery.upsert(user_id, encoding)
+    return gallery
+
+
+def use_backend(backend):
+    """Point FaceService at backend; False when it is not available"""
+    if backend == "face_recognition":
+        try:
+            import face_recognition
+        except ImportError:
+            return False
+        face_service_module.face_recognition = face_recognition
+    face_service_module.USE_FACE_RECOGNITION = backend == "face_recognition"
+    return True
+
+
+def bench_backend(backend, args):
+    results = {}
+    service = FaceService()
+    images = {width: face_image(width) for width in args.resolutions}
+    default_width = args.resolutions[len(args.resolutions) // 2]
+
+    probe = service.encode_face(images[default_width])
+    if probe is None:
+        raise RuntimeError(f"{backend}: no face found in the synthetic probe image")
+
+    def record(name, fn, iterations=None):
+        results[name] = measure(fn, iterations or args.iterations, args.warmup)
+        print(f"  {name}: p50 {results[name]['p50_ms']:.2f} ms", file=sys.stderr)
+
+    for width, image in images.items():
+        image_b64 = base64.b64encode(image).decode()
+        record(f"encode_face/base64/{width}px", lambda: service.encode_face(image_b64))
+        record(f"encode_face/raw/{width}px", lambda: service.encode_face(image))
+
+    other = (np.asarray(probe) * 0.9).tolist()
+    record(f"compare_faces/{len(probe)}d", lambda: service.compare_faces(probe, other), args.iterations * 10)
+
+    for size in args.gallery_sizes:
+        service.gallery = load_gallery(synthetic_gallery(size, probe))
+        record(f"match_encoding/gallery={size}", lambda: service.match_encoding(probe))
+        record(f"authenticate_face/gallery={size}", lambda: service.authenticate_face(images[default_width]))
+    service.gallery = FaceGallery()
+
+    if not args.skip_api:
+        bench_api(service, images[default_width], probe, default_width, args, record)
+    return results
+
+
+def bench_api(service, image, probe, width, args, record):
+    """The endpoints in-process, with the cache off and face work inline on the loop"""
+    from fastapi.testclient import TestClient
+
+    from face_service import api
+    from face_service.cache import EncodingCache
+    from face_service.executor import FaceExecutor
+
+    api.face_service = service
+    api.face_executor = FaceExecutor(service, mode="inline")
+    api.encoding_cache = EncodingCache(enabled=False)
+    service.gallery = load_gallery(synthetic_gallery(args.api_gallery_size, probe))
+    client = TestClient(api.app)
+    image_b64 = base64.b64encode(image).decode()
+
+    def post(path, **kwargs):
+        response = client.post(path, **kwargs)
+        response.raise_for_status()
+
+    record(f"api/encode/{width}px", lambda: post("/encode", json={"image_base64": image_b64}))
+    record(f"api/encode_raw/{width}px", lambda: post("/encode/raw", content=image))
+    record(f"api/authenticate_raw/{width}px/gallery={args.api_gallery_size}",
+           lambda: post("/authenticate/raw", content=image))
+    record(f"api/detect/{width}px", lambda: post("/detect", json={"image_base64": image_b64}))
+    service.gallery = FaceGallery()
+
+
+def compare(report, baseline, tolerance):
+    """Scenario/metric pairs that regressed by more than tolerance relative to baseline"""
+    regressions = []
+    for backend, scenarios in report["backends"].items():
+        for name, current in scenarios.items():
+            previous = baseline.get("backends", {}).get(backend, {}).get(name)
+            if not isinstance(previous, dict) or not isinstance(current, dict):
+                continue
+            for metric, larger_is_worse in COMPARED_METRICS.items():
+                if metric not in previous or metric not in current or not previous[metric]:
+                    continue
+                change = current[metric] / previous[metric] - 1
+                if (change if larger_is_worse else -change) > tolerance:
+                    regressions.append({
+                        "backend": backend,
+                        "scenario": name,
+                        "metric": metric,
+                        "baseline": previous[metric],
+                        "current": current[metric],
+                        "change": round(change, 4),
+                    })
+    return regressions
+
+
+def parse_ints(text):
+    return [int(value) for value in text.split(",") if value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--resolutions", type=parse_ints, default=[640, 1280, 2560])
+    parser.add_argument("--gallery-sizes", type=parse_ints, default=[100, 10000, 100000, 1000000])
+    parser.add_argument("--api-gallery-size", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--quick", action="store_true", help="small smoke run: 640/1280 px, galleries of 100/10000")
+    parser.add_argument("--save", help="write the report to this file as a baseline")
+    parser.add_argument("--compare", help="baseline report to check this run against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown before failing")
+    args = parser.parse_args()
+    if args.quick:
+        args.resolutions, args.gallery_sizes, args.iterations = [640, 1280], [100, 10000], min(args.iterations, 10)
+
+    cv2.setNumThreads(1)
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "settings": {
+            "resolutions": args.resolutions,
+            "gallery_sizes": args.gallery_sizes,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+        },
+        "backends": {},
+    }
+    for backend in args.backends.split(","):
+        if not use_backend(backend):
+            report["backends"][backend] = {"skipped": f"{backend} is not installed"}
+            continue
+        print(f"{backend}:", file=sys.stderr)
+        report["backends"][backend] = bench_backend(backend, args)
+    report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        exit_code = 1 if regressions else 0
+
+    print(json.dumps(report, indent=2))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Procedurally drawn frontal faces for benchmarks and tests.
+
+The drawings are crude but carry the light/dark structure (eye sockets, brows,
+mouth, hairline, shaded cheeks) that the Haar frontal-face cascade keys on, so
+they are detected reliably at any resolution without shipping real photos.
+"""
+
+import cv2
+import numpy as np
+
+
+def synthetic_face(size=400, brightness=0):
+    """RGB uint8 image of size x size containing one face filling ~60% of it"""
+    s = size / 400.0
+    c = size / 2
+    yy, xx = np.mgrid[0:size, 0:size]
+    img = np.full((size, size), 170, np.float32)
+
+    # Face oval, darker toward the edges
+    r = ((xx - c) / (105 * s)) ** 2 + ((yy - c - 10 * s) / (140 * s)) ** 2
+    img[r < 1] = (200 - 60 * r)[r < 1]
+    hair = (((xx - c) / (120 * s)) ** 2 + ((yy - c + 70 * s) / (110 * s)) ** 2 < 1) & (yy < c - 80 * s)
+    img[hair] = 40
+
+    def blob(cx, cy, ax, ay, value):
+        img[((xx - cx) / ax) ** 2 + ((yy - cy) / ay) ** 2 < 1] = value
+
+    for dx in (-42, 42):
+        blob(c + dx * s, c - 30 * s, 32 * s, 18 * s, 90)   # eye socket
+        blob(c + dx * s, c - 30 * s, 16 * s, 7 * s, 30)    # eye
+        blob(c + dx * s, c - 58 * s, 30 * s, 5 * s, 50)    # brow
+    blob(c, c + 25 * s, 14 * s, 8 * s, 110)                # nose shadow
+    blob(c, c + 70 * s, 38 * s, 9 * s, 70)                 # mouth
+
+    img = cv2.GaussianBlur(img, (0, 0), 3 * s) + brightness
+    gray = np.clip(img, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+
+
+def scene(width, height, face_size, positions=((0.5, 0.5),), background=170):
+    """RGB image of width x height with a face_size face centred at each relative position"""
+    img = np.full((height, width, 3), background, np.uint8)
+    face = synthetic_face(face_size)
+    for px, py in positions:
+        x = int(px * width - face_size / 2)
+        y = int(py * height - face_size / 2)
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(width, x + face_size), min(height, y + face_size)
+        img[y0:y1, x0:x1] = face[y0 - y:y1 - y, x0 - x:x1 - x]
+    return img
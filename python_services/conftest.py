@@ -0,0 +1 @@
+# Keeps python_services/ on sys.path so tests can import the face_service package
@@ -2,48 +2,84 @@
 """
 Sample script to encode face images and store them in the database.
 This script demonstrates how to use the face service to generate encodings.
+
+Pass a directory instead of a single image to stream every photo in it
+through /encode/batch and write one JSONL line of {file, encoding} per photo.
+Requests go through face_client.FaceServiceClient: pooled keep-alive
+connections, several batches in flight at once and retries with backoff.
 """
 
-import requests
-import base64
+import asyncio
 import json
 import sys
 from pathlib import Path
 
+from face_client import FaceServiceClient
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
+
 def encode_image_file(image_path, service_url="http://localhost:8001"):
     """
     Encode a face image file using the face service
     """
+    async def encode():
+        async with FaceServiceClient(service_url) as client:
+            return await client.encode(Path(image_path))
+    
     try:
-        # Read and encode image
-        with open(image_path, 'rb') as f:
-            image_data = base64.b64encode(f.read()).decode('utf-8')
-        
-        # Call the encoding service
-        response = requests.post(
-            f"{service_url}/encode",
-            json={"image_base64": f"data:image/jpeg;base64,{image_data}"},
-            headers={"Content-Type": "application/json"}
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("success"):
-                return result.get("encoding")
-            else:
-                print(f"Encoding failed: {result.get('error')}")
-                return None
-        else:
-            print(f"HTTP Error: {response.status_code}")
-            return None
-            
+        result = asyncio.run(encode())
     except Exception as e:
         print(f"Error encoding image: {e}")
         return None
+    
+    if not result.get("success"):
+        print(f"Encoding failed: {result.get('error')}")
+        return None
+    return result.get("encoding")
+
+def encode_directory(directory, output_file="encodings.jsonl", batch_size=32, service_url="http://localhost:8001",
+                     max_in_flight=4):
+    """
+    Stream every image in directory through /encode/batch, max_in_flight batches
+    at a time, writing one {file, encoding, error} JSON line per image in directory order
+    Returns (encoded, failed) counts
+    """
+    image_paths = sorted(
+        path for path in Path(directory).iterdir()
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+    )
+    return asyncio.run(_encode_paths(image_paths, output_file, batch_size, service_url, max_in_flight))
+
+async def _encode_paths(image_paths, output_file, batch_size, service_url, max_in_flight):
+    encoded = failed = 0
+    # Only this many images are read into memory at once
+    window = batch_size * max_in_flight
+    
+    async with FaceServiceClient(service_url, max_in_flight=max_in_flight, batch_size=batch_size) as client:
+        with open(output_file, 'w') as out:
+            for start in range(0, len(image_paths), window):
+                chunk = image_paths[start:start + window]
+                results = await asyncio.gather(*(client.encode(path) for path in chunk), return_exceptions=True)
+                
+                for path, result in zip(chunk, results):
+                    if isinstance(result, Exception):
+                        result = {"success": False, "encoding": None, "error": str(result)}
+                    record = {"file": str(path), "encoding": result.get("encoding")}
+                    if not result.get("success"):
+                        record["error"] = result.get("error")
+                        failed += 1
+                    else:
+                        encoded += 1
+                    out.write(json.dumps(record) + "\n")
+                out.flush()
+                print(f"[{start + len(chunk)}/{len(image_paths)}] encoded={encoded} failed={failed}")
+    
+    return encoded, failed
 
 def main():
-    if len(sys.argv) != 2:
+    if len(sys.argv) not in (2, 3):
         print("Usage: python encode_sample.py <image_path>")
+        print("       python encode_sample.py <image_directory> [output.jsonl]")
         print("Example: python encode_sample.py /path/to/face_photo.jpg")
         sys.exit(1)
     
@@ -53,6 +89,13 @@ def main():
         print(f"Image file not found: {image_path}")
         sys.exit(1)
     
+    if Path(image_path).is_dir():
+        output_file = sys.argv[2] if len(sys.argv) == 3 else "encodings.jsonl"
+        print(f"Encoding faces in: {image_path}")
+        encoded, failed = encode_directory(image_path, output_file)
+        print(f"Encoded {encoded} faces ({failed} failed); results saved to: {output_file}")
+        sys.exit(0 if encoded else 1)
+    
     print(f"Encoding face from: {image_path}")
     encoding = encode_image_file(image_path)
     
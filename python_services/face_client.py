@@ -0,0 +1,166 @@
+"""
+Async client for the face service.
+
+Keeps one pool of kept-alive connections, bounds how many requests are in
+flight, retries transient failures (connection errors, 429/502/503/504,
+honouring Retry-After) with exponential backoff, and coalesces concurrent
+encode() calls into /encode/batch requests. Use it as a library:
+
+    async with FaceServiceClient("http://localhost:8001") as client:
+        results = await client.encode_many(paths)
+
+or through encode_sample.py for bulk enrollment.
+"""
+
+import asyncio
+import base64
+import random
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import httpx
+
+ImageInput = Union[bytes, str, Path]
+
+# Worth retrying: the request never reached a worker, or the service asked us to come back
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class FaceServiceError(Exception):
+    """Raised when a request still fails after every retry"""
+
+
+class FaceServiceClient:
+    """
+    Pooled, concurrency-limited client; encode() calls made within batch_delay
+    of each other (up to batch_size) share one /encode/batch request.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:8001", max_in_flight: int = 8,
+                 batch_size: int = 32, batch_delay: float = 0.01, retries: int = 3,
+                 backoff: float = 0.2, timeout: float = 30.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.retries = retries
+        self.backoff = backoff
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight),
+            transport=transport,
+        )
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._batches: set = set()
+
+    async def __aenter__(self) -> "FaceServiceClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Send anything still queued, wait for it, then close the connection pool"""
+        self._flush()
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+        await self._http.aclose()
+
+    async def encode(self, image: ImageInput) -> Dict[str, Any]:
+        """
+        {success, encoding, error} for one image (bytes, base64 string or path)
+        Queued and sent with other encode() calls as a single /encode/batch request
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((_image_bytes(image), future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(self.batch_delay, self._flush)
+        return await future
+
+    async def encode_many(self, images: List[ImageInput]) -> List[Dict[str, Any]]:
+        """encode() every image concurrently; results in input order"""
+        return list(await asyncio.gather(*(self.encode(image) for image in images)))
+
+    async def authenticate(self, image: ImageInput,
+                           known_encodings: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """/authenticate/raw against the resident gallery, or against known_encodings"""
+        if known_encodings is None:
+            response = await self.request("POST", "/authenticate/raw", content=_image_bytes(image),
+                                          headers={"Content-Type": "application/octet-stream"})
+        else:
+            image_base64 = base64.b64encode(_image_bytes(image)).decode("ascii")
+            response = await self.request("POST", "/authenticate",
+                                          json={"image_base64": image_base64, "known_encodings": known_encodings})
+        return response.json()
+
+    async def ready(self) -> bool:
+        """True once the service reports its models are loaded and warm"""
+        try:
+            response = await self._http.get("/health/ready")
+        except httpx.TransportError:
+            return False
+        return response.status_code == 200
+
+    async def request(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """One request under the in-flight limit, retried with backoff; raises FaceServiceError"""
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt * (0.5 + random.random())
+            try:
+                async with self._in_flight:
+                    response = await self._http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise FaceServiceError(f"{method} {path} failed: {e}") from e
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    if response.is_error:
+                        raise FaceServiceError(f"{method} {path} returned {response.status_code}: {response.text}")
+                    return response
+                if attempt == self.retries:
+                    raise FaceServiceError(f"{method} {path} returned {response.status_code} after {attempt + 1} attempts")
+                retry_after = response.headers.get("retry-after", "")
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+    def _flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            task = asyncio.get_running_loop().create_task(self._send_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _send_batch(self, batch: List[Tuple[bytes, asyncio.Future]]) -> None:
+        files = [("images", (f"image{i}", image, "application/octet-stream")) for i, (image, _) in enumerate(batch)]
+        try:
+            response = await self.request("POST", "/encode/batch", files=files)
+            results = response.json()["results"]
+            if len(results) != len(batch):
+                raise FaceServiceError(f"/encode/batch returned {len(results)} results for {len(batch)} images")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result({key: result.get(key) for key in ("success", "encoding", "error")})
+
+
+def _image_bytes(image: ImageInput) -> bytes:
+    """Raw bytes from bytes, a path, or a base64 string (optionally a data URI)"""
+    if isinstance(image, bytes):
+        return image
+    if isinstance(image, Path):
+        return image.read_bytes()
+    if image.startswith("data:"):
+        image = image.split(",", 1)[1]
+    return base64.b64decode(image)
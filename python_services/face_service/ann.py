@@ -0,0 +1,322 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+ANN_METRICS = ("euclidean", "cosine")
+
+
+def prepare_vectors(matrix: np.ndarray, metric: Optional[str]) -> np.ndarray:
+    """float32 rows, unit-normalised for cosine so it can be searched as Euclidean distance"""
+    vectors = np.asarray(matrix, dtype=np.float32)
+    if metric == "cosine":
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1.0)
+    return vectors
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """Nearest centroid for every row, in chunks to bound memory"""
+    centroid_sq = np.einsum("ij,ij->i", centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        block = vectors[start:start + chunk]
+        scores = centroid_sq - 2.0 * (block @ centroids.T)
+        assignments[start:start + chunk] = np.argmin(scores, axis=1)
+    return assignments
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int, max_points: int, rng: np.random.Generator) -> np.ndarray:
+    """Plain Lloyd's k-means on a random sample of at most max_points vectors; returns the centroids"""
+    if len(vectors) > max_points:
+        vectors = vectors[rng.choice(len(vectors), max_points, replace=False)]
+    k = max(1, min(k, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = nearest_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        occupied = counts > 0
+        centroids[occupied] = sums[occupied] / counts[occupied, None]
+        # Re-seed empty clusters from random points so no centroid stays unused
+        empty = np.flatnonzero(~occupied)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file approximate nearest-neighbour index in plain NumPy.
+
+    Vectors are clustered around nlist k-means centroids; a search only scans
+    the nprobe lists whose centroids are closest to the probe, so nprobe is the
+    recall/latency knob (nprobe == nlist is an exact scan). Cosine search runs
+    as Euclidean search over unit-normalised vectors, which ranks identically.
+    Vectors can be added and removed after training without a rebuild.
+    """
+
+    def __init__(self, nlist: int = 256, nprobe: int = 8, train_iterations: int = 10,
+                 max_train_points: int = 65536, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.max_train_points = max_train_points
+        self.seed = seed
+        self.metric: Optional[str] = None
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        self._list_ids: List[List[Any]] = []
+        self._list_sizes: List[int] = []
+        self._locations: Dict[Any, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def fresh(self) -> "IVFFlatIndex":
+        """An untrained index with the same settings, for training off to the side"""
+        return IVFFlatIndex(self.nlist, self.nprobe, self.train_iterations, self.max_train_points, self.seed)
+
+    def reset(self) -> None:
+        """Drop centroids and contents; the next build retrains from scratch"""
+        self.metric = None
+        self.centroids = None
+        self._lists = []
+        self._list_ids = []
+        self._list_sizes = []
+        self._locations = {}
+
+    def build(self, ids: List[Any], matrix: np.ndarray, metric: str) -> None:
+        """Train centroids on matrix and index every row under the matching id"""
+        if metric not in ANN_METRICS:
+            raise ValueError(f"Unknown metric {metric!r}; expected one of {ANN_METRICS}")
+        self.metric = metric
+        vectors = self._prepare(matrix)
+        self._train(vectors)
+
+        dimension = vectors.shape[1]
+        self._lists = [np.zeros((0, dimension), dtype=np.float32) for _ in range(len(self.centroids))]
+        self._list_ids = [[] for _ in range(len(self.centroids))]
+        self._list_sizes = [0] * len(self.centroids)
+        self._locations = {}
+
+        assignments = self._assign(vectors)
+        order = np.argsort(assignments, kind="stable")
+        boundaries = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        for list_no in range(len(self.centroids)):
+            rows = order[boundaries[list_no]:boundaries[list_no + 1]]
+            self._lists[list_no] = vectors[rows].copy()
+            self._list_ids[list_no] = [ids[row] for row in rows]
+            self._list_sizes[list_no] = len(rows)
+            for position, row in enumerate(rows):
+                self._locations[ids[row]] = (list_no, position)
+
+    def add(self, item_id: Any, vector: np.ndarray) -> None:
+        """Insert or replace one vector; the index must be built first"""
+        if not self.is_trained:
+            raise RuntimeError("Index must be built before adding vectors")
+        self.remove(item_id)
+        vector = self._prepare(np.asarray(vector, dtype=np.float32).reshape(1, -1))
+        list_no = int(self._assign(vector)[0])
+
+        size = self._list_sizes[list_no]
+        if size == self._lists[list_no].shape[0]:
+            grown = np.zeros((max(8, size * 2), vector.shape[1]), dtype=np.float32)
+            grown[:size] = self._lists[list_no][:size]
+            self._lists[list_no] = grown
+        self._lists[list_no][size] = vector[0]
+        self._list_ids[list_no].append(item_id)
+        self._list_sizes[list_no] = size + 1
+        self._locations[item_id] = (list_no, size)
+
+    def remove(self, item_id: Any) -> bool:
+        location = self._locations.pop(item_id, None)
+        if location is None:
+            return False
+        list_no, position = location
+        last = self._list_sizes[list_no] - 1
+        if position != last:
+            moved_id = self._list_ids[list_no][last]
+            self._lists[list_no][position] = self._lists[list_no][last]
+            self._list_ids[list_no][position] = moved_id
+            self._locations[moved_id] = (list_no, position)
+        self._list_ids[list_no].pop()
+        self._list_sizes[list_no] = last
+        return True
+
+    def search(self, probe: np.ndarray, k: int, nprobe: Optional[int] = None) -> List[Any]:
+        """Ids of the (approximately) k nearest vectors to probe, nearest first"""
+        if not self.is_trained or not self._locations:
+            return []
+        probe = self._prepare(np.asarray(probe, dtype=np.float32).reshape(1, -1))[0]
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+
+        centroid_distances = np.einsum("ij,ij->i", self.centroids - probe, self.centroids - probe)
+        probed = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+
+        candidate_ids: List[Any] = []
+        candidate_distances = []
+        for list_no in probed:
+            size = self._list_sizes[list_no]
+            if size == 0:
+                continue
+            vectors = self._lists[list_no][:size]
+            diff = vectors - probe
+            candidate_distances.append(np.einsum("ij,ij->i", diff, diff))
+            candidate_ids.extend(self._list_ids[list_no])
+        if not candidate_ids:
+            return []
+
+        distances = np.concatenate(candidate_distances)
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [candidate_ids[i] for i in top]
+
+    def _prepare(self, matrix: np.ndarray) -> np.ndarray:
+        return prepare_vectors(matrix, self.metric)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return nearest_centroids(vectors, self.centroids)
+
+    def _train(self, vectors: np.ndarray) -> None:
+        self.centroids = kmeans(vectors, self.nlist, self.train_iterations, self.max_train_points,
+                                np.random.default_rng(self.seed))
+
+
+class PQIndex:
+    """
+    Product-quantized flat index for a fast first-pass scan of large galleries.
+
+    Each vector is split into `subspaces` slices and every slice is stored as
+    the 1-byte id of its nearest k-means centroid, so a 128-d float32 gallery
+    shrinks from 512 to 16 bytes per user with the default 16 subspaces. A
+    search builds one distance table per slice and sums table lookups over
+    the codes (asymmetric distance), which reads 32x less memory than the
+    float scan; the gallery then re-scores the shortlist exactly, so reported
+    distances and thresholds are unchanged. Codes are stored subspace-major
+    so each lookup pass streams one contiguous row. Cosine search runs over
+    unit-normalised vectors, like IVFFlatIndex, and vectors can be added and
+    removed after training.
+    """
+
+    def __init__(self, subspaces: int = 16, train_iterations: int = 10, max_train_points: int = 16384,
+                 seed: int = 0):
+        self.subspaces = subspaces
+        self.train_iterations = train_iterations
+        self.max_train_points = max_train_points
+        self.seed = seed
+        self.metric: Optional[str] = None
+        self.codebooks: Optional[List[np.ndarray]] = None
+        self._bounds: List[Tuple[int, int]] = []
+        self._codes = np.zeros((0, 0), dtype=np.uint8)
+        self._ids: List[Any] = []
+        self._locations: Dict[Any, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by codes and codebooks (excluding the id list)"""
+        codebooks = sum(codebook.nbytes for codebook in self.codebooks or [])
+        return self.subspaces * len(self._ids) + codebooks
+
+    def fresh(self) -> "PQIndex":
+        """An untrained index with the same settings, for training off to the side"""
+        return PQIndex(self.subspaces, self.train_iterations, self.max_train_points, self.seed)
+
+    def reset(self) -> None:
+        """Drop codebooks and contents; the next build retrains from scratch"""
+        self.metric = None
+        self.codebooks = None
+        self._bounds = []
+        self._codes = np.zeros((0, 0), dtype=np.uint8)
+        self._ids = []
+        self._locations = {}
+
+    def build(self, ids: List[Any], matrix: np.ndarray, metric: str) -> None:
+        """Train one 256-centroid codebook per subspace and encode every row"""
+        if metric not in ANN_METRICS:
+            raise ValueError(f"Unknown metric {metric!r}; expected one of {ANN_METRICS}")
+        self.metric = metric
+        vectors = self._prepare(matrix)
+        dimension = vectors.shape[1]
+        subspaces = max(1, min(self.subspaces, dimension))
+        edges = np.linspace(0, dimension, subspaces + 1).astype(int)
+        self._bounds = list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+        rng = np.random.default_rng(self.seed)
+        self.codebooks = [
+            kmeans(np.ascontiguousarray(vectors[:, start:end]), 256, self.train_iterations,
+                   self.max_train_points, rng)
+            for start, end in self._bounds
+        ]
+        self._codes = self._encode(vectors)
+        self._ids = list(ids)
+        self._locations = {item_id: column for column, item_id in enumerate(self._ids)}
+
+    def add(self, item_id: Any, vector: np.ndarray) -> None:
+        """Insert or replace one vector; the index must be built first"""
+        if not self.is_trained:
+            raise RuntimeError("Index must be built before adding vectors")
+        self.remove(item_id)
+        code = self._encode(self._prepare(np.asarray(vector, dtype=np.float32).reshape(1, -1)))
+        size = len(self._ids)
+        if size == self._codes.shape[1]:
+            grown = np.zeros((len(self._bounds), max(8, size * 2)), dtype=np.uint8)
+            grown[:, :size] = self._codes[:, :size]
+            self._codes = grown
+        self._codes[:, size] = code[:, 0]
+        self._ids.append(item_id)
+        self._locations[item_id] = size
+
+    def remove(self, item_id: Any) -> bool:
+        column = self._locations.pop(item_id, None)
+        if column is None:
+            return False
+        last = len(self._ids) - 1
+        if column != last:
+            moved_id = self._ids[last]
+            self._codes[:, column] = self._codes[:, last]
+            self._ids[column] = moved_id
+            self._locations[moved_id] = column
+        self._ids.pop()
+        return True
+
+    def search(self, probe: np.ndarray, k: int) -> List[Any]:
+        """Ids of the k vectors with the smallest quantized distance to probe, nearest first"""
+        if not self.is_trained or not self._ids:
+            return []
+        probe = self._prepare(np.asarray(probe, dtype=np.float32).reshape(1, -1))[0]
+        size = len(self._ids)
+
+        distances = np.zeros(size, dtype=np.float32)
+        for (start, end), codebook, codes in zip(self._bounds, self.codebooks, self._codes):
+            diff = codebook - probe[start:end]
+            table = np.einsum("ij,ij->i", diff, diff)
+            distances += np.take(table, codes[:size])
+
+        k = min(k, size)
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [self._ids[i] for i in top]
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """(subspaces, N) uint8 codes for prepared vectors"""
+        codes = np.empty((len(self._bounds), len(vectors)), dtype=np.uint8)
+        for m, ((start, end), codebook) in enumerate(zip(self._bounds, self.codebooks)):
+            codes[m] = nearest_centroids(np.ascontiguousarray(vectors[:, start:end]), codebook)
+        return codes
+
+    def _prepare(self, matrix: np.ndarray) -> np.ndarray:
+        return prepare_vectors(matrix, self.metric)
@@ -1,34 +1,187 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import base64, io, os
-from typing import Optional, List, Dict, Any
-from PIL import Image
-import numpy as np
-import cv2
+from contextlib import asynccontextmanager
+import asyncio
+import base64
+import json
+import secrets
+import time
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from starlette.routing import Match
+import os
+from typing import Optional, List, Dict, Any, AsyncIterator, Literal, Tuple, Union
+from .ann import IVFFlatIndex, PQIndex
+from .batching import MicroBatcher
+from .cache import EncodingCache
+from .codec import pack_encoding
+from .crops import CropOptions, crop_shape
+from .detection import DetectionPolicy
+from .executor import ExecutorSaturated, FaceExecutor
 from .face_service import FaceService
+from .gallery import FaceGallery
+from .gallery_store import GalleryStore
+from .log import get_logger
+from .metrics import REGISTRY, current_endpoint, traced_call
+from .models import MODELS
+from .shards import GalleryShards
+from .tracking import FaceTracker
 
-app = FastAPI(title="Face Service Template")
+logger = get_logger(__name__)
+
+def _gallery_from_env() -> FaceGallery:
+    """Resident gallery, with an IVF (FACE_ANN_INDEX=ivf) or product-quantized (=pq) first-pass index"""
+    kind = os.environ.get("FACE_ANN_INDEX", "none")
+    if kind == "ivf":
+        index = IVFFlatIndex(
+            nlist=int(os.environ.get("FACE_ANN_NLIST", "1024")),
+            nprobe=int(os.environ.get("FACE_ANN_NPROBE", "16")),
+        )
+    elif kind == "pq":
+        index = PQIndex(subspaces=int(os.environ.get("FACE_PQ_SUBSPACES", "16")))
+    else:
+        return FaceGallery()
+    return FaceGallery(
+        index=index,
+        index_min_size=int(os.environ.get("FACE_ANN_MIN_SIZE", "10000")),
+        rerank_k=int(os.environ.get("FACE_ANN_RERANK_K", "32")),
+    )
 
 # Initialize services
-face_service = FaceService()
+face_service = FaceService(gallery=_gallery_from_env())
+
+# On-disk, memory-mapped home of the gallery shared by every worker (FACE_GALLERY_DIR)
+gallery_store = GalleryStore.from_env()
+
+# Named subsets of the gallery (e.g. one per event) that /authenticate can be scoped to
+gallery_shards = GalleryShards.from_env(face_service.gallery)
+
+# Detection and encoding run here, off the event loop (FACE_EXECUTOR=process|thread|inline)
+face_executor = FaceExecutor.from_env(face_service)
+
+# Recent detection/encoding results keyed by image content (FACE_CACHE_ENABLED=false turns it off)
+encoding_cache = EncodingCache.from_env()
+
+# Concurrent requests are encoded, and matched against the gallery, in micro-batches
+# of up to FACE_BATCH_MAX_SIZE gathered for at most FACE_BATCH_MAX_WAIT_MS (1 = off);
+# each encode batch is split across the workers
+encode_batcher = MicroBatcher.from_env(lambda requests: face_executor.run_chunked("analyze_face_batch", requests), "encode")
+match_batcher = MicroBatcher.from_env(lambda probes: _match_gallery_batch(probes), "match")
+
+# Upper bound on images accepted by a single /encode/batch call
+MAX_ENCODE_BATCH = int(os.environ.get("FACE_ENCODE_BATCH_MAX", "256"))
+
+# /authenticate/stream runs detection on every Nth frame and tracks faces in between
+STREAM_DETECT_EVERY = int(os.environ.get("FACE_STREAM_DETECT_EVERY", "5"))
+
+# Reported by /health/ready; "ready" flips once every worker has loaded its models and warmed up
+startup: Dict[str, Any] = {"status": "starting", "warmup_s": None, "error": None}
+
+async def _warm_up() -> None:
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(face_executor.start)
+    except Exception as e:
+        logger.error("Face service warm-up failed: %s", e)
+        startup.update(status="failed", error=str(e))
+        return
+    if face_service.gallery.uses_index():
+        # Train the ANN index now rather than from the first login; until then matching scans exactly
+        try:
+            await asyncio.to_thread(face_service.build_gallery_index)
+        except Exception as e:
+            logger.error("Gallery index training failed: %s", e)
+    startup.update(status="ready", warmup_s=round(time.perf_counter() - started, 3))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if gallery_store is not None:
+        gallery_store.open(face_service.gallery)
+    # Warm up in the background so liveness answers at once; readiness waits for it
+    warm_up = asyncio.create_task(_warm_up())
+    yield
+    await warm_up
+    if _compaction is not None and not _compaction.done():
+        await _compaction
+    face_executor.shutdown()
+
+app = FastAPI(title="Face Service Template", lifespan=lifespan)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Label face work with the route template and time the whole request"""
+    endpoint = "unmatched"
+    for route in app.router.routes:
+        if route.matches(request.scope)[0] == Match.FULL:
+            endpoint = route.path
+            break
+    token = current_endpoint.set(endpoint)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REGISTRY.observe_request(endpoint, status, time.perf_counter() - start)
+        current_endpoint.reset(token)
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+# Face detector backends; see detection.DETECTORS
+DetectorName = Literal["haar", "hog", "yunet"]
+
+class DetectionOptions(BaseModel):
+    # Per-request detection overrides; omitted fields use the service defaults
+    detector: Optional[DetectorName] = None
+    max_detect_side: Optional[int] = Field(None, ge=0)  # 0 detects at full resolution
+    scale_factor: Optional[float] = Field(None, gt=1.0)
+    min_face_size: Optional[int] = Field(None, gt=0)
 
-# Initialize Haar cascade once
-HAAR_PATH = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
-CASCADE = cv2.CascadeClassifier(HAAR_PATH)
-if CASCADE.empty():
-    raise RuntimeError(f"Failed to load Haar cascade at {HAAR_PATH}")
+# "json" returns a float list; float32/float16 return the packed, base64-encoded format
+EncodingFormat = Literal["json", "float32", "float16"]
 
-class EncodeRequest(BaseModel):
+# A float list, or a base64 packed encoding as produced with encoding_format=float32/float16
+EncodingValue = Union[List[float], str]
+
+class EncodeRequest(DetectionOptions):
     image_base64: str
+    encoding_format: EncodingFormat = "json"
 
 class EncodeResponse(BaseModel):
+    success: bool
+    encoding: Optional[List[float]] = None
+    encoding_packed: Optional[str] = None
+    error: Optional[str] = None
+
+class EncodeBatchRequest(BaseModel):
+    images_base64: List[str]
+
+class EncodeBatchItem(BaseModel):
+    index: int
+    filename: Optional[str] = None
     success: bool
     encoding: Optional[List[float]] = None
     error: Optional[str] = None
 
-class AuthenticateRequest(BaseModel):
+class EncodeBatchResponse(BaseModel):
+    success: bool
+    count: int
+    encoded: int
+    results: List[EncodeBatchItem]
+
+class MatchScope(BaseModel):
+    # Match only a gallery shard's members and/or these user ids; fallback retries everyone on a miss
+    shard: Optional[str] = None
+    candidates: Optional[List[int]] = None
+    fallback: bool = False
+
+class AuthenticateRequest(DetectionOptions, MatchScope):
     image_base64: str
-    known_encodings: List[Dict[str, Any]]  # List of {user_id: int, encoding: List[float]}
+    # List of {user_id: int, encoding: List[float] or packed base64}; omit to match against the resident gallery
+    known_encodings: Optional[List[Dict[str, Any]]] = None
 
 class AuthenticateResponse(BaseModel):
     success: bool
@@ -37,8 +190,49 @@ class AuthenticateResponse(BaseModel):
     confidence: Optional[float] = None
     distance: Optional[float] = None
     error: Optional[str] = None
+    # For scoped requests: "shard" or "candidates", or "all" when the fallback produced the result
+    scope: Optional[str] = None
+
+class GalleryEnrollRequest(BaseModel):
+    user_id: int
+    encoding: Optional[EncodingValue] = None
+    image_base64: Optional[str] = None
+
+class GalleryUpdateRequest(BaseModel):
+    encoding: Optional[EncodingValue] = None
+    image_base64: Optional[str] = None
+
+class GalleryResponse(BaseModel):
+    success: bool
+    user_id: Optional[int] = None
+    count: int
+    dimension: Optional[int] = None
+    error: Optional[str] = None
+
+# Crop encodings; raw is size x size x 3 RGB bytes and needs crop_size
+CropFormat = Literal["jpeg", "png", "webp", "raw"]
+
+class CropParams(BaseModel):
+    crop_format: CropFormat = "jpeg"
+    crop_quality: int = Field(90, ge=1, le=100)
+    crop_size: Optional[int] = Field(None, ge=16, le=1024)  # square size x size crops around each box instead of bare boxes
+    crop_margin: float = Field(0.0, ge=0.0, le=1.0)  # extra context around square crops, per side
+
+class ShardRequest(BaseModel):
+    user_ids: List[int]
 
-class DetectRequest(BaseModel):
+class ShardInfo(BaseModel):
+    name: str
+    members: int
+    loaded: bool
+    enrolled: Optional[int] = None
+    bytes: int = 0
+
+class ShardResponse(BaseModel):
+    success: bool
+    shards: List[ShardInfo]
+
+class DetectRequest(DetectionOptions, CropParams):
     image_base64: str
     return_crops: bool = False
 
@@ -55,30 +249,379 @@ class DetectResponse(BaseModel):
     crops: Optional[List[str]] = None
     error: Optional[str] = None
 
+class GroupAuthenticateRequest(DetectionOptions):
+    image_base64: str
+    # Same shape as AuthenticateRequest.known_encodings; omit to match against the resident gallery
+    known_encodings: Optional[List[Dict[str, Any]]] = None
+
+class GroupFace(BaseModel):
+    box: FaceBox
+    authenticated: bool
+    user_id: Optional[int] = None
+    confidence: Optional[float] = None
+    distance: Optional[float] = None
+
+class GroupAuthenticateResponse(BaseModel):
+    success: bool
+    count: int = 0
+    authenticated: int = 0
+    faces: List[GroupFace] = []
+    error: Optional[str] = None
+
+def detection_options(
+    detector: Optional[DetectorName] = Query(None),
+    max_detect_side: Optional[int] = Query(None, ge=0),
+    scale_factor: Optional[float] = Query(None, gt=1.0),
+    min_face_size: Optional[int] = Query(None, gt=0),
+) -> DetectionOptions:
+    """Detection overrides taken from the query string (raw-bytes endpoints)"""
+    return DetectionOptions(detector=detector, max_detect_side=max_detect_side, scale_factor=scale_factor,
+                            min_face_size=min_face_size)
+
+def crop_params(
+    crop_format: CropFormat = Query("jpeg"),
+    crop_quality: int = Query(90, ge=1, le=100),
+    crop_size: Optional[int] = Query(None, ge=16, le=1024),
+    crop_margin: float = Query(0.0, ge=0.0, le=1.0),
+) -> CropParams:
+    """Crop options taken from the query string (/detect/raw)"""
+    return CropParams(crop_format=crop_format, crop_quality=crop_quality, crop_size=crop_size, crop_margin=crop_margin)
+
+def _crop_options(params: CropParams) -> CropOptions:
+    """CropOptions of a request; raises ValueError for combinations it can't produce"""
+    return CropOptions(format=params.crop_format, quality=params.crop_quality, size=params.crop_size,
+                       margin=params.crop_margin)
+
+def _detection_policy(base: DetectionPolicy, options: DetectionOptions) -> DetectionPolicy:
+    """base with the request's overrides applied; raises ValueError for a detector this service can't run"""
+    overrides = {
+        "detector": options.detector,
+        "max_side": options.max_detect_side,
+        "scale_factor": options.scale_factor,
+        "min_face_size": options.min_face_size,
+    }
+    policy = base.with_overrides(**overrides)
+    if not MODELS.detector_available(policy.detector):
+        raise ValueError(f"Detector {policy.detector!r} is not available on this service")
+    return policy
+
+def match_scope(
+    shard: Optional[str] = Query(None),
+    candidates: Optional[List[int]] = Query(None),
+    fallback: bool = Query(False),
+) -> MatchScope:
+    """Match scope taken from the query string (raw-bytes endpoints); repeat candidates= per user id"""
+    return MatchScope(shard=shard, candidates=candidates, fallback=fallback)
+
+def _traced_match(method: str, *args: Any) -> Any:
+    """face_service.<method>(*args) against a refreshed gallery, with its match stage recorded"""
+    _refresh_gallery()
+    result, stages = traced_call(getattr(face_service, method), *args)
+    REGISTRY.observe_stages(stages, face_service.backend)
+    return result
+
+async def _match_encoding(probe_encoding: List[float], known_encodings: Optional[List[Dict[str, Any]]] = None,
+                          gallery: Optional[FaceGallery] = None) -> Dict[str, Any]:
+    """face_service.match_encoding in a thread, so scanning a large gallery never blocks the event loop"""
+    return await asyncio.to_thread(_traced_match, "match_encoding", probe_encoding, known_encodings, gallery)
+
+async def _match_probe(probe_encoding: List[float],
+                       known_encodings: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """_match_encoding, batched with concurrent gallery matches when micro-batching is on"""
+    if known_encodings is None and match_batcher.enabled:
+        return await match_batcher.submit(probe_encoding)
+    return await _match_encoding(probe_encoding, known_encodings)
+
+def _shard_or_404(shard: str) -> List[int]:
+    try:
+        members = gallery_shards.members(shard)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if members is None:
+        raise HTTPException(status_code=404, detail=f"Unknown gallery shard {shard!r}")
+    return members
+
+def _scoped_gallery(scope: MatchScope) -> FaceGallery:
+    """The refreshed gallery narrowed to scope's shard slice and candidates (may cut a copy, so not on the loop)"""
+    _refresh_gallery()
+    gallery = face_service.gallery
+    if scope.shard is not None:
+        _shard_or_404(scope.shard)
+        gallery = gallery_shards.gallery_for(scope.shard)
+    if scope.candidates is not None:
+        gallery = gallery.subset(scope.candidates)
+    return gallery
+
+async def _match_scoped(probe_encoding: List[float], known_encodings: Optional[List[Dict[str, Any]]],
+                        scope: MatchScope) -> Dict[str, Any]:
+    """
+    _match_probe limited to scope: the shard's contiguous gallery slice (or the known_encodings of its
+    members), narrowed further to candidates; with fallback, a miss is retried against everyone
+    """
+    if scope.shard is None and scope.candidates is None:
+        return await _match_probe(probe_encoding, known_encodings)
+
+    if known_encodings is None:
+        gallery = await asyncio.to_thread(_scoped_gallery, scope)
+        result = await _match_encoding(probe_encoding, None, gallery)
+    else:
+        allowed = set(_shard_or_404(scope.shard)) if scope.shard is not None else None
+        if scope.candidates is not None:
+            allowed = set(scope.candidates) if allowed is None else allowed & set(scope.candidates)
+        result = await _match_encoding(
+            probe_encoding, [known for known in known_encodings if known.get("user_id") in allowed]
+        )
+    result["scope"] = "shard" if scope.shard is not None else "candidates"
+
+    if scope.fallback and not (result["success"] and result.get("authenticated")):
+        result = {**await _match_probe(probe_encoding, known_encodings), "scope": "all"}
+    return result
+
+async def _match_gallery_batch(probe_encodings: List[List[float]]) -> List[Dict[str, Any]]:
+    return await asyncio.to_thread(_traced_match, "match_encodings", probe_encodings)
+
+async def _analyze_face(image_data: Any, decode_max_side: Optional[int], policy: DetectionPolicy,
+                        boxes: Optional[List[Any]] = None) -> Dict[str, Any]:
+    """FaceService.analyze_face on a worker, alone or in a micro-batch with concurrent requests"""
+    if encode_batcher.enabled:
+        return await encode_batcher.submit((image_data, decode_max_side, policy, boxes))
+    return await face_executor.run("analyze_face", image_data, decode_max_side, policy, boxes)
+
+async def _encode_cached(image_data: Any, decode_max_side: Optional[int] = None,
+                         policy: Optional[DetectionPolicy] = None) -> Optional[List[float]]:
+    """
+    Encode through the content cache
+    A cached encoding skips the worker entirely; cached face boxes from an
+    earlier request with the same detector settings skip detection.
+    """
+    policy = policy or face_service.encode_policy
+    image_key = encoding_cache.image_key(image_data)
+    if image_key is None:
+        return (await _analyze_face(image_data, decode_max_side, policy))["encoding"]
+
+    encoding_key = (image_key, "encoding", decode_max_side, policy)
+    cached = encoding_cache.get(encoding_key)
+    if cached is not None:
+        return cached["encoding"]
+    boxes_key = (image_key, "boxes", decode_max_side, policy)
+    located = encoding_cache.peek(boxes_key)
+
+    result = await _analyze_face(image_data, decode_max_side, policy, located["boxes"] if located else None)
+    if result["boxes"] is not None:
+        encoding_cache.put(encoding_key, {"encoding": result["encoding"]})
+        encoding_cache.put(boxes_key, {"boxes": result["boxes"], "faces": result["faces"]})
+    return result["encoding"]
+
+async def _identify_encodings(probe_encodings: List[Optional[List[float]]],
+                              known_encodings: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """face_service.identify_encodings in a thread, with its match stage recorded"""
+    return await asyncio.to_thread(_traced_match, "identify_encodings", probe_encodings, known_encodings)
+
+async def _analyze_faces_cached(image_data: Any, decode_max_side: Optional[int],
+                                policy: DetectionPolicy) -> Dict[str, Any]:
+    """
+    Every face's encoding and full-resolution box, through the content cache
+    Shares cached face boxes with _encode_cached, so detection runs once per image, decoder and settings.
+    """
+    image_key = encoding_cache.image_key(image_data)
+    if image_key is None:
+        return await face_executor.run("analyze_faces", image_data, decode_max_side, policy)
+
+    encodings_key = (image_key, "encodings", decode_max_side, policy)
+    cached = encoding_cache.get(encodings_key)
+    if cached is not None:
+        return cached
+    boxes_key = (image_key, "boxes", decode_max_side, policy)
+    located = encoding_cache.peek(boxes_key)
+
+    result = await face_executor.run(
+        "analyze_faces", image_data, decode_max_side, policy, located["boxes"] if located else None
+    )
+    if result["boxes"] is not None:
+        encoding_cache.put(encodings_key, {"encodings": result["encodings"], "faces": result["faces"]})
+        encoding_cache.put(boxes_key, {"boxes": result["boxes"], "faces": result["faces"]})
+    return result
+
+async def _authenticate_group(image_data: Any, known_encodings: Optional[List[Dict[str, Any]]],
+                              decode_max_side: Optional[int], options: DetectionOptions) -> GroupAuthenticateResponse:
+    try:
+        analysis = await _analyze_faces_cached(
+            image_data, decode_max_side, _detection_policy(face_service.encode_policy, options)
+        )
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not analysis["faces"]:
+        return GroupAuthenticateResponse(success=False, error="No face detected in probe image")
+
+    result = await _identify_encodings(analysis["encodings"], known_encodings)
+    if not result["success"]:
+        return GroupAuthenticateResponse(success=False, count=len(analysis["faces"]), error=result.get("error"))
+    faces = [
+        GroupFace(box=FaceBox(x=x, y=y, w=w, h=h), **match)
+        for (x, y, w, h), match in zip(analysis["faces"], result["faces"])
+    ]
+    return GroupAuthenticateResponse(
+        success=True,
+        count=len(faces),
+        authenticated=sum(1 for face in faces if face.authenticated),
+        faces=faces,
+    )
+
+async def _detect_cached(image_data: Any, return_crops: bool, decode_max_side: Optional[int],
+                         policy: DetectionPolicy, crop_options: Optional[CropOptions] = None) -> Dict[str, Any]:
+    """
+    Detect through the content cache; crops still need a worker to cut them from the image
+    Crops come back unencoded, for _detect_response to spread their encoding across workers
+    """
+    image_key = encoding_cache.image_key(image_data)
+    if image_key is None:
+        return await face_executor.run(
+            "detect_faces", image_data, return_crops, decode_max_side, policy, None, crop_options, False
+        )
+
+    boxes_key = (image_key, "boxes", decode_max_side, policy)
+    located = encoding_cache.get(boxes_key)
+    if located is not None and not return_crops:
+        return {"faces": located["faces"], "crops": None, "boxes": located["boxes"]}
+
+    result = await face_executor.run(
+        "detect_faces", image_data, return_crops, decode_max_side, policy,
+        located["boxes"] if located else None, crop_options, False
+    )
+    encoding_cache.put(boxes_key, {"boxes": result["boxes"], "faces": result["faces"]})
+    return result
+
+def _encode_response(encoding: Optional[List[float]], encoding_format: str = "json") -> EncodeResponse:
+    if encoding is None:
+        return EncodeResponse(success=False, error="No face detected in image")
+    if encoding_format == "json":
+        return EncodeResponse(success=True, encoding=encoding)
+    return EncodeResponse(success=True, encoding_packed=face_service.pack_encoding(encoding, encoding_format))
+
 @app.get("/health")
+@app.get("/health/live")
 async def health():
+    """Liveness: the process is up and serving; says nothing about models"""
     return {"status": "ok"}
 
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: 200 once models are loaded and every worker is warm, 503 until then (or if warm-up failed)"""
+    body = {
+        **startup,
+        "backend": face_service.backend,
+        "executor": face_executor.mode,
+        "gallery_size": len(face_service.gallery),
+    }
+    return JSONResponse(status_code=200 if startup["status"] == "ready" else 503, content=body)
+
 @app.post("/encode", response_model=EncodeResponse)
 async def encode_face(req: EncodeRequest):
     """Generate face encoding from base64 image"""
     try:
-        encoding = face_service.encode_face(req.image_base64)
-        if encoding is None:
-            return EncodeResponse(success=False, error="No face detected in image")
-        return EncodeResponse(success=True, encoding=encoding)
+        encoding = await _encode_cached(req.image_base64, None, _detection_policy(face_service.encode_policy, req))
+        return _encode_response(encoding, req.encoding_format)
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _read_raw_image(request: Request) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Image bytes from an application/octet-stream body or a multipart "image" file
+    Returns (image_bytes, other multipart form fields)
+    """
+    fields: Dict[str, Any] = {}
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Multipart body needs an 'image' file field")
+        image = await upload.read()
+        fields = {key: value for key, value in form.items() if key != "image"}
+    else:
+        image = await request.body()
+    if not image:
+        raise HTTPException(status_code=400, detail="Empty image body")
+    return image, fields
+
+@app.post("/encode/raw", response_model=EncodeResponse)
+async def encode_face_raw(request: Request, decode_max_side: Optional[int] = Query(None, gt=0),
+                          encoding_format: EncodingFormat = "json",
+                          options: DetectionOptions = Depends(detection_options)):
+    """
+    Generate face encoding from raw image bytes (no base64)
+    decode_max_side decodes large JPEGs at 1/2-1/8 size while keeping the longer side >= decode_max_side
+    With a packed encoding_format and Accept: application/octet-stream the packed bytes are the response body
+    """
+    image, _ = await _read_raw_image(request)
+    try:
+        encoding = await _encode_cached(image, decode_max_side, _detection_policy(face_service.encode_policy, options))
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if (encoding is not None and encoding_format != "json"
+            and request.headers.get("accept") == "application/octet-stream"):
+        packed = pack_encoding(encoding, encoding_format, face_service.encoding_backend)
+        return Response(packed, media_type="application/octet-stream")
+    return _encode_response(encoding, encoding_format)
+
+@app.post("/encode/batch", response_model=EncodeBatchResponse)
+async def encode_faces_batch(request: Request):
+    """
+    Generate face encodings for many images in one call
+    Accepts JSON {"images_base64": [...]} or multipart/form-data with repeated "images" files
+    """
+    filenames: List[Optional[str]] = []
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        uploads = form.getlist("images")
+        if any(not isinstance(upload, StarletteUploadFile) for upload in uploads):
+            raise HTTPException(status_code=400, detail="Every \"images\" part must be a file upload")
+        images = [await upload.read() for upload in uploads]
+        filenames = [upload.filename for upload in uploads]
+    else:
+        try:
+            images = EncodeBatchRequest.model_validate(await request.json()).images_base64
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+
+    if len(images) > MAX_ENCODE_BATCH:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_ENCODE_BATCH} images")
+
+    results = await face_executor.map("encode_face_result", images)
+    items = [
+        EncodeBatchItem(index=i, filename=filenames[i] if filenames else None, **result)
+        for i, result in enumerate(results)
+    ]
+    return EncodeBatchResponse(
+        success=True,
+        count=len(items),
+        encoded=sum(1 for item in items if item.success),
+        results=items,
+    )
 
 @app.post("/authenticate", response_model=AuthenticateResponse)
 async def authenticate_face(req: AuthenticateRequest):
     """Authenticate a face against known encodings"""
     try:
-        print("coming here with known encodings:", len(req.known_encodings)) 
-        result = face_service.authenticate_face(req.image_base64, req.known_encodings)
+        # Encoding is CPU-bound and runs on a worker; matching uses the resident gallery here
+        probe_encoding = await _encode_cached(
+            req.image_base64, None, _detection_policy(face_service.encode_policy, req)
+        )
+        if probe_encoding is None:
+            result = {"success": False, "error": "No face detected in probe image"}
+        else:
+            result = await _match_scoped(probe_encoding, req.known_encodings, req)
         
         if not result["success"]:
-            return AuthenticateResponse(success=False, authenticated=False, error=result.get("error"))
+            return AuthenticateResponse(success=False, authenticated=False, error=result.get("error"),
+                                        scope=result.get("scope"))
         
         return AuthenticateResponse(
             success=True,
@@ -86,44 +629,420 @@ async def authenticate_face(req: AuthenticateRequest):
             user_id=result.get("user_id"),
             confidence=result.get("confidence"),
             distance=result.get("distance"),
-            error=result.get("error")
+            error=result.get("error"),
+            scope=result.get("scope")
+        )
+    except (ExecutorSaturated, HTTPException):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/authenticate/raw", response_model=AuthenticateResponse)
+async def authenticate_face_raw(request: Request, decode_max_side: Optional[int] = Query(None, gt=0),
+                                options: DetectionOptions = Depends(detection_options),
+                                scope: MatchScope = Depends(match_scope)):
+    """
+    Authenticate raw image bytes against the resident gallery
+    A multipart body may add a JSON "known_encodings" field to match against instead;
+    shard / candidates / fallback query parameters scope the match like /authenticate's fields
+    """
+    image, fields = await _read_raw_image(request)
+    known_encodings = None
+    if "known_encodings" in fields:
+        try:
+            known_encodings = json.loads(fields["known_encodings"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid known_encodings JSON: {e}")
+
+    try:
+        probe_encoding = await _encode_cached(
+            image, decode_max_side, _detection_policy(face_service.encode_policy, options)
         )
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if probe_encoding is None:
+        return AuthenticateResponse(success=False, authenticated=False, error="No face detected in probe image")
+
+    result = await _match_scoped(probe_encoding, known_encodings, scope)
+    if not result["success"]:
+        return AuthenticateResponse(success=False, authenticated=False, error=result.get("error"),
+                                    scope=result.get("scope"))
+    return AuthenticateResponse(
+        success=True,
+        authenticated=result.get("authenticated", False),
+        user_id=result.get("user_id"),
+        confidence=result.get("confidence"),
+        distance=result.get("distance"),
+        error=result.get("error"),
+        scope=result.get("scope")
+    )
+
+@app.post("/authenticate/group", response_model=GroupAuthenticateResponse)
+async def authenticate_group(req: GroupAuthenticateRequest):
+    """
+    Group check-in: identify every face in one image
+    Each user is matched to at most one face; unmatched faces are returned with authenticated=false
+    """
+    return await _authenticate_group(req.image_base64, req.known_encodings, None, req)
+
+@app.post("/authenticate/group/raw", response_model=GroupAuthenticateResponse)
+async def authenticate_group_raw(request: Request, decode_max_side: Optional[int] = Query(None, gt=0),
+                                 options: DetectionOptions = Depends(detection_options)):
+    """Group check-in from raw image bytes; a multipart body may add a JSON "known_encodings" field"""
+    image, fields = await _read_raw_image(request)
+    known_encodings = None
+    if "known_encodings" in fields:
+        try:
+            known_encodings = json.loads(fields["known_encodings"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid known_encodings JSON: {e}")
+    return await _authenticate_group(image, known_encodings, decode_max_side, options)
+
+async def _track_frame(tracker: FaceTracker, frame: int, image: Any, decode_max_side: Optional[int],
+                       policy: DetectionPolicy, detect: bool) -> Tuple[FaceTracker, List[Dict[str, Any]]]:
+    """
+    Follow the tracks into one frame and, on a detection frame, detect faces and encode only the tracks
+    that need an identity, in one worker call (one decode), then match them. Returns the updated
+    tracker, which a worker process hands back as a copy
+    """
+    tracked = await face_executor.run("track_faces", image, decode_max_side, policy, tracker, detect)
+    tracker = tracked["tracker"]
+    if tracked["pending"] is None:
+        return tracker, [{"event": "error", "frame": frame, "error": "Could not decode frame"}]
+
+    pending = tracked["pending"]
+    events = [track.event("lost", frame) for track in tracked["lost"]]
+    if pending:
+        matches = [None] * len(pending)
+        result = await _identify_encodings(tracked["encodings"])
+        if result["success"]:
+            matches = result["faces"]
+        for track, match in zip(pending, matches):
+            new = track.attempts == 0
+            if tracker.identify(track, match) or new:
+                events.append(track.event("track" if new else "update", frame))
+    reported = {event["track_id"] for event in events}
+    events.extend(track.event("move", frame) for track in tracked["moved"] if track.track_id not in reported)
+    return tracker, events
+
+@app.websocket("/authenticate/stream")
+async def authenticate_stream(websocket: WebSocket, detect_every: int = Query(STREAM_DETECT_EVERY, ge=1),
+                              decode_max_side: Optional[int] = Query(None, gt=0),
+                              options: DetectionOptions = Depends(detection_options)):
+    """
+    Continuous check-in against the resident gallery over a WebSocket
+    Frames arrive as binary messages (image bytes) or text (base64). Faces are
+    detected every detect_every frames and associated with tracks by box overlap;
+    on every frame, optical flow on a small greyscale copy moves the boxes, so a
+    face that stays in view is encoded and matched once. Events are pushed as JSON:
+    "track" for a new face, "update" when a track's identity changes, "move" when
+    a box moved, "lost" when it leaves and "error" for a frame that could not be processed.
+    """
+    await websocket.accept()
+    try:
+        policy = _detection_policy(face_service.encode_policy, options)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    tracker = FaceTracker()
+    token = current_endpoint.set("/authenticate/stream")
+    frame = -1
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            frame += 1
+            image = message.get("bytes") or message.get("text")
+            try:
+                tracker, events = await _track_frame(tracker, frame, image, decode_max_side, policy,
+                                                     frame % detect_every == 0)
+            except ExecutorSaturated as e:
+                events = [{"event": "error", "frame": frame, "error": str(e)}]
+            for event in events:
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        current_endpoint.reset(token)
+
+async def _resolve_gallery_encoding(encoding: Optional[EncodingValue], image_base64: Optional[str]) -> List[float]:
+    """Use the supplied (JSON or packed) encoding, or encode the supplied image"""
+    if encoding is not None:
+        try:
+            return face_service.load_encoding(encoding)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if image_base64 is None:
+        raise HTTPException(status_code=400, detail="Provide either encoding or image_base64")
+    encoding = await _encode_cached(image_base64)
+    if encoding is None:
+        raise HTTPException(status_code=422, detail="No face detected in image")
+    return encoding
+
+def _refresh_gallery() -> None:
+    """Apply enrollments and compactions made by other workers"""
+    if gallery_store is not None:
+        gallery_store.refresh(face_service.gallery)
+
+def _store_upsert(user_id: int, encoding: Any) -> None:
+    """Enroll into the resident gallery and, when configured, the on-disk store"""
+    try:
+        face_service.gallery.upsert(user_id, encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if gallery_store is not None:
+        gallery_store.append_upsert(user_id, encoding)
+        _maybe_compact()
+
+# Running auto-compaction, kept referenced until it finishes
+_compaction: Optional[asyncio.Task] = None
+
+def _maybe_compact() -> None:
+    """Once the log is long enough, compact in a background thread; the request that crossed the threshold doesn't wait"""
+    global _compaction
+    if gallery_store.log_records < gallery_store.compact_after or gallery_store.compacting:
+        return
+    if _compaction is None or _compaction.done():
+        _compaction = asyncio.get_running_loop().create_task(_compact_in_background())
+
+async def _compact_in_background() -> None:
+    try:
+        await asyncio.to_thread(gallery_store.compact, face_service.gallery)
     except Exception as e:
+        logger.error("Gallery compaction failed: %s", e)
+
+def _gallery_response(user_id: Optional[int] = None) -> GalleryResponse:
+    gallery = face_service.gallery
+    return GalleryResponse(success=True, user_id=user_id, count=len(gallery), dimension=gallery.dimension)
+
+@app.get("/gallery", response_model=GalleryResponse)
+async def gallery_stats():
+    """Size and dimension of the resident gallery"""
+    _refresh_gallery()
+    return _gallery_response()
+
+@app.post("/gallery", response_model=GalleryResponse)
+async def gallery_enroll(req: GalleryEnrollRequest):
+    """Enroll a user's encoding (or image) into the resident gallery"""
+    _refresh_gallery()
+    if req.user_id in face_service.gallery:
+        raise HTTPException(status_code=409, detail=f"User {req.user_id} is already enrolled")
+    encoding = await _resolve_gallery_encoding(req.encoding, req.image_base64)
+    _store_upsert(req.user_id, encoding)
+    return _gallery_response(req.user_id)
+
+@app.put("/gallery/{user_id}", response_model=GalleryResponse)
+async def gallery_update(user_id: int, req: GalleryUpdateRequest):
+    """Replace the encoding of an enrolled user"""
+    _refresh_gallery()
+    if user_id not in face_service.gallery:
+        raise HTTPException(status_code=404, detail=f"User {user_id} is not enrolled")
+    encoding = await _resolve_gallery_encoding(req.encoding, req.image_base64)
+    _store_upsert(user_id, encoding)
+    return _gallery_response(user_id)
+
+@app.delete("/gallery/{user_id}", response_model=GalleryResponse)
+async def gallery_delete(user_id: int):
+    """Remove a user from the resident gallery"""
+    _refresh_gallery()
+    if not face_service.gallery.remove(user_id):
+        raise HTTPException(status_code=404, detail=f"User {user_id} is not enrolled")
+    if gallery_store is not None:
+        gallery_store.append_remove(user_id)
+        _maybe_compact()
+    return _gallery_response(user_id)
+
+def _shard_response(name: Optional[str] = None) -> ShardResponse:
+    try:
+        shards = gallery_shards.stats(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if name is not None and not shards:
+        raise HTTPException(status_code=404, detail=f"Unknown gallery shard {name!r}")
+    return ShardResponse(success=True, shards=[ShardInfo(**shard) for shard in shards])
+
+@app.get("/gallery/shards", response_model=ShardResponse)
+async def gallery_shards_list():
+    """Every gallery shard with its member count and whether its rows are loaded"""
+    return _shard_response()
+
+@app.get("/gallery/shards/{name}", response_model=ShardResponse)
+async def gallery_shard_get(name: str):
+    return _shard_response(name)
+
+@app.put("/gallery/shards/{name}", response_model=ShardResponse)
+async def gallery_shard_put(name: str, req: ShardRequest):
+    """Create or replace a shard's membership (e.g. an event's attendee user ids)"""
+    try:
+        gallery_shards.set_members(name, req.user_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _shard_response(name)
+
+@app.delete("/gallery/shards/{name}", response_model=ShardResponse)
+async def gallery_shard_delete(name: str):
+    response = _shard_response(name)
+    gallery_shards.remove(name)
+    return response
+
+@app.post("/gallery/shards/{name}/load", response_model=ShardResponse)
+async def gallery_shard_load(name: str):
+    """Cut the shard's rows out of the gallery now rather than on its first match"""
+    _shard_or_404(name)
+    _refresh_gallery()
+    gallery_shards.gallery_for(name)
+    return _shard_response(name)
+
+@app.post("/gallery/shards/{name}/evict", response_model=ShardResponse)
+async def gallery_shard_evict(name: str):
+    """Free the shard's loaded rows; its membership stays and it reloads on next use"""
+    _shard_or_404(name)
+    gallery_shards.evict(name)
+    return _shard_response(name)
+
+@app.post("/gallery/index", response_model=GalleryResponse)
+async def gallery_rebuild_index():
+    """Retrain the ANN index on the current gallery (e.g. after heavy churn)"""
+    _refresh_gallery()
+    if face_service.gallery.index is None:
+        raise HTTPException(status_code=400, detail="No ANN index configured (set FACE_ANN_INDEX=ivf or FACE_ANN_INDEX=pq)")
+    try:
+        await asyncio.to_thread(face_service.build_gallery_index)
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return _gallery_response()
+
+@app.post("/gallery/compact", response_model=GalleryResponse)
+async def gallery_compact():
+    """Fold the append log into a new memory-mapped snapshot generation"""
+    if gallery_store is None:
+        raise HTTPException(status_code=400, detail="No gallery store configured (set FACE_GALLERY_DIR)")
+    await asyncio.to_thread(gallery_store.compact, face_service.gallery)
+    return _gallery_response()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request and per-stage latency histograms in Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache")
+async def cache_stats():
+    """Hit/miss counters and occupancy of the encoding cache"""
+    return encoding_cache.stats()
+
+@app.delete("/cache")
+async def cache_clear():
+    """Forget every cached detection and encoding"""
+    encoding_cache.clear()
+    return encoding_cache.stats()
+
+def _stream_format(request: Request) -> Optional[str]:
+    """"ndjson" or "multipart" when the client accepts a per-face stream, else None"""
+    accept = request.headers.get("accept", "")
+    if accept.startswith("application/x-ndjson"):
+        return "ndjson"
+    if accept.startswith("multipart/mixed"):
+        return "multipart"
+    return None
+
+async def _detect_response(stream: Optional[str], result: Dict[str, Any], crop_options: CropOptions) -> Any:
+    """
+    DetectResponse JSON with crops as data URIs, or, for a stream format, a stream with
+    one record per face. Crops are encoded across the executor's workers; a stream
+    sends each one as soon as it and those before it are encoded.
+    """
+    if stream is not None:
+        crops = face_executor.stream("encode_crop", result["crops"] or [], crop_options)
+        if stream == "ndjson":
+            return StreamingResponse(_ndjson_faces(result, crops, crop_options), media_type="application/x-ndjson")
+        boundary = secrets.token_hex(16)
+        return StreamingResponse(_multipart_faces(result, crops, crop_options, boundary),
+                                 media_type=f"multipart/mixed; boundary={boundary}")
+    crops = None
+    if result["crops"] is not None:
+        encoded = await face_executor.map("encode_crop", result["crops"], crop_options)
+        crops = [f"data:{crop_options.media_type};base64,{base64.b64encode(crop).decode('ascii')}"
+                 for crop in encoded]
+    boxes = [FaceBox(x=x, y=y, w=w, h=h) for (x, y, w, h) in result["faces"]]
+    return DetectResponse(success=True, count=len(boxes), faces=boxes, crops=crops)
+
+async def _face_records(result: Dict[str, Any], crops: AsyncIterator[bytes], crop_options: CropOptions):
+    """(index, box dict, crop width, crop height, crop bytes) per detected face that has a crop"""
+    index = 0
+    async for crop in crops:
+        x, y, w, h = result["faces"][index]
+        width, height = crop_shape(result["boxes"][index], crop_options)
+        yield index, {"x": x, "y": y, "w": w, "h": h}, width, height, crop
+        index += 1
+
+def _detect_summary(result: Dict[str, Any]) -> bytes:
+    faces = [{"x": x, "y": y, "w": w, "h": h} for (x, y, w, h) in result["faces"]]
+    return json.dumps({"success": True, "count": len(faces), "faces": faces}).encode()
+
+async def _ndjson_faces(result: Dict[str, Any], crops: AsyncIterator[bytes], crop_options: CropOptions):
+    """A summary line, then one {index, box, width, height, media_type, crop (base64)} line per face"""
+    yield _detect_summary(result) + b"\n"
+    async for index, box, width, height, crop in _face_records(result, crops, crop_options):
+        yield json.dumps({
+            "index": index, "box": box, "width": width, "height": height,
+            "media_type": crop_options.media_type, "crop": base64.b64encode(crop).decode("ascii"),
+        }).encode() + b"\n"
+
+async def _multipart_faces(result: Dict[str, Any], crops: AsyncIterator[bytes], crop_options: CropOptions,
+                           boundary: str):
+    """A JSON summary part, then one binary part per face crop with its box in X-Face-* headers"""
+    delimiter = f"--{boundary}\r\n".encode()
+    yield delimiter + b"Content-Type: application/json\r\n\r\n" + _detect_summary(result) + b"\r\n"
+    extension = "bin" if crop_options.format == "raw" else crop_options.format
+    async for index, box, width, height, crop in _face_records(result, crops, crop_options):
+        headers = (
+            f"Content-Type: {crop_options.media_type}\r\n"
+            f"Content-Disposition: inline; name=\"face\"; filename=\"face-{index}.{extension}\"\r\n"
+            f"X-Face-Index: {index}\r\n"
+            f"X-Face-Box: {box['x']},{box['y']},{box['w']},{box['h']}\r\n"
+            f"X-Crop-Size: {width}x{height}\r\n\r\n"
+        )
+        yield delimiter + headers.encode() + crop + b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
 
 @app.post("/detect", response_model=DetectResponse)
-async def detect_faces(req: DetectRequest):
-    try:
-        data = req.image_base64
-        if data.startswith("data:"):
-            data = data.split(",", 1)[1]
-        img = Image.open(io.BytesIO(base64.b64decode(data))).convert("RGB")
-        img_np = np.array(img)
-
-        # OpenCV expects grayscale for Haar detection
-        gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
-        faces = CASCADE.detectMultiScale(
-            gray, scaleFactor=1.05, minNeighbors=2, minSize=(100, 100)
+async def detect_faces(req: DetectRequest, request: Request):
+    """
+    Detect faces in a base64 image
+    With return_crops, crop_* options choose fixed-size square crops and their format;
+    Accept: application/x-ndjson or multipart/mixed streams one record per face
+    """
+    stream = _stream_format(request)
+    try:
+        crop_options = _crop_options(req)
+        result = await _detect_cached(
+            req.image_base64, req.return_crops, None, _detection_policy(face_service.detect_policy, req), crop_options
         )
+        return await _detect_response(stream, result, crop_options)
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        boxes: List[FaceBox] = []
-        crops_b64: List[str] = []
-        for (x, y, w, h) in faces:
-            boxes.append(FaceBox(x=int(x), y=int(y), w=int(w), h=int(h)))
-            if req.return_crops:
-                crop = img_np[y:y+h, x:x+w]  # still RGB
-                pil = Image.fromarray(crop)
-                buf = io.BytesIO()
-                pil.save(buf, format="JPEG", quality=90)
-                b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-                crops_b64.append(f"data:image/jpeg;base64,{b64}")
-
-        return DetectResponse(
-            success=True,
-            count=len(boxes),
-            faces=boxes,
-            crops=crops_b64 if req.return_crops else None,
+@app.post("/detect/raw", response_model=DetectResponse)
+async def detect_faces_raw(request: Request, return_crops: bool = False,
+                           decode_max_side: Optional[int] = Query(None, gt=0),
+                           options: DetectionOptions = Depends(detection_options),
+                           crops: CropParams = Depends(crop_params)):
+    """Detect faces in raw image bytes; boxes are always in full-resolution coordinates"""
+    image, _ = await _read_raw_image(request)
+    stream = _stream_format(request)
+    try:
+        crop_options = _crop_options(crops)
+        result = await _detect_cached(
+            image, return_crops, decode_max_side, _detection_policy(face_service.detect_policy, options), crop_options
         )
+        return await _detect_response(stream, result, crop_options)
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
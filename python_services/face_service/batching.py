@@ -0,0 +1,95 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item calls into batch calls.
+
+    submit() queues an item and awaits its result. The queue is handed to
+    run_batch once it holds max_batch items, or max_wait seconds after the
+    first item arrived, whichever comes first; run_batch returns one result
+    per item, in order, and each is fanned back to its caller. An exception
+    from run_batch is raised in every caller of that batch. max_batch <= 1
+    disables batching: submit() then calls run_batch with just its own item.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch: int = 8, max_wait: float = 0.005, name: str = "batch"):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls, run_batch: Callable[[List[Any]], Awaitable[List[Any]]], name: str = "batch") -> "MicroBatcher":
+        return cls(
+            run_batch,
+            max_batch=int(os.environ.get("FACE_BATCH_MAX_SIZE", "1")),
+            max_wait=float(os.environ.get("FACE_BATCH_MAX_WAIT_MS", "5")) / 1000,
+            name=name,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1
+
+    async def submit(self, item: Any) -> Any:
+        """run_batch's result for item, computed together with whatever else is queued"""
+        if not self.enabled:
+            self._count(1)
+            return (await self.run_batch([item]))[0]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        """Dispatch everything queued now, in batches of at most max_batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def _count(self, size: int) -> None:
+        self.batches += 1
+        self.items += size
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self._count(len(batch))
+        try:
+            results = await self.run_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name} returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # A caller that gave up (cancelled) no longer wants its result
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Union
+
+
+def content_digest(image_data: Union[str, bytes]) -> bytes:
+    """
+    128-bit BLAKE2b digest of the image bytes, or of a base64 string's text
+    Base64 is hashed as sent (a data URI without its prefix) rather than decoded
+    first, which would cost the event loop a full decode per request; it goes
+    through a different decoder than raw bytes anyway, so the two never share entries.
+    """
+    if isinstance(image_data, str):
+        if image_data.startswith("data:"):
+            image_data = image_data.split(",", 1)[1]
+        image_data = image_data.encode()
+    return hashlib.blake2b(image_data, digest_size=16).digest()
+
+
+class EncodingCache:
+    """
+    In-process LRU cache of face detection/encoding results with a TTL.
+
+    Keys start with image_key() - the content digest of the image (see
+    content_digest) plus the decoder it goes through (base64 strings are
+    decoded by PIL, raw bytes by OpenCV, whose pixels differ slightly) - and also carry whatever else
+    changed the result (decode size, detection policy), so a hit is always a
+    result the workers would have recomputed identically. Entries expire
+    ttl seconds after they were stored; the least recently used entry is
+    evicted once max_entries is reached. A disabled cache stores nothing.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, enabled: bool = True,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled and max_entries > 0
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls) -> "EncodingCache":
+        return cls(
+            max_entries=int(os.environ.get("FACE_CACHE_SIZE", "1024")),
+            ttl=float(os.environ.get("FACE_CACHE_TTL", "300")),
+            enabled=os.environ.get("FACE_CACHE_ENABLED", "true").lower() not in ("0", "false", "no"),
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def image_key(self, image_data: Union[str, bytes]) -> Optional[Tuple[bytes, str]]:
+        """(content digest, decoder) to key entries by, or None when caching is off"""
+        if not self.enabled:
+            return None
+        return content_digest(image_data), "pil" if isinstance(image_data, str) else "opencv"
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """The live entry for key, counted as a hit or miss"""
+        return self._lookup(key, count=True)
+
+    def peek(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        Like get, but not counted: for a secondary lookup within a request
+        whose hit or miss was already counted, so /cache reports one per request
+        """
+        return self._lookup(key, count=False)
+
+    def _lookup(self, key: Hashable, count: bool) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += count
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += count
+                return None
+            self._entries.move_to_end(key)
+            self.hits += count
+            return value
+
+    def put(self, key: Hashable, value: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,86 @@
+import base64
+import binascii
+import struct
+from dataclasses import dataclass
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+# Packed encoding layout (little-endian):
+#   magic "FE" | format version u8 | dtype u8 | backend u8 | model version u8 | dimension u16 | values
+ENCODING_MAGIC = b"FE"
+ENCODING_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<2sBBBBH")
+
+# Wire names accepted wherever an encoding format can be chosen
+ENCODING_FORMATS = ("json", "float32", "float16")
+
+_DTYPE_CODES = {"float32": 1, "float16": 2}
+_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+
+# Which feature extractor produced the vector; vectors from different backends are not comparable
+_BACKEND_CODES = {"unknown": 0, "dlib-128": 1, "opencv-256": 2}
+_BACKEND_NAMES = {code: name for name, code in _BACKEND_CODES.items()}
+
+# Bump when a backend's features change so stale stored encodings can be told apart
+MODEL_VERSIONS = {"unknown": 0, "dlib-128": 1, "opencv-256": 1}
+
+
+@dataclass(frozen=True)
+class PackedEncoding:
+    vector: np.ndarray  # float32, whatever the stored precision
+    dtype: str
+    backend: str
+    model_version: int
+
+
+def pack_encoding(vector: Union[Sequence[float], np.ndarray], dtype: str = "float32",
+                  backend: str = "unknown", model_version: Optional[int] = None) -> bytes:
+    """Header plus float32/float16 values; ~4-8x smaller than the JSON float list"""
+    if dtype not in _DTYPE_CODES:
+        raise ValueError(f"Unknown encoding dtype {dtype!r}; expected float32 or float16")
+    if backend not in _BACKEND_CODES:
+        raise ValueError(f"Unknown encoding backend {backend!r}")
+    values = np.asarray(vector, dtype=np.float32).ravel()
+    if not 0 < values.size <= 0xFFFF:
+        raise ValueError(f"Cannot pack an encoding of dimension {values.size}")
+    if model_version is None:
+        model_version = MODEL_VERSIONS[backend]
+    code = _DTYPE_CODES[dtype]
+    header = _HEADER.pack(ENCODING_MAGIC, ENCODING_FORMAT_VERSION, code, _BACKEND_CODES[backend],
+                          model_version, values.size)
+    return header + values.astype(_DTYPES[code]).tobytes()
+
+
+def pack_encoding_base64(vector: Union[Sequence[float], np.ndarray], dtype: str = "float32",
+                         backend: str = "unknown", model_version: Optional[int] = None) -> str:
+    return base64.b64encode(pack_encoding(vector, dtype, backend, model_version)).decode("ascii")
+
+
+def unpack_encoding(data: Union[bytes, str]) -> PackedEncoding:
+    """Parse packed bytes, or their base64 text; raises ValueError on malformed input"""
+    if isinstance(data, str):
+        try:
+            data = base64.b64decode(data, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise ValueError(f"Packed encoding is not valid base64: {e}")
+    if len(data) < _HEADER.size:
+        raise ValueError("Packed encoding is shorter than its header")
+    magic, version, code, backend, model_version, dimension = _HEADER.unpack_from(data)
+    if magic != ENCODING_MAGIC:
+        raise ValueError("Not a packed face encoding")
+    if version != ENCODING_FORMAT_VERSION:
+        raise ValueError(f"Unsupported packed encoding version {version}")
+    if code not in _DTYPES or backend not in _BACKEND_NAMES:
+        raise ValueError("Packed encoding has an unknown dtype or backend")
+    dtype = _DTYPES[code]
+    if len(data) != _HEADER.size + dimension * dtype.itemsize:
+        raise ValueError(f"Packed encoding length does not match dimension {dimension}")
+    vector = np.frombuffer(data, dtype=dtype, count=dimension, offset=_HEADER.size).astype(np.float32)
+    return PackedEncoding(
+        vector=vector,
+        dtype="float32" if code == 1 else "float16",
+        backend=_BACKEND_NAMES[backend],
+        model_version=model_version,
+    )
+
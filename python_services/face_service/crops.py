@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .detection import Box
+
+CROP_FORMATS = ("jpeg", "png", "webp", "raw")
+
+MEDIA_TYPES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+    # size x size x 3 RGB bytes, row-major
+    "raw": "application/octet-stream",
+}
+
+
+@dataclass(frozen=True)
+class CropOptions:
+    """
+    How /detect cuts and encodes face crops.
+
+    Without size, each crop is exactly its detection box, as before. With
+    size, each crop is a square centred on the box (no landmark alignment,
+    so tilted faces stay tilted), widened by margin (a fraction of the box's
+    longer side on every side), padded by edge replication where it leaves
+    the image and resized to size x size, so every crop has the same shape. quality applies to JPEG and WebP.
+    raw returns the RGB pixels uncompressed and needs size.
+    """
+    format: str = "jpeg"
+    quality: int = 90
+    size: Optional[int] = None
+    margin: float = 0.0
+
+    def __post_init__(self):
+        if self.format not in CROP_FORMATS:
+            raise ValueError(f"Unknown crop format {self.format!r}; expected one of {CROP_FORMATS}")
+        if self.format == "raw" and not self.size:
+            raise ValueError("Raw crops need a fixed crop size")
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+
+def cut_crop(image: np.ndarray, box: Box, options: CropOptions) -> np.ndarray:
+    """The RGB crop of box under options"""
+    x, y, w, h = (int(v) for v in box)
+    if not options.size:
+        return image[y:y + h, x:x + w]
+
+    side = int(round(max(w, h) * (1 + 2 * options.margin)))
+    left, top = x + w // 2 - side // 2, y + h // 2 - side // 2
+    right, bottom = left + side, top + side
+    height, width = image.shape[:2]
+    crop = image[max(0, top):min(height, bottom), max(0, left):min(width, right)]
+    pads = (max(0, -top), max(0, bottom - height), max(0, -left), max(0, right - width))
+    if any(pads):
+        crop = cv2.copyMakeBorder(crop, *pads, cv2.BORDER_REPLICATE)
+    interpolation = cv2.INTER_AREA if side > options.size else cv2.INTER_LINEAR
+    return cv2.resize(crop, (options.size, options.size), interpolation=interpolation)
+
+
+def encode_crop(crop: np.ndarray, options: CropOptions) -> bytes:
+    """crop in options.format"""
+    if options.format == "raw":
+        return np.ascontiguousarray(crop).tobytes()
+    params: List[int] = []
+    if options.format == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, options.quality]
+    elif options.format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, options.quality]
+    ok, buffer = cv2.imencode("." + options.format, cv2.cvtColor(crop, cv2.COLOR_RGB2BGR), params)
+    if not ok:
+        raise ValueError(f"Could not encode crop as {options.format}")
+    return buffer.tobytes()
+
+
+def crop_shape(box: Box, options: CropOptions) -> Tuple[int, int]:
+    """(width, height) of the crop of box"""
+    if options.size:
+        return options.size, options.size
+    return int(box[2]), int(box[3])
@@ -0,0 +1,109 @@
+from dataclasses import dataclass, replace
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]  # x, y, w, h
+
+# haar: OpenCV Haar cascade; hog: dlib HOG via face_recognition; yunet: OpenCV DNN (YuNet ONNX model)
+DETECTORS = ("haar", "hog", "yunet")
+
+
+@dataclass(frozen=True)
+class DetectionPolicy:
+    """
+    Resolution and pyramid settings for face detection.
+
+    With max_side set (it is off by default, so small or distant faces are
+    found as at full resolution), detection runs on a copy whose longer side
+    is at most max_side; boxes are mapped back to full resolution so cropping
+    and encoding still use the original pixels. min_face_size and max_face_size are in full-resolution
+    pixels. scale_factor is the Haar pyramid step (1.05 is fine but slow,
+    1.1-1.2 is much faster) and min_neighbors the Haar vote threshold;
+    min_confidence is the YuNet score threshold. The HOG detector only
+    honours max_side.
+    """
+    detector: str = "haar"
+    max_side: Optional[int] = None
+    scale_factor: float = 1.05
+    min_face_size: int = 100
+    max_face_size: Optional[int] = None
+    min_neighbors: int = 5
+    min_confidence: float = 0.7
+
+    def __post_init__(self):
+        if self.detector not in DETECTORS:
+            raise ValueError(f"Unknown face detector {self.detector!r}; expected one of {DETECTORS}")
+
+    def with_overrides(self, **overrides) -> "DetectionPolicy":
+        """Copy with every non-None override applied"""
+        return replace(self, **{key: value for key, value in overrides.items() if value is not None})
+
+    def downscale(self, image: np.ndarray) -> Tuple[np.ndarray, float]:
+        """(detection image, scale) where scale = detection size / original size"""
+        longest = max(image.shape[:2])
+        if not self.max_side or longest <= self.max_side:
+            return image, 1.0
+        scale = self.max_side / longest
+        size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA), scale
+
+
+def scale_box(box: Box, scale: float, shape: Tuple[int, ...]) -> Box:
+    """Map a box found at `scale` back to full resolution, clipped to the image"""
+    if scale == 1.0:
+        return tuple(int(v) for v in box)
+    x, y, w, h = (int(round(v / scale)) for v in box)
+    x, y = max(0, x), max(0, y)
+    return x, y, min(w, shape[1] - x), min(h, shape[0] - y)
+
+
+def detect_haar(cascade: cv2.CascadeClassifier, gray: np.ndarray, policy: DetectionPolicy) -> List[Box]:
+    """Haar detection under policy; boxes are in the coordinates of gray"""
+    small, scale = policy.downscale(gray)
+    min_face = max(1, int(policy.min_face_size * scale))
+    kwargs = {}
+    if policy.max_face_size:
+        max_face = max(min_face, int(policy.max_face_size * scale))
+        kwargs["maxSize"] = (max_face, max_face)
+    faces = cascade.detectMultiScale(
+        small,
+        scaleFactor=policy.scale_factor,
+        minNeighbors=policy.min_neighbors,
+        minSize=(min_face, min_face),
+        **kwargs
+    )
+    return [scale_box(face, scale, gray.shape) for face in faces]
+
+
+def detect_hog(face_locations: Callable, image: np.ndarray, policy: DetectionPolicy) -> List[Box]:
+    """HOG detection (face_recognition.face_locations) of an RGB image; boxes are in its coordinates"""
+    small, scale = policy.downscale(image)
+    return [
+        scale_box((left, top, right - left, bottom - top), scale, image.shape)
+        for (top, right, bottom, left) in face_locations(small)
+    ]
+
+
+def detect_yunet(detector: "cv2.FaceDetectorYN", image: np.ndarray, policy: DetectionPolicy) -> List[Box]:
+    """YuNet (cv2.FaceDetectorYN) detection of an RGB image under policy; boxes are in its coordinates"""
+    small, scale = policy.downscale(image)
+    height, width = small.shape[:2]
+    detector.setInputSize((width, height))
+    detector.setScoreThreshold(policy.min_confidence)
+    _, faces = detector.detect(cv2.cvtColor(small, cv2.COLOR_RGB2BGR))
+    if faces is None:
+        return []
+    min_face = policy.min_face_size * scale
+    max_face = policy.max_face_size * scale if policy.max_face_size else None
+    boxes = []
+    # Rows are x, y, w, h, five landmark points, score; boxes may overhang the image
+    for x, y, w, h in faces[:, :4]:
+        if max(w, h) < min_face or (max_face and max(w, h) > max_face):
+            continue
+        x0, y0 = max(0, int(round(x))), max(0, int(round(y)))
+        x1, y1 = min(width, int(round(x + w))), min(height, int(round(y + h)))
+        if x1 > x0 and y1 > y0:
+            boxes.append(scale_box((x0, y0, x1 - x0, y1 - y0), scale, image.shape))
+    return boxes
@@ -0,0 +1,208 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from .face_service import FaceService
+from .metrics import REGISTRY, MetricsRegistry, StageTimings, traced_call
+
+EXECUTOR_MODES = ("process", "thread", "inline")
+
+# FaceService owned by each pool worker process (set by _init_worker)
+_worker_service: Optional[FaceService] = None
+
+
+def _init_worker(tolerance: float) -> None:
+    global _worker_service
+    _worker_service = FaceService(tolerance=tolerance)
+    # Load models and run a dummy detection/encoding before the worker takes requests
+    _worker_service.warm_up()
+
+
+def _call_worker(method: str, *args: Any) -> Tuple[Any, StageTimings]:
+    return traced_call(getattr(_worker_service, method), *args)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the executor already has max_pending calls in flight"""
+
+
+class FaceExecutor:
+    """
+    Runs CPU-bound FaceService calls off the asyncio event loop.
+
+    mode="process" keeps a FaceService (and Haar cascade) in every worker
+    process so detection and encoding scale with cores; "thread" shares the
+    given service across a thread pool and "inline" runs calls on the loop,
+    which is only meant for tests and debugging. At most max_pending calls
+    may be in flight, each item of a map() or stream() counting as one; further calls
+    fail fast with ExecutorSaturated.
+    Stage timings of every call are recorded into metrics.
+    """
+
+    def __init__(self, service: FaceService, mode: str = "process",
+                 workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 min_chunk: int = 4, metrics: Optional[MetricsRegistry] = None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode {mode!r}; expected one of {EXECUTOR_MODES}")
+        self.service = service
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        # Smallest chunk run_chunked hands a worker; smaller batches stay whole
+        self.min_chunk = max(1, min_chunk)
+        self.pending = 0
+        self.metrics = metrics or REGISTRY
+        self._pool: Optional[Executor] = None
+
+    @classmethod
+    def from_env(cls, service: FaceService) -> "FaceExecutor":
+        return cls(
+            service,
+            mode=os.environ.get("FACE_EXECUTOR", "process"),
+            workers=int(os.environ.get("FACE_EXECUTOR_WORKERS", "0")) or None,
+            max_pending=int(os.environ.get("FACE_EXECUTOR_MAX_PENDING", "0")) or None,
+            min_chunk=int(os.environ.get("FACE_BATCH_MIN_CHUNK", "4")),
+        )
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.mode == "process":
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.service.tolerance,),
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="face-worker")
+        return self._pool
+
+    def _task(self, method: str, *args: Any):
+        if self.mode == "process":
+            return functools.partial(_call_worker, method, *args)
+        return functools.partial(traced_call, getattr(self.service, method), *args)
+
+    def _unwrap(self, traced: Tuple[Any, StageTimings]) -> Any:
+        result, stages = traced
+        self.metrics.observe_stages(stages, self.service.backend)
+        return result
+
+    def _reserve(self, count: int) -> None:
+        """
+        Claim count in-flight slots or raise ExecutorSaturated
+        A call larger than max_pending is only admitted onto an idle executor
+        """
+        if self.pending >= self.max_pending or (self.pending and self.pending + count > self.max_pending):
+            raise ExecutorSaturated(f"{self.pending} face service calls already in flight")
+        self.pending += count
+
+    async def run(self, method: str, *args: Any) -> Any:
+        """Await FaceService.<method>(*args) on a worker"""
+        self._reserve(1)
+        try:
+            if self.mode == "inline":
+                return self._unwrap(self._task(method, *args)())
+            loop = asyncio.get_running_loop()
+            return self._unwrap(await loop.run_in_executor(self._get_pool(), self._task(method, *args)))
+        finally:
+            self.pending -= 1
+
+    async def map(self, method: str, items: List[Any], *args: Any) -> List[Any]:
+        """
+        Await FaceService.<method>(item, *args) for every item, spread across workers
+        Every item counts as an in-flight call
+        """
+        self._reserve(len(items))
+        try:
+            if self.mode == "inline":
+                return [self._unwrap(self._task(method, item, *args)()) for item in items]
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            traced = await asyncio.gather(*(loop.run_in_executor(pool, self._task(method, item, *args))
+                                            for item in items))
+            return [self._unwrap(item) for item in traced]
+        finally:
+            self.pending -= len(items)
+
+    def stream(self, method: str, items: List[Any], *args: Any) -> AsyncIterator[Any]:
+        """
+        FaceService.<method>(item, *args) for every item, spread across workers like map(),
+        but yielded in item order as each result arrives instead of all at once.
+        Every item's slot is claimed now, so ExecutorSaturated is raised before anything
+        is streamed, and released when that item's call finishes, whether or not it is consumed.
+        """
+        self._reserve(len(items))
+        if self.mode == "inline":
+            try:
+                results = [self._unwrap(self._task(method, item, *args)()) for item in items]
+            finally:
+                self.pending -= len(items)
+            return self._yield_results(results)
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        futures = [loop.run_in_executor(pool, self._task(method, item, *args)) for item in items]
+        for future in futures:
+            future.add_done_callback(self._release)
+        return self._yield_in_order(futures)
+
+    def _release(self, _future: asyncio.Future) -> None:
+        self.pending -= 1
+
+    async def _yield_in_order(self, futures: List[asyncio.Future]) -> AsyncIterator[Any]:
+        try:
+            for future in futures:
+                yield self._unwrap(await future)
+        finally:
+            # A consumer that stops early (client gone) leaves no work queued behind it
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    async def _yield_results(results: List[Any]) -> AsyncIterator[Any]:
+        for result in results:
+            yield result
+
+    async def run_chunked(self, method: str, items: List[Any]) -> List[Any]:
+        """
+        Await FaceService.<method>(chunk), a batch method returning one result per item,
+        over items split into contiguous chunks of at least min_chunk items, at most one per worker,
+        so a large micro-batch still uses every core while a small one is encoded in a single pass;
+        returns the results in item order. Every item counts as an in-flight call
+        """
+        self._reserve(len(items))
+        try:
+            chunks = self._chunks(items)
+            if self.mode == "inline":
+                return [result for chunk in chunks for result in self._unwrap(self._task(method, chunk)())]
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            traced = await asyncio.gather(*(loop.run_in_executor(pool, self._task(method, chunk)) for chunk in chunks))
+            return [result for chunk_results in traced for result in self._unwrap(chunk_results)]
+        finally:
+            self.pending -= len(items)
+
+    def _chunks(self, items: List[Any]) -> List[List[Any]]:
+        count = 1 if self.mode == "inline" else max(1, min(self.workers, len(items) // self.min_chunk))
+        size = -(-len(items) // count)
+        return [items[start:start + size] for start in range(0, len(items), size)]
+
+    def start(self) -> None:
+        """
+        Create the pool and spin up (and warm up) every worker before traffic arrives
+        Thread and inline modes warm the shared service instead. Blocks until done.
+        """
+        if self.mode != "process":
+            self.service.warm_up()
+        if self.mode == "inline":
+            return
+        pool = self._get_pool()
+        for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
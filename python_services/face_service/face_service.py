@@ -1,61 +1,433 @@
 import cv2
 import numpy as np
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Union
 import base64
 import io
+import os
+import time
 from PIL import Image
+from .codec import MODEL_VERSIONS, pack_encoding_base64, unpack_encoding
+from .crops import CropOptions, cut_crop, encode_crop
+from .detection import Box, DetectionPolicy, detect_haar, detect_hog, detect_yunet
+from .gallery import FaceGallery
+from .imaging import decode_image_buffer
+from .log import get_logger
+from .matching import (MIN_AUTH_CONFIDENCE, EncodingMatrix, assign_one_to_one, best_candidate, cosine_threshold,
+                       group_by_dimension, match_scores, top_columns)
+from .metrics import timed_stage
+from .models import MODELS
+from .tracking import FaceTracker, flow_frame
 
-try:
-    import face_recognition
-    USE_FACE_RECOGNITION = True
-except ImportError:
-    USE_FACE_RECOGNITION = False
-    from sklearn.metrics.pairwise import cosine_similarity
+# Backend chosen by FACE_BACKEND (auto/face_recognition/opencv); face_recognition is imported on first use
+USE_FACE_RECOGNITION = MODELS.backend == "face_recognition"
+face_recognition = MODELS.face_recognition
+
+logger = get_logger(__name__)
 
 class FaceService:
     """Face recognition service with fallback implementation"""
     
-    def __init__(self, tolerance: float = 0.75):
+    def __init__(self, tolerance: float = 0.75, gallery: Optional[FaceGallery] = None):
         self.tolerance = tolerance
-        # Initialize Haar cascade for face detection (used in fallback mode)
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        # Resident encodings used when a request carries no known_encodings
+        self.gallery = gallery if gallery is not None else FaceGallery()
+        # Default detection settings; requests may override them per call
+        max_detect_side = int(os.environ.get("FACE_DETECT_MAX_SIDE", "0")) or None
+        # FACE_DETECTOR replaces both defaults: HOG/Haar (per backend) for encoding, Haar for /detect
+        detector = os.environ.get("FACE_DETECTOR") or None
+        self.encode_policy = DetectionPolicy(detector=detector or MODELS.default_detector, max_side=max_detect_side,
+                                             min_neighbors=5, max_face_size=500)
+        self.detect_policy = DetectionPolicy(detector=detector or "haar", max_side=max_detect_side, min_neighbors=2)
+    
+    @property
+    def face_cascade(self) -> cv2.CascadeClassifier:
+        """This thread's Haar cascade from the shared model registry"""
+        return MODELS.haar_cascade()
     
-    def encode_face(self, image_data: str) -> Optional[List[float]]:
+    def warm_up(self) -> Dict[str, float]:
         """
-        Extract face encoding from base64 image
+        Load the active backend's models and run one synthetic image through decode,
+        detection and encoding, so the first real request doesn't pay for lazy setup
+        Returns {load_s, warmup_s}
+        """
+        load_s = MODELS.load()
+        started = time.perf_counter()
+        image = np.random.default_rng(0).integers(0, 256, (160, 160, 3), dtype=np.uint8)
+        _, jpeg = cv2.imencode(".jpg", image)
+        image_np = self.decode_image(jpeg.tobytes())
+        self.locate_faces(image_np)
+        # Detection finds nothing in noise, so encode a fixed box to exercise the encoder too
+        self.encode_image_faces(image_np, [(40, 40, 80, 80)])
+        warmup_s = time.perf_counter() - started
+        logger.info("Warmed up %s backend in %.2fs", self.backend, warmup_s)
+        return {"load_s": load_s, "warmup_s": warmup_s}
+    
+    def encode_face(self, image_data: Union[str, bytes], decode_max_side: Optional[int] = None,
+                    policy: Optional[DetectionPolicy] = None) -> Optional[List[float]]:
+        """
+        Extract face encoding from a base64 image or raw image bytes
         Uses face_recognition library if available, otherwise falls back to OpenCV
         """
+        return self.analyze_face(image_data, decode_max_side, policy)["encoding"]
+    
+    def analyze_face(self, image_data: Union[str, bytes], decode_max_side: Optional[int] = None,
+                     policy: Optional[DetectionPolicy] = None, boxes: Optional[List[Box]] = None) -> Dict[str, Any]:
+        """
+        Locate and encode the face in one image
+        boxes from an earlier call on the same image and settings skip detection.
+        Returns {encoding, boxes (decoded-image coordinates), faces (full resolution)};
+        everything is None when the image could not be processed
+        """
         try:
-            # Decode base64 image
-            if image_data.startswith("data:"):
-                image_data = image_data.split(",", 1)[1]
-            
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB") 
-            image_np = np.array(image)
-            
+            image_np, factor = self._decode_image(image_data, decode_max_side)
+            if boxes is None:
+                boxes = self.locate_faces(image_np, self._policy_for_factor(policy or self.encode_policy, factor))
+            encoding = self.encode_image(image_np, boxes=boxes)
+            return {"encoding": encoding, "boxes": boxes, "faces": self._full_resolution(boxes, factor)}
+        except Exception as e:
+            logger.warning("Error encoding face: %s", e)
+            return {"encoding": None, "boxes": None, "faces": None}
+    
+    def analyze_face_batch(self, requests: List[Tuple[Union[str, bytes], Optional[int], Optional[DetectionPolicy],
+                                                      Optional[List[Box]]]]) -> List[Dict[str, Any]]:
+        """
+        analyze_face for several (image_data, decode_max_side, policy, boxes) requests in one call
+        Every image is decoded and its faces located, then the chosen faces are encoded together.
+        Returns one analyze_face result per request, in order
+        """
+        results = [{"encoding": None, "boxes": None, "faces": None} for _ in requests]
+        images, faces, positions = [], [], []
+        for position, (image_data, decode_max_side, policy, boxes) in enumerate(requests):
+            try:
+                image_np, factor = self._decode_image(image_data, decode_max_side)
+                if boxes is None:
+                    boxes = self.locate_faces(image_np, self._policy_for_factor(policy or self.encode_policy, factor))
+            except Exception as e:
+                logger.warning("Error encoding face: %s", e)
+                continue
+            results[position] = {"encoding": None, "boxes": boxes, "faces": self._full_resolution(boxes, factor)}
+            if len(boxes):
+                images.append(image_np)
+                faces.append(self._primary_face(boxes))
+                positions.append(position)
+        for position, encoding in zip(positions, self.encode_batch(images, faces)):
+            results[position]["encoding"] = encoding
+        return results
+    
+    def analyze_faces(self, image_data: Union[str, bytes], decode_max_side: Optional[int] = None,
+                      policy: Optional[DetectionPolicy] = None, boxes: Optional[List[Box]] = None) -> Dict[str, Any]:
+        """
+        Multi-face counterpart of analyze_face: one detection pass, then every face encoded
+        Returns {encodings (one per box, None where a face could not be encoded), boxes, faces};
+        everything is None when the image could not be processed
+        """
+        try:
+            image_np, factor = self._decode_image(image_data, decode_max_side)
+            if boxes is None:
+                boxes = self.locate_faces(image_np, self._policy_for_factor(policy or self.encode_policy, factor))
+            encodings = self.encode_image_faces(image_np, boxes)
+            return {"encodings": encodings, "boxes": boxes, "faces": self._full_resolution(boxes, factor)}
+        except Exception as e:
+            logger.warning("Error encoding faces: %s", e)
+            return {"encodings": None, "boxes": None, "faces": None}
+    
+    def track_faces(self, image_data: Union[str, bytes], decode_max_side: Optional[int], policy: Optional[DetectionPolicy],
+                    tracker: FaceTracker, detect: bool = True) -> Dict[str, Any]:
+        """
+        One streaming frame in one call: move the tracker's boxes by optical flow from the previous
+        frame, then, on a detection frame, detect, update the tracker and encode only the tracks it returns.
+        Frames without detection are decoded just large enough for the flow.
+        Returns {tracker, moved, pending, lost, encodings (one per pending track)}. tracker is the updated
+        tracker - the same object, or a copy when this runs in a worker process - with moved (tracks whose
+        box changed), pending and lost referring to its tracks. pending and encodings are None when the
+        frame could not be decoded.
+        """
+        before = {track.track_id: track.box for track in tracker.tracks}
+        try:
+            image_np, factor = self._decode_image(image_data, decode_max_side if detect else tracker.flow_side)
+            with timed_stage("track"):
+                tracker.follow(*flow_frame(image_np, factor, tracker.flow_side))
+            boxes = None
+            if detect:
+                boxes = self.locate_faces(image_np, self._policy_for_factor(policy or self.encode_policy, factor))
+        except Exception as e:
+            logger.warning("Error tracking faces: %s", e)
+            return {"tracker": tracker, "moved": [], "pending": None, "lost": [], "encodings": None}
+        
+        pending, lost, encodings = [], [], []
+        if boxes is not None:
+            pending, lost = tracker.update(self._full_resolution(boxes, factor), boxes)
+            encodings = self.encode_image_faces(image_np, [track.decoded_box for track in pending]) if pending else []
+        moved = [track for track in tracker.tracks if track.track_id in before and track.box != before[track.track_id]]
+        return {"tracker": tracker, "moved": moved, "pending": pending, "lost": lost, "encodings": encodings}
+    
+    def decode_image(self, image_data: Union[str, bytes], decode_max_side: Optional[int] = None) -> np.ndarray:
+        """Decode a base64 string (optionally a data URI) or raw image bytes to an RGB array"""
+        return self._decode_image(image_data, decode_max_side)[0]
+    
+    def _decode_image(self, image_data: Union[str, bytes], decode_max_side: Optional[int] = None) -> Tuple[np.ndarray, int]:
+        """
+        Returns (rgb_array, reduction factor)
+        Raw bytes are decoded by OpenCV straight from the buffer, at reduced size
+        when decode_max_side allows; base64 strings keep the original PIL path
+        """
+        if isinstance(image_data, str):
+            with timed_stage("decode"):
+                if image_data.startswith("data:"):
+                    image_data = image_data.split(",", 1)[1]
+                image_bytes = base64.b64decode(image_data)
+                image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+                return np.array(image), 1
+        
+        image_np, factor = decode_image_buffer(image_data, decode_max_side)
+        if image_np is None:
+            # Formats OpenCV cannot read (e.g. GIF) still go through PIL
+            with timed_stage("decode"):
+                image = Image.open(io.BytesIO(image_data)).convert("RGB")
+                return np.array(image), 1
+        return image_np, factor
+    
+    def _policy_for_factor(self, policy: DetectionPolicy, factor: int) -> DetectionPolicy:
+        """Express full-resolution face sizes in the pixels of an image decoded at 1/factor"""
+        if factor == 1:
+            return policy
+        return policy.with_overrides(
+            min_face_size=max(1, policy.min_face_size // factor),
+            max_face_size=max(1, policy.max_face_size // factor) if policy.max_face_size else None,
+        )
+    
+    @property
+    def backend(self) -> str:
+        """Encoding backend name used to label metrics"""
+        return "face_recognition" if USE_FACE_RECOGNITION else "opencv"
+    
+    @property
+    def encoding_backend(self) -> str:
+        """Packed-encoding backend tag of the vectors this service produces"""
+        return "dlib-128" if USE_FACE_RECOGNITION else "opencv-256"
+    
+    def pack_encoding(self, encoding: List[float], dtype: str = "float32") -> str:
+        """Base64 packed form of an encoding produced by this service"""
+        return pack_encoding_base64(encoding, dtype, self.encoding_backend)
+    
+    def load_encoding(self, value: Union[List[float], str, bytes]) -> Union[List[float], np.ndarray]:
+        """
+        A JSON float list as-is, or the float32 vector of a packed encoding (bytes or base64)
+        Packed encodings tagged with another backend or model version are rejected
+        """
+        if not isinstance(value, (str, bytes)):
+            return value
+        packed = unpack_encoding(value)
+        expected = (self.encoding_backend, MODEL_VERSIONS[self.encoding_backend])
+        if packed.backend != "unknown" and (packed.backend, packed.model_version) != expected:
+            raise ValueError(
+                f"Encoding was produced by {packed.backend} v{packed.model_version}, "
+                f"this service uses {expected[0]} v{expected[1]}"
+            )
+        return packed.vector
+    
+    def _load_candidates(self, known_encodings: List[Dict[str, Any]]) -> List[Tuple[Any, Any]]:
+        """
+        (user_id, encoding) pairs for the usable known_encodings entries
+        An entry that cannot be decoded, or was packed by another backend, is
+        logged and skipped so one stale enrollment cannot fail every login
+        """
+        candidates = []
+        for known_face in known_encodings:
+            if 'encoding' not in known_face or 'user_id' not in known_face:
+                continue
+            try:
+                candidates.append((known_face['user_id'], self.load_encoding(known_face['encoding'])))
+            except ValueError as e:
+                logger.warning("Skipping known encoding of user %s: %s", known_face['user_id'], e)
+        return candidates
+    
+    def locate_faces(self, image_np: np.ndarray, policy: Optional[DetectionPolicy] = None) -> List[Box]:
+        """Face boxes (x, y, w, h) for encoding, from encode_policy's detector unless policy overrides it"""
+        return self._detect(image_np, policy or self.encode_policy)
+    
+    def _detect(self, image_np: np.ndarray, policy: DetectionPolicy) -> List[Box]:
+        """Boxes from policy.detector in the coordinates of an RGB image"""
+        if policy.detector == "hog":
+            with timed_stage("detect"):
+                return detect_hog(face_recognition.face_locations, image_np, policy)
+        if policy.detector == "yunet":
+            with timed_stage("detect"):
+                return detect_yunet(MODELS.yunet(), image_np, policy)
+        with timed_stage("color"):
+            gray = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
+        with timed_stage("detect"):
+            return detect_haar(self.face_cascade, gray, policy)
+    
+    def encode_image(self, image_np: np.ndarray, policy: Optional[DetectionPolicy] = None,
+                     boxes: Optional[List[Box]] = None) -> Optional[List[float]]:
+        """
+        Extract a face encoding from a decoded RGB image
+        Pass boxes from locate_faces to skip detection
+        """
+        if boxes is None:
+            boxes = self.locate_faces(image_np, policy)
+        with timed_stage("encode"):
             if USE_FACE_RECOGNITION:
-                return self._encode_with_face_recognition(image_np)
+                return self._encode_with_face_recognition(image_np, boxes)
             else:
-                return self._encode_with_opencv(image_np)
-                
+                return self._encode_with_opencv(image_np, boxes)
+    
+    def encode_image_faces(self, image_np: np.ndarray, boxes: List[Box]) -> List[Optional[List[float]]]:
+        """
+        One encoding per box, in box order
+        face_recognition encodes all locations in a single face_encodings call;
+        the OpenCV fallback shares one grayscale conversion across the boxes
+        """
+        if len(boxes) == 0:
+            return []
+        with timed_stage("encode"):
+            if USE_FACE_RECOGNITION:
+                face_locations = [(y, x + w, y + h, x) for (x, y, w, h) in boxes]
+                return [encoding.tolist() for encoding in face_recognition.face_encodings(image_np, face_locations)]
+            gray = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
+            encodings = []
+            for box in boxes:
+                try:
+                    encodings.append(self._opencv_features(gray, box))
+                except Exception as e:
+                    logger.warning("Error in OpenCV encoding: %s", e)
+                    encodings.append(None)
+            return encodings
+    
+    def encode_batch(self, images: List[np.ndarray], boxes: List[Box]) -> List[Optional[List[float]]]:
+        """
+        One encoding per (RGB image, face box) pair, None where a face could not be encoded
+        All faces are encoded together: face_recognition in one face_encodings call over a mosaic of the faces,
+        the OpenCV fallback in one feature pass over the stacked face ROIs
+        """
+        if len(images) == 0:
+            return []
+        with timed_stage("encode"):
+            if USE_FACE_RECOGNITION:
+                return self._encode_batch_with_face_recognition(images, boxes)
+            return self._encode_batch_with_opencv(images, boxes)
+    
+    # Context kept around each face in the face_recognition mosaic, as a fraction of the larger box side;
+    # enough for the landmark predictor and the padded face chip to see what they would in the full image
+    MOSAIC_MARGIN = 0.5
+    
+    def _encode_batch_with_face_recognition(self, images: List[np.ndarray],
+                                            boxes: List[Box]) -> List[Optional[List[float]]]:
+        """Faces (with context) tiled side by side into one image, so a single face_encodings call encodes them all"""
+        try:
+            tiles, columns, locations, width = [], [], [], 0
+            for image_np, (x, y, w, h) in zip(images, boxes):
+                margin = int(self.MOSAIC_MARGIN * max(w, h))
+                top, left = max(0, y - margin), max(0, x - margin)
+                tile = image_np[top:y + h + margin, left:x + w + margin]
+                # Tile-local box shifted to the tile's column in the mosaic, as (top, right, bottom, left)
+                locations.append((y - top, width + x - left + w, y - top + h, width + x - left))
+                tiles.append(tile)
+                columns.append(width)
+                # A margin-wide gap keeps neighbouring faces out of each other's context
+                width += tile.shape[1] + margin
+            mosaic = np.zeros((max(tile.shape[0] for tile in tiles), width, 3), dtype=np.uint8)
+            for tile, column in zip(tiles, columns):
+                mosaic[:tile.shape[0], column:column + tile.shape[1]] = tile
+            return [encoding.tolist() for encoding in face_recognition.face_encodings(mosaic, locations)]
         except Exception as e:
-            print(f"Error encoding face: {e}")
-            return None
+            logger.warning("Error in face_recognition encoding: %s", e)
+            return [None] * len(images)
+    
+    def _encode_batch_with_opencv(self, images: List[np.ndarray], boxes: List[Box]) -> List[Optional[List[float]]]:
+        """Each face cut to its 128x128 ROI, then the features of all ROIs computed in one pass"""
+        rois, positions = [], []
+        for position, (image_np, box) in enumerate(zip(images, boxes)):
+            try:
+                rois.append(self._face_roi(cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY), box))
+                positions.append(position)
+            except Exception as e:
+                logger.warning("Error in OpenCV encoding: %s", e)
+        encodings: List[Optional[List[float]]] = [None] * len(images)
+        if rois:
+            for position, features in zip(positions, self._opencv_feature_batch(np.stack(rois))):
+                encodings[position] = features.tolist()
+        return encodings
+    
+    @staticmethod
+    def _primary_face(boxes: List[Box]) -> Box:
+        """The face encode_image encodes: the first for face_recognition, the largest for OpenCV"""
+        if USE_FACE_RECOGNITION:
+            return boxes[0]
+        return max(boxes, key=lambda box: box[2] * box[3])
+    
+    @staticmethod
+    def _full_resolution(boxes: List[Box], factor: int) -> List[Box]:
+        return [(int(x) * factor, int(y) * factor, int(w) * factor, int(h) * factor) for (x, y, w, h) in boxes]
+    
+    def encode_face_result(self, image_data: Union[str, bytes]) -> Dict[str, Any]:
+        """Encode one image, reporting decode and detection failures as a result dict"""
+        try:
+            image_np = self.decode_image(image_data)
+        except Exception as e:
+            return {"success": False, "encoding": None, "error": f"Invalid image: {e}"}
+        
+        try:
+            encoding = self.encode_image(image_np)
+        except Exception as e:
+            return {"success": False, "encoding": None, "error": f"Encoding failed: {e}"}
+        
+        if encoding is None:
+            return {"success": False, "encoding": None, "error": "No face detected in image"}
+        return {"success": True, "encoding": [float(value) for value in encoding], "error": None}
     
-    def _encode_with_face_recognition(self, image_np: np.ndarray) -> Optional[List[float]]:
+    def detect_faces(self, image_data: Union[str, bytes], return_crops: bool = False,
+                     decode_max_side: Optional[int] = None, policy: Optional[DetectionPolicy] = None,
+                     boxes: Optional[List[Box]] = None, crop_options: Optional[CropOptions] = None,
+                     encode_crops: bool = True) -> Dict[str, Any]:
+        """
+        Detect faces with detect_policy's detector (Haar unless configured or overridden)
+        Returns {faces: [(x, y, w, h), ...], crops: [encoded crop bytes, ...] or None, boxes}
+        faces are in full-resolution coordinates even when decoded at reduced size;
+        boxes are in decoded-image coordinates and, passed back in, skip detection.
+        Crops are cut from the decoded image as crop_options describes (JPEG boxes by default);
+        without encode_crops they are left as RGB arrays, so the caller can spread encode_crop calls across workers
+        """
+        img_np, factor = self._decode_image(image_data, decode_max_side)
+        
+        if boxes is None:
+            boxes = self._detect(img_np, self._policy_for_factor(policy or self.detect_policy, factor))
+        
+        crops = None
+        if return_crops:
+            options = crop_options or CropOptions()
+            with timed_stage("crop"):
+                if encode_crops:
+                    crops = self.crop_faces(img_np, boxes, options)
+                else:
+                    crops = [cut_crop(img_np, box, options) for box in boxes]
+        
+        return {
+            "faces": self._full_resolution(boxes, factor),
+            "crops": crops,
+            "boxes": [tuple(int(v) for v in box) for box in boxes],
+        }
+    
+    def crop_faces(self, img_np: np.ndarray, boxes: List[Box], options: CropOptions) -> List[bytes]:
+        """Each box cut from an RGB image and encoded per options"""
+        return [encode_crop(cut_crop(img_np, box, options), options) for box in boxes]
+    
+    def encode_crop(self, crop: np.ndarray, options: CropOptions) -> bytes:
+        """One crop cut by detect_faces(encode_crops=False), encoded per options"""
+        with timed_stage("crop"):
+            return encode_crop(crop, options)
+    
+    def _encode_with_face_recognition(self, image_np: np.ndarray, boxes: List[Box]) -> Optional[List[float]]:
         """Use face_recognition library for encoding (recommended)"""
         try:
-            # Find face locations
-            face_locations = face_recognition.face_locations(image_np)
-            
-            if len(face_locations) == 0:
+            if len(boxes) == 0:
                 return None
             
+            face_locations = [(y, x + w, y + h, x) for (x, y, w, h) in boxes]
+            
             # Get face encodings (use first face if multiple detected)
             face_encodings = face_recognition.face_encodings(image_np, face_locations)
-
-            print(face_encodings)
             
             if len(face_encodings) == 0:
                 return None
@@ -63,123 +435,129 @@ class FaceService:
             return face_encodings[0].tolist()
             
         except Exception as e:
-            print(f"Error in face_recognition encoding: {e}")
+            logger.warning("Error in face_recognition encoding: %s", e)
             return None
     
-    def _encode_with_opencv(self, image_np: np.ndarray) -> Optional[List[float]]:
+    def _encode_with_opencv(self, image_np: np.ndarray, boxes: List[Box]) -> Optional[List[float]]:
         """Fallback OpenCV-based encoding"""
         try:
-            # Convert to grayscale for face detection
+            # Convert to grayscale for feature extraction
             gray = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
             
-            # Detect faces with better parameters
-            faces = self.face_cascade.detectMultiScale(
-                gray, 
-                scaleFactor=1.05,
-                minNeighbors=5,
-                minSize=(100, 100),
-                maxSize=(500, 500)
-            )
-            
-            if len(faces) == 0:
+            if len(boxes) == 0:
                 return None
                 
             # Use the largest face
-            face = max(faces, key=lambda x: x[2] * x[3])  # x, y, w, h
-            x, y, w, h = face
-            
-            # Add padding around face
-            padding = int(0.2 * min(w, h))
-            x = max(0, x - padding)
-            y = max(0, y - padding)
-            w = min(gray.shape[1] - x, w + 2 * padding)
-            h = min(gray.shape[0] - y, h + 2 * padding)
-            
-            # Extract face region
-            face_roi = gray[y:y+h, x:x+w]
-            
-            # Normalize and resize
-            face_roi = cv2.equalizeHist(face_roi)
-            face_roi = cv2.resize(face_roi, (128, 128))
-            
-            # Enhanced feature extraction
-            features = []
-            
-            # 1. Histogram features
-            hist = cv2.calcHist([face_roi], [0], None, [32], [0, 256])
-            hist = hist.flatten() / (hist.sum() + 1e-7)
-            features.extend(hist)
-            
-            # 2. Gradient features
-            grad_x = cv2.Sobel(face_roi, cv2.CV_64F, 1, 0, ksize=3)
-            grad_y = cv2.Sobel(face_roi, cv2.CV_64F, 0, 1, ksize=3)
-            
-            grad_features = [
-                grad_x.mean(), grad_x.std(), grad_x.min(), grad_x.max(),
-                grad_y.mean(), grad_y.std(), grad_y.min(), grad_y.max()
-            ]
-            features.extend(grad_features)
-            
-            # 3. LBP (Local Binary Pattern) features
-            lbp_features = self._compute_lbp_features(face_roi)
-            features.extend(lbp_features)
-            
-            # 4. Eigenface-like features (PCA on patches)
-            patch_features = self._compute_patch_features(face_roi)
-            features.extend(patch_features)
-            
-            # Ensure consistent dimensionality
-            target_dim = 256
-            if len(features) < target_dim:
-                features.extend([0.0] * (target_dim - len(features)))
-            else:
-                features = features[:target_dim]
-            
-            return features
+            face = max(boxes, key=lambda x: x[2] * x[3])  # x, y, w, h
+            return self._opencv_features(gray, face)
             
         except Exception as e:
-            print(f"Error in OpenCV encoding: {e}")
+            logger.warning("Error in OpenCV encoding: %s", e)
             return None
     
+    def _opencv_features(self, gray: np.ndarray, face: Box) -> List[float]:
+        """256-d histogram/gradient/LBP/patch features of one face box in a grayscale image"""
+        return self._opencv_feature_batch(self._face_roi(gray, face)[np.newaxis])[0].tolist()
+    
+    @staticmethod
+    def _face_roi(gray: np.ndarray, face: Box) -> np.ndarray:
+        """The padded face box, histogram-equalized and resized to the 128x128 the features are computed on"""
+        x, y, w, h = face
+        # Add padding around face
+        padding = int(0.2 * min(w, h))
+        x = max(0, x - padding)
+        y = max(0, y - padding)
+        w = min(gray.shape[1] - x, w + 2 * padding)
+        h = min(gray.shape[0] - y, h + 2 * padding)
+        
+        # Normalize and resize
+        face_roi = cv2.equalizeHist(gray[y:y+h, x:x+w])
+        return cv2.resize(face_roi, (128, 128))
+    
+    def _opencv_feature_batch(self, rois: np.ndarray) -> np.ndarray:
+        """
+        Features of a stack of (N, 128, 128) face ROIs as an (N, 256) array, one row per face
+        Every step works on the whole stack, so a micro-batch costs one pass rather than N
+        """
+        # 1. Histogram features: 32 equal bins over [0, 256) are exactly value // 8
+        hist = self._row_histograms(rois >> 3).astype(np.float32)
+        hist = hist / (hist.sum(axis=1, keepdims=True) + 1e-7)
+        
+        # 2. Gradient features: 3x3 Sobel with OpenCV's default reflect-101 border
+        padded = np.pad(rois.astype(np.float64), ((0, 0), (1, 1), (1, 1)), mode="reflect")
+        smooth_rows = padded[:, :-2] + 2 * padded[:, 1:-1] + padded[:, 2:]
+        smooth_cols = padded[:, :, :-2] + 2 * padded[:, :, 1:-1] + padded[:, :, 2:]
+        grad_x = smooth_rows[:, :, 2:] - smooth_rows[:, :, :-2]
+        grad_y = smooth_cols[:, 2:] - smooth_cols[:, :-2]
+        grad_features = np.stack([
+            grad_x.mean(axis=(1, 2)), grad_x.std(axis=(1, 2)), grad_x.min(axis=(1, 2)), grad_x.max(axis=(1, 2)),
+            grad_y.mean(axis=(1, 2)), grad_y.std(axis=(1, 2)), grad_y.min(axis=(1, 2)), grad_y.max(axis=(1, 2))
+        ], axis=1)
+        
+        # 3. LBP (Local Binary Pattern) features
+        lbp_features = self._lbp_histograms(rois)
+        
+        # 4. Eigenface-like features (PCA on patches)
+        patch_features = self._patch_statistics(rois)
+        
+        # Ensure consistent dimensionality
+        features = np.concatenate([hist, grad_features, lbp_features, patch_features], axis=1)[:, :256]
+        return np.pad(features, ((0, 0), (0, 256 - features.shape[1])))
+    
+    @staticmethod
+    def _row_histograms(bins: np.ndarray, minlength: int = 32) -> np.ndarray:
+        """Per-row bincount of a stack of small non-negative integer arrays, as an (N, minlength) array"""
+        rows = bins.reshape(len(bins), -1).astype(np.intp)
+        offsets = np.arange(len(bins), dtype=np.intp)[:, np.newaxis] * minlength
+        return np.bincount((rows + offsets).ravel(), minlength=len(bins) * minlength).reshape(len(bins), minlength)
+    
+    # Neighbour offsets in bit order: bit k is set when neighbour k is brighter than the centre
+    LBP_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+    
     def _compute_lbp_features(self, face_roi: np.ndarray) -> List[float]:
         """Compute Local Binary Pattern features"""
-        lbp_values = []
-        height, width = face_roi.shape
+        return self._lbp_histograms(face_roi[np.newaxis])[0].tolist()
+    
+    def _lbp_histograms(self, rois: np.ndarray) -> np.ndarray:
+        """32-bin LBP code histograms of a stack of (N, H, W) ROIs, as an (N, 32) array"""
+        _, height, width = rois.shape
+        center = rois[:, 1:height - 1, 1:width - 1]
+        codes = np.zeros(center.shape, dtype=np.uint8)
         
-        for i in range(1, height - 1):
-            for j in range(1, width - 1):
-                center = face_roi[i, j]
-                code = 0
-                for k, (di, dj) in enumerate([(-1,-1), (-1,0), (-1,1), (0,1), (1,1), (1,0), (1,-1), (0,-1)]):
-                    if face_roi[i+di, j+dj] > center:
-                        code += 2 ** k
-                lbp_values.append(code)
+        # One shifted comparison per neighbour instead of a per-pixel loop
+        for k, (di, dj) in enumerate(self.LBP_OFFSETS):
+            neighbour = rois[:, 1 + di:height - 1 + di, 1 + dj:width - 1 + dj]
+            codes |= (neighbour > center).astype(np.uint8) << k
         
-        # Create histogram of LBP values
-        hist, _ = np.histogram(lbp_values, bins=32, range=(0, 256))
-        hist = hist / (hist.sum() + 1e-7)
-        return hist.tolist()
+        # 32 equal bins over [0, 256) are exactly code // 8
+        hist = self._row_histograms(codes >> 3)
+        return hist / (hist.sum(axis=1, keepdims=True) + 1e-7)
     
-    def _compute_patch_features(self, face_roi: np.ndarray) -> List[float]:
+    def _compute_patch_features(self, face_roi: np.ndarray, patch_size: int = 16, max_features: int = 64) -> List[float]:
         """Compute patch-based features"""
-        patches = []
-        patch_size = 16
-        height, width = face_roi.shape
+        return self._patch_statistics(face_roi[np.newaxis], patch_size, max_features)[0].tolist()
+    
+    @staticmethod
+    def _patch_statistics(rois: np.ndarray, patch_size: int = 16, max_features: int = 64) -> np.ndarray:
+        """Patch mean/std/min/max of a stack of (N, H, W) ROIs, as an (N, <= max_features) array"""
+        count, height, width = rois.shape
+        if height <= patch_size or width <= patch_size:
+            return np.zeros((count, 0))
         
-        for i in range(0, height - patch_size, patch_size // 2):
-            for j in range(0, width - patch_size, patch_size // 2):
-                patch = face_roi[i:i+patch_size, j:j+patch_size]
-                if patch.shape == (patch_size, patch_size):
-                    # Simple statistics for each patch
-                    patches.extend([
-                        patch.mean(),
-                        patch.std(),
-                        patch.min(),
-                        patch.max()
-                    ])
+        # Half-overlapping patches in row-major order; only the first few survive the
+        # feature limit, so statistics are computed for just those
+        step = patch_size // 2
+        windows = np.lib.stride_tricks.sliding_window_view(rois, (patch_size, patch_size), axis=(1, 2))
+        windows = windows[:, :height - patch_size:step, :width - patch_size:step]
+        patches = windows.reshape(count, -1, patch_size, patch_size)[:, :-(-max_features // 4)]
         
-        # Limit to reasonable number of features
-        return patches[:64]
+        stats = np.stack([
+            patches.mean(axis=(2, 3)),
+            patches.std(axis=(2, 3)),
+            patches.min(axis=(2, 3)),
+            patches.max(axis=(2, 3))
+        ], axis=2)
+        return stats.reshape(count, -1)[:, :max_features]
     
     def compare_faces(self, known_encoding: List[float], unknown_encoding: List[float]) -> Dict[str, Any]:
         """
@@ -193,7 +571,7 @@ class FaceService:
                 return self._compare_with_cosine_similarity(known_encoding, unknown_encoding)
                 
         except Exception as e:
-            print(f"Error comparing faces: {e}")
+            logger.warning("Error comparing faces: %s", e)
             return {
                 "match": False,
                 "confidence": 0.0,
@@ -212,16 +590,16 @@ class FaceService:
             
             match = matches[0] if matches else False
             distance = float(distances[0]) if distances.size > 0 else 1.0
-            confidence = max(0, 1 - distance)
+            confidence, _ = match_scores(distance, "euclidean", self.tolerance)
             
             return {
                 "match": match,
-                "confidence": confidence,
+                "confidence": float(confidence),
                 "distance": distance
             }
             
         except Exception as e:
-            print(f"Error in face_recognition comparison: {e}")
+            logger.warning("Error in face_recognition comparison: %s", e)
             return self._compare_with_cosine_similarity(known_encoding, unknown_encoding)
     
     def _compare_with_cosine_similarity(self, known_encoding: List[float], unknown_encoding: List[float]) -> Dict[str, Any]:
@@ -254,29 +632,26 @@ class FaceService:
                 similarity = dot_product / (norm_known * norm_unknown)
             
             distance = 1 - similarity
-            confidence = max(0, similarity)
-            
-            # Adjust threshold for OpenCV features
-            threshold = 0.3 if USE_FACE_RECOGNITION else 0.7
-            match = confidence >= threshold
+            confidence, match = match_scores(similarity, "cosine", self._threshold("cosine"))
             
             return {
-                "match": match,
+                "match": bool(match),
                 "confidence": float(confidence),
                 "distance": float(distance)
             }
             
         except Exception as e:
-            print(f"Error in cosine similarity comparison: {e}")
+            logger.warning("Error in cosine similarity comparison: %s", e)
             return {
                 "match": False,
                 "confidence": 0.0,
                 "distance": 1.0
             }
     
-    def authenticate_face(self, probe_image: str, known_encodings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def authenticate_face(self, probe_image: str, known_encodings: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
         """
         Authenticate a face against multiple known encodings
+        Matches against the resident gallery when known_encodings is None
         Returns authentication result with best match
         """
         try:
@@ -288,57 +663,332 @@ class FaceService:
                     "error": "No face detected in probe image"
                 }
             
-            if not known_encodings:
+            return self.match_encoding(probe_encoding, known_encodings)
+                
+        except Exception as e:
+            logger.error("Error in face authentication: %s", e)
+            return {
+                "success": False,
+                "error": f"Authentication failed: {str(e)}"
+            }
+    
+    def match_encoding(self, probe_encoding: List[float], known_encodings: Optional[List[Dict[str, Any]]] = None,
+                       gallery: Optional[FaceGallery] = None) -> Dict[str, Any]:
+        """
+        Match an already-computed probe encoding against known encodings
+        (or, when known_encodings is None, against gallery: the resident gallery by default)
+        """
+        gallery = gallery if gallery is not None else self.gallery
+        try:
+            if known_encodings is None:
+                user_ids, encodings = gallery.snapshot()
+                candidate_count = len(user_ids)
+            else:
+                candidates = self._load_candidates(known_encodings)
+                candidate_count = len(candidates)
+            
+            if candidate_count == 0:
                 return {
                     "success": False,
                     "error": "No known faces to compare against"
                 }
             
-            best_match = None
-            best_confidence = 0.0
-            
-            print(f"Comparing against {len(known_encodings)} known faces")
+            logger.debug("Comparing against %d known faces", candidate_count)
+            with timed_stage("match"):
+                if known_encodings is None:
+                    best_match = self._find_best_match(probe_encoding, user_ids, encodings, gallery)
+                else:
+                    best_match = self._find_best_match_in(probe_encoding, candidates)
             
-            # Compare against all known faces
-            for i, known_face in enumerate(known_encodings):
-                if 'encoding' not in known_face or 'user_id' not in known_face:
-                    continue
+            return self._match_result(best_match)
                 
-                try:
-                    comparison = self.compare_faces(known_face['encoding'], probe_encoding)
-                    print(f"User {known_face['user_id']}: confidence={comparison['confidence']:.3f}, match={comparison['match']}")
-                    
-                    if comparison['match'] and comparison['confidence'] > best_confidence:
-                        best_match = {
-                            "user_id": known_face['user_id'],
-                            "confidence": comparison['confidence'],
-                            "distance": comparison['distance']
-                        }
-                        best_confidence = comparison['confidence']
-                except Exception as e:
-                    print(f"Error comparing with user {known_face.get('user_id', 'unknown')}: {e}")
-                    continue
-            
-            if best_match and best_confidence >= 0.5:
-                print(f"Best match: User {best_match['user_id']} with confidence {best_match['confidence']:.3f}")
-                return {
-                    "success": True,
-                    "authenticated": True,
-                    "user_id": best_match['user_id'],
-                    "confidence": best_match['confidence'],
-                    "distance": best_match['distance']
-                }
+        except Exception as e:
+            logger.error("Error matching face encoding: %s", e)
+            return {
+                "success": False,
+                "error": f"Authentication failed: {str(e)}"
+            }
+    
+    def match_encodings(self, probe_encodings: List[List[float]]) -> List[Dict[str, Any]]:
+        """
+        match_encoding against the resident gallery for several probes at once
+        A gallery scanned in full is scored for every probe in one matrix product;
+        behind an ANN index, or for a probe of another dimension, probes are matched one by one
+        """
+        user_ids, encodings = self.gallery.snapshot()
+        if not user_ids or self.gallery.uses_index():
+            return [self.match_encoding(probe) for probe in probe_encodings]
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(probe_encodings)
+        batched = [i for i, probe in enumerate(probe_encodings) if len(probe) == encodings.dimension]
+        if batched:
+            try:
+                with timed_stage("match"):
+                    probes = np.asarray([probe_encodings[i] for i in batched], dtype=np.float32)
+                    confidences, matches = self._match_matrix(probes, encodings)
+                    for i, row_confidences, row_matches in zip(batched, confidences, matches):
+                        best_match = None
+                        row = best_candidate(row_confidences, row_matches)
+                        if row is not None:
+                            # Re-score the winner exactly so reported values match compare_faces
+                            comparison = self.compare_faces(encodings.matrix[row], probe_encodings[i])
+                            if comparison['match']:
+                                best_match = {"user_id": user_ids[row], "confidence": comparison['confidence'],
+                                              "distance": comparison['distance']}
+                        results[i] = self._match_result(best_match)
+            except Exception as e:
+                logger.error("Error matching face encodings: %s", e)
+                for i in batched:
+                    results[i] = {"success": False, "error": f"Authentication failed: {str(e)}"}
+        return [result if result is not None else self.match_encoding(probe)
+                for result, probe in zip(results, probe_encodings)]
+    
+    @staticmethod
+    def _match_result(best_match: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """match_encoding's response for the best compare_faces match (or None)"""
+        if best_match and best_match['confidence'] >= MIN_AUTH_CONFIDENCE:
+            logger.debug("Best match: user %s with confidence %.3f", best_match['user_id'], best_match['confidence'])
+            return {
+                "success": True,
+                "authenticated": True,
+                "user_id": best_match['user_id'],
+                "confidence": best_match['confidence'],
+                "distance": best_match['distance']
+            }
+        logger.debug("No matching face found")
+        return {
+            "success": True,
+            "authenticated": False,
+            "error": "No matching face found"
+        }
+    
+    def authenticate_faces(self, probe_image: Union[str, bytes],
+                           known_encodings: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Group check-in: identify every face in one image
+        Returns {success, faces: [{box, authenticated, user_id, confidence, distance}]}
+        with boxes in full-resolution (x, y, w, h); no user is matched to two faces
+        """
+        try:
+            analysis = self.analyze_faces(probe_image)
+            if not analysis["faces"]:
+                return {"success": False, "error": "No face detected in probe image"}
+            result = self.identify_encodings(analysis["encodings"], known_encodings)
+            if result["success"]:
+                for face, box in zip(result["faces"], analysis["faces"]):
+                    face["box"] = box
+            return result
+        except Exception as e:
+            logger.error("Error in group authentication: %s", e)
+            return {"success": False, "error": f"Authentication failed: {str(e)}"}
+    
+    def identify_encodings(self, probe_encodings: List[Optional[List[float]]],
+                           known_encodings: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Match several probe encodings from one image at once
+        All probes are scored against the candidates in one matrix product and
+        assigned one-to-one in descending confidence. Returns
+        {success, faces: [{authenticated, user_id, confidence, distance}]} in probe order;
+        a None probe (face that could not be encoded) is never authenticated.
+        """
+        try:
+            if known_encodings is None:
+                user_ids, encodings = self.gallery.snapshot()
+                candidate_count = len(user_ids)
             else:
-                print("No matching face found")
+                candidates = self._load_candidates(known_encodings)
+                candidate_count = len(candidates)
+            
+            if candidate_count == 0:
                 return {
-                    "success": True,
-                    "authenticated": False,
-                    "error": "No matching face found"
+                    "success": False,
+                    "error": "No known faces to compare against"
                 }
-                
+            
+            present = [i for i, encoding in enumerate(probe_encodings) if encoding is not None]
+            matches: List[Optional[Dict[str, Any]]] = [None] * len(probe_encodings)
+            if present:
+                probes = np.asarray([probe_encodings[i] for i in present], dtype=np.float32)
+                logger.debug("Comparing %d faces against %d known faces", len(present), candidate_count)
+                with timed_stage("match"):
+                    if known_encodings is None:
+                        found = self._assign_in_gallery(probes, user_ids, encodings)
+                    else:
+                        found = self._assign_in(probes, candidates)
+                for i, match in zip(present, found):
+                    matches[i] = match
+            
+            faces = []
+            for match in matches:
+                if match and match['confidence'] >= MIN_AUTH_CONFIDENCE:
+                    faces.append({"authenticated": True, **match})
+                else:
+                    faces.append({"authenticated": False, "user_id": None, "confidence": None, "distance": None})
+            return {"success": True, "faces": faces}
+        
         except Exception as e:
-            print(f"Error in face authentication: {e}")
+            logger.error("Error matching face encodings: %s", e)
             return {
                 "success": False,
                 "error": f"Authentication failed: {str(e)}"
-            }
\ No newline at end of file
+            }
+    
+    def _match_matrix(self, probes: np.ndarray, encodings: EncodingMatrix) -> Tuple[np.ndarray, np.ndarray]:
+        """(confidences, matches) for every probe/row pair, with _best_row's semantics"""
+        if self._uses_euclidean(encodings.dimension, probes.shape[1]):
+            return match_scores(encodings.euclidean_distance_matrix(probes), "euclidean", self._threshold("euclidean"))
+        return match_scores(encodings.cosine_similarity_matrix(probes), "cosine", self._threshold("cosine"))
+    
+    def _score_matrix(self, probes: np.ndarray, encodings: EncodingMatrix) -> Tuple[np.ndarray, np.ndarray]:
+        """(confidences, eligible) for one-to-one assignment"""
+        confidences, eligible = self._match_matrix(probes, encodings)
+        # Pairs below the authentication threshold must not claim a user another face could take
+        return confidences, eligible & (confidences >= MIN_AUTH_CONFIDENCE)
+    
+    def _assign_in_gallery(self, probes: np.ndarray, user_ids: List[Any],
+                           encodings: EncodingMatrix) -> List[Optional[Dict[str, Any]]]:
+        """One-to-one matches of probes over a stacked gallery whose rows line up with user_ids"""
+        if len(encodings) == 0:
+            return [None] * len(probes)
+        
+        # Large galleries: re-rank the union of every probe's ANN shortlist exactly
+        metric = "euclidean" if self._uses_euclidean(encodings.dimension, probes.shape[1]) else "cosine"
+        shortlisted: Dict[Any, np.ndarray] = {}
+        for probe in probes:
+            shortlist = self.gallery.candidates(probe, metric)
+            if shortlist is None:
+                shortlisted = None
+                break
+            shortlist_ids, shortlist_encodings = shortlist
+            for user_id, row in zip(shortlist_ids, shortlist_encodings.matrix):
+                shortlisted.setdefault(user_id, row)
+        if shortlisted is not None:
+            if not shortlisted:
+                return [None] * len(probes)
+            user_ids = list(shortlisted)
+            encodings = EncodingMatrix(np.stack(list(shortlisted.values())))
+        
+        confidences, eligible = self._score_matrix(probes, encodings)
+        # Gallery user ids are distinct, so only each probe's top len(probes) rows can be assigned
+        columns = top_columns(confidences, eligible, len(probes))
+        assigned = assign_one_to_one(confidences[:, columns], eligible[:, columns],
+                                     [user_ids[column] for column in columns])
+        return [
+            None if position is None else
+            self._rescore(probe, user_ids[columns[position]], encodings.matrix[columns[position]])
+            for probe, position in zip(probes, assigned)
+        ]
+    
+    def _assign_in(self, probes: np.ndarray, candidates: List[Tuple[Any, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """One-to-one matches of probes over (user_id, encoding) pairs, batched per encoding dimension"""
+        groups = list(group_by_dimension(candidates).values())
+        if not groups:
+            return [None] * len(probes)
+        scored = [self._score_matrix(probes, encodings) for _, _, encodings in groups]
+        # Columns in original candidate order so ties still resolve to the earliest candidate
+        positions = np.concatenate([np.asarray(group_positions) for _, group_positions, _ in groups])
+        order = np.argsort(positions, kind="stable")
+        confidences = np.concatenate([c for c, _ in scored], axis=1)[:, order]
+        eligible = np.concatenate([e for _, e in scored], axis=1)[:, order]
+        user_ids = [user_id for group_ids, _, _ in groups for user_id in group_ids]
+        rows = [row for _, _, encodings in groups for row in encodings.matrix]
+        user_ids = [user_ids[i] for i in order]
+        rows = [rows[i] for i in order]
+        
+        assigned = assign_one_to_one(confidences, eligible, user_ids)
+        return [
+            None if position is None else self._rescore(probe, user_ids[position], rows[position])
+            for probe, position in zip(probes, assigned)
+        ]
+    
+    def _rescore(self, probe: np.ndarray, user_id: Any, known: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Exact compare_faces values for an assigned pair, so reports match the single-face path"""
+        comparison = self.compare_faces(known, probe.tolist())
+        if not comparison['match']:
+            return None
+        return {"user_id": user_id, "confidence": comparison['confidence'], "distance": comparison['distance']}
+    
+    def build_gallery_index(self) -> None:
+        """(Re)train the gallery's ANN index with the metric matching uses for its encodings"""
+        dimension = self.gallery.dimension
+        if dimension is None:
+            raise ValueError("Gallery is empty")
+        metric = "euclidean" if self._uses_euclidean(dimension, dimension) else "cosine"
+        self.gallery.build_index(metric)
+    
+    def _threshold(self, metric: str) -> float:
+        """Match threshold for metric: the tolerance for distances, the backend's cosine threshold otherwise"""
+        return self.tolerance if metric == "euclidean" else cosine_threshold(USE_FACE_RECOGNITION)
+    
+    def _uses_euclidean(self, known_dim: int, probe_dim: int) -> bool:
+        """Mirror compare_faces: dlib vectors use face_distance, everything else cosine"""
+        return USE_FACE_RECOGNITION and known_dim == 128 and probe_dim == 128
+    
+    def _best_row(self, probe_encoding: List[float], encodings: EncodingMatrix) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """
+        Score the probe against every row of encodings in one matrix op
+        Returns (row, comparison) for the best match with compare_faces semantics, or None
+        """
+        probe = np.asarray(probe_encoding, dtype=np.float32)
+        
+        if self._uses_euclidean(encodings.dimension, probe.size):
+            confidences, matches = match_scores(encodings.euclidean_distances(probe), "euclidean",
+                                                self._threshold("euclidean"))
+        else:
+            confidences, matches = match_scores(encodings.cosine_similarities(probe), "cosine",
+                                                self._threshold("cosine"))
+        
+        row = best_candidate(confidences, matches)
+        if row is None:
+            return None
+        
+        # Re-score the winner exactly so reported values match compare_faces
+        comparison = self.compare_faces(encodings.matrix[row], probe_encoding)
+        if not comparison['match']:
+            return None
+        return row, comparison
+    
+    def _find_best_match(self, probe_encoding: List[float], user_ids: List[Any], encodings: EncodingMatrix,
+                         gallery: Optional[FaceGallery] = None) -> Optional[Dict[str, Any]]:
+        """Best match over a stacked gallery (self.gallery by default) whose rows line up with user_ids"""
+        if len(encodings) == 0:
+            return None
+        
+        # Large galleries: let the ANN index pick a shortlist, then re-rank it exactly
+        probe = np.asarray(probe_encoding, dtype=np.float32)
+        metric = "euclidean" if self._uses_euclidean(encodings.dimension, probe.size) else "cosine"
+        shortlist = (gallery if gallery is not None else self.gallery).candidates(probe, metric)
+        if shortlist is not None:
+            user_ids, encodings = shortlist
+            if len(encodings) == 0:
+                return None
+        
+        best = self._best_row(probe_encoding, encodings)
+        if best is None:
+            return None
+        row, comparison = best
+        return {
+            "user_id": user_ids[row],
+            "confidence": comparison['confidence'],
+            "distance": comparison['distance']
+        }
+    
+    def _find_best_match_in(self, probe_encoding: List[float], candidates: List[Tuple[Any, Any]]) -> Optional[Dict[str, Any]]:
+        """Best match over (user_id, encoding) pairs, batched per encoding dimension"""
+        best_match = None
+        best_position = None
+        for user_ids, positions, encodings in group_by_dimension(candidates).values():
+            best = self._best_row(probe_encoding, encodings)
+            if best is None:
+                continue
+            row, comparison = best
+            confidence = comparison['confidence']
+            if (best_match is None or confidence > best_match['confidence']
+                    or (confidence == best_match['confidence'] and positions[row] < best_position)):
+                best_match = {
+                    "user_id": user_ids[row],
+                    "confidence": confidence,
+                    "distance": comparison['distance']
+                }
+                best_position = positions[row]
+        return best_match
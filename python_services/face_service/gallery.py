@@ -0,0 +1,315 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .ann import IVFFlatIndex, PQIndex
+from .log import get_logger
+from .matching import EncodingMatrix
+
+logger = get_logger(__name__)
+
+
+class FaceGallery:
+    """
+    Resident store of enrolled face encodings keyed by user_id.
+    Encodings live in one contiguous float32 matrix so matching can scan
+    the whole gallery without re-parsing anything per request. An optional
+    ANN index narrows large galleries down to a few candidates per probe.
+    The index trains off the request path: until it is trained, candidates()
+    starts training in a background thread and callers scan exactly.
+    """
+
+    def __init__(self, initial_capacity: int = 1024, index: Optional[Union[IVFFlatIndex, PQIndex]] = None,
+                 index_min_size: int = 10000, rerank_k: int = 32, change_log_size: int = 4096):
+        self.index = index
+        # Below this size an exact scan is cheap enough that the index is skipped
+        self.index_min_size = index_min_size
+        self.rerank_k = rerank_k
+        self._lock = threading.RLock()
+        self._capacity = max(1, initial_capacity)
+        self._matrix: Optional[np.ndarray] = None
+        self._sq_norms: Optional[np.ndarray] = None
+        self._user_ids: List[Any] = []
+        self._rows: Dict[Any, int] = {}
+        # Bumped on every change, so galleries derived with subset() can tell they are stale
+        self.version = 0
+        # (version, user_id) per recent upsert/remove, so derived galleries can catch up row by row;
+        # versions up to _log_floor are not covered (contents replaced wholesale)
+        self._change_log: deque = deque(maxlen=change_log_size)
+        self._log_floor = 0
+        # Bumped when the contents are replaced wholesale, which voids an index being trained
+        self._index_generation = 0
+        # User ids changed while an index trains outside the lock, replayed into it before it goes live
+        self._index_changes: Optional[set] = None
+        self._index_build_lock = threading.Lock()
+        self._index_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._user_ids)
+
+    def __contains__(self, user_id: Any) -> bool:
+        return user_id in self._rows
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return None if self._matrix is None else self._matrix.shape[1]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """(N, D) float32 view over the enrolled encodings, in row order"""
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[:len(self._user_ids)]
+
+    @property
+    def user_ids(self) -> List[Any]:
+        return list(self._user_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the encoding and norm arrays, spare capacity included"""
+        if self._matrix is None:
+            return 0
+        return self._matrix.nbytes + self._sq_norms.nbytes
+
+    def subset(self, user_ids: List[Any]) -> "FaceGallery":
+        """
+        A new gallery holding a contiguous copy of the listed users' rows, in list order
+        Users that are not enrolled are skipped; the copy has no ANN index
+        """
+        with self._lock:
+            rows = [self._rows[user_id] for user_id in dict.fromkeys(user_ids) if user_id in self._rows]
+            gallery = FaceGallery(initial_capacity=max(1, len(rows)))
+            if rows:
+                gallery.adopt([self._user_ids[row] for row in rows], self._matrix[rows], self._sq_norms[rows])
+            return gallery
+
+    def snapshot(self) -> Tuple[List[Any], EncodingMatrix]:
+        """(user_ids, EncodingMatrix) taken under the lock; rows line up with ids"""
+        with self._lock:
+            size = len(self._user_ids)
+            if size == 0:
+                return [], EncodingMatrix(np.empty((0, 0), dtype=np.float32))
+            return list(self._user_ids), EncodingMatrix(self._matrix[:size], self._sq_norms[:size])
+
+    def get(self, user_id: Any) -> Optional[List[float]]:
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                return None
+            return self._matrix[row].tolist()
+
+    def upsert(self, user_id: Any, encoding: List[float]) -> bool:
+        """
+        Enroll or replace the encoding for user_id
+        Returns True if the user was newly enrolled, False if updated
+        """
+        vector = np.asarray(encoding, dtype=np.float32).ravel()
+        if vector.size == 0:
+            raise ValueError("Encoding must not be empty")
+
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self._capacity, vector.size), dtype=np.float32)
+                self._sq_norms = np.zeros(self._capacity, dtype=np.float32)
+            elif vector.size != self._matrix.shape[1]:
+                raise ValueError(
+                    f"Encoding has {vector.size} dimensions, gallery expects {self._matrix.shape[1]}"
+                )
+
+            self._log_change(user_id)
+            if self._index_changes is not None:
+                self._index_changes.add(user_id)
+            if self.index is not None and self.index.is_trained:
+                self.index.add(user_id, vector)
+
+            row = self._rows.get(user_id)
+            if row is not None:
+                self._set_row(row, vector)
+                return False
+
+            row = len(self._user_ids)
+            if row == self._matrix.shape[0]:
+                self._grow()
+            self._set_row(row, vector)
+            self._user_ids.append(user_id)
+            self._rows[user_id] = row
+            return True
+
+    def remove(self, user_id: Any) -> bool:
+        """Remove user_id, moving the last row into the hole to stay contiguous"""
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            if row is None:
+                return False
+            self._log_change(user_id)
+            if self._index_changes is not None:
+                self._index_changes.add(user_id)
+            if self.index is not None:
+                self.index.remove(user_id)
+
+            last = len(self._user_ids) - 1
+            if row != last:
+                moved_id = self._user_ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._user_ids[row] = moved_id
+                self._rows[moved_id] = row
+            self._user_ids.pop()
+
+            if not self._user_ids:
+                # Allow a different dimension once the gallery is empty again
+                self._matrix = None
+                self._sq_norms = None
+                self._index_generation += 1
+                if self.index is not None:
+                    self.index.reset()
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._log_floor = self.version
+            self._index_generation += 1
+            if self.index is not None:
+                self.index.reset()
+            self._matrix = None
+            self._sq_norms = None
+            self._user_ids = []
+            self._rows = {}
+
+    def adopt(self, user_ids: List[Any], matrix: np.ndarray, sq_norms: np.ndarray) -> None:
+        """
+        Replace the contents with pre-built arrays without copying them
+        (e.g. a memory-mapped snapshot). Rows beyond len(user_ids) are spare
+        capacity that enrollments fill before the matrix has to grow.
+        """
+        if len(matrix) < len(user_ids) or len(sq_norms) != len(matrix):
+            raise ValueError("Snapshot arrays are smaller than their user_id list")
+        with self._lock:
+            self.version += 1
+            self._log_floor = self.version
+            self._index_generation += 1
+            if self.index is not None:
+                self.index.reset()
+            self._matrix = matrix if len(user_ids) else None
+            self._sq_norms = sq_norms if len(user_ids) else None
+            self._user_ids = list(user_ids)
+            self._rows = {user_id: row for row, user_id in enumerate(self._user_ids)}
+
+    def changes_since(self, version: int) -> Optional[set]:
+        """
+        User ids upserted or removed after version, or None when that is no longer
+        known (the contents were replaced since, or the change log has moved on)
+        """
+        with self._lock:
+            floor = self._log_floor
+            if len(self._change_log) == self._change_log.maxlen:
+                floor = max(floor, self._change_log[0][0] - 1)
+            if version < floor:
+                return None
+            return {user_id for changed, user_id in self._change_log if changed > version}
+
+    def _log_change(self, user_id: Any) -> None:
+        self.version += 1
+        self._change_log.append((self.version, user_id))
+
+    def uses_index(self) -> bool:
+        """Whether candidates() answers from the ANN index rather than leaving a full scan to the caller"""
+        return self.index is not None and len(self._user_ids) >= self.index_min_size
+
+    def candidates(self, probe: np.ndarray, metric: str) -> Optional[Tuple[List[Any], EncodingMatrix]]:
+        """
+        Exact encodings of the rerank_k nearest users according to the ANN index
+        Returns None when the index is not in use (or still training), so the caller scans everything
+        """
+        with self._lock:
+            if (self.index is None or len(self._user_ids) < self.index_min_size
+                    or probe.size != self.dimension):
+                return None
+            if not self.index.is_trained or self.index.metric != metric:
+                self.build_index_in_background(metric)
+                return None
+
+            user_ids = self.index.search(probe, self.rerank_k)
+            rows = [self._rows[user_id] for user_id in user_ids]
+            return user_ids, EncodingMatrix(self._matrix[rows], self._sq_norms[rows])
+
+    def build_index(self, metric: str) -> bool:
+        """
+        (Re)train the ANN index on the current gallery contents
+        Training runs on a fresh index outside the gallery lock, so matching and
+        enrollment carry on meanwhile; users changed in the meantime are replayed
+        into it before it replaces the live index. Returns False if the contents
+        were replaced wholesale (adopt, clear) while training, leaving the index as is.
+        """
+        if self.index is None:
+            raise RuntimeError("Gallery has no ANN index configured")
+        with self._index_build_lock:
+            with self._lock:
+                generation = self._index_generation
+                # A view, not a copy: rows rewritten while training are in _index_changes
+                user_ids, matrix = list(self._user_ids), self.matrix
+                self._index_changes = set()
+            try:
+                index = self.index.fresh()
+                index.build(user_ids, matrix, metric)
+            except BaseException:
+                with self._lock:
+                    self._index_changes = None
+                raise
+            with self._lock:
+                changes, self._index_changes = self._index_changes, None
+                if generation != self._index_generation:
+                    return False
+                for user_id in changes:
+                    row = self._rows.get(user_id)
+                    if row is None:
+                        index.remove(user_id)
+                    else:
+                        index.add(user_id, self._matrix[row])
+                self.index = index
+                return True
+
+    def build_index_in_background(self, metric: str) -> bool:
+        """Start build_index(metric) in a daemon thread unless one is already running; True if started"""
+        with self._lock:
+            if self._index_thread is not None and self._index_thread.is_alive():
+                return False
+            self._index_thread = threading.Thread(target=self._build_index_logged, args=(metric,),
+                                                  name="gallery-index", daemon=True)
+            self._index_thread.start()
+            return True
+
+    def wait_for_index(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a background index build to finish; True once none is running"""
+        thread = self._index_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def _build_index_logged(self, metric: str) -> None:
+        started = time.perf_counter()
+        try:
+            if self.build_index(metric):
+                logger.info("Trained %s gallery index over %d users in %.2fs",
+                            type(self.index).__name__, len(self.index), time.perf_counter() - started)
+        except Exception as e:
+            logger.error("Gallery index training failed: %s", e)
+
+    def _set_row(self, row: int, vector: np.ndarray) -> None:
+        self._matrix[row] = vector
+        self._sq_norms[row] = np.dot(self._matrix[row], self._matrix[row])
+
+    def _grow(self) -> None:
+        rows = self._matrix.shape[0]
+        grown = np.zeros((rows * 2, self._matrix.shape[1]), dtype=np.float32)
+        grown[:rows] = self._matrix
+        self._matrix = grown
+        sq_norms = np.zeros(rows * 2, dtype=np.float32)
+        sq_norms[:rows] = self._sq_norms
+        self._sq_norms = sq_norms
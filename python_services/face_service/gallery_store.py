@@ -0,0 +1,274 @@
+import fcntl
+import json
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from .gallery import FaceGallery
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Append log record: op u8 | user_id i64 | dimension u16, then dimension float32 values (upserts only)
+_RECORD = struct.Struct("<BqH")
+_UPSERT = 1
+_REMOVE = 2
+
+
+class GalleryStore:
+    """
+    On-disk home of a FaceGallery: a float32 snapshot plus an append log.
+
+    A snapshot generation is three .npy files (encodings, squared norms,
+    int64 user ids) described by snapshot.json. Loading memory-maps them
+    copy-on-write, so every worker on the host shares one page-cached copy
+    and startup costs the same for 1k or 1M users; only pages a worker
+    writes to become private. Snapshots carry spare rows so enrollments
+    land in place instead of growing (copying) the matrix.
+
+    Enrollments and removals are appended to the generation's log, which
+    refresh() replays in other workers. compact() folds the log into a new
+    generation. Writers serialise on an flock, so this works across
+    processes on one host. Compaction holds the locks only to take its
+    snapshot and to switch generations: while it writes the arrays,
+    appends keep going to the old log and are carried over into the new
+    one. User ids must be integers.
+    """
+
+    def __init__(self, directory: str, compact_after: int = 10000, headroom: float = 0.25,
+                 min_headroom: int = 1024):
+        self.directory = directory
+        self.compact_after = compact_after
+        self.headroom = headroom
+        self.min_headroom = min_headroom
+        self.generation = 0
+        self.log_records = 0
+        self._log_offset = 0
+        self._snapshot_stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["GalleryStore"]:
+        directory = os.environ.get("FACE_GALLERY_DIR")
+        if not directory:
+            return None
+        return cls(directory, compact_after=int(os.environ.get("FACE_GALLERY_COMPACT_AFTER", "10000")))
+
+    def open(self, gallery: FaceGallery) -> None:
+        """Load the current snapshot into gallery and replay its log"""
+        with self._lock:
+            self._open(gallery)
+
+    def refresh(self, gallery: FaceGallery) -> None:
+        """Pick up other workers' appends and compactions; two stat() calls when nothing changed"""
+        with self._lock:
+            if self._stamp() != self._snapshot_stamp:
+                self._open(gallery)
+                return
+            try:
+                size = os.path.getsize(self._log_path(self.generation))
+            except FileNotFoundError:
+                return
+            if size > self._log_offset:
+                self._replay(gallery)
+
+    def append_upsert(self, user_id: int, vector: np.ndarray) -> None:
+        """Log an enrollment the caller has already applied to its gallery"""
+        vector = np.asarray(vector, dtype="<f4").ravel()
+        self._append(_RECORD.pack(_UPSERT, self._user_id(user_id), vector.size) + vector.tobytes())
+
+    def append_remove(self, user_id: int) -> None:
+        """Log a removal the caller has already applied to its gallery"""
+        self._append(_RECORD.pack(_REMOVE, self._user_id(user_id), 0))
+
+    @property
+    def compacting(self) -> bool:
+        return self._compact_lock.locked()
+
+    def compact(self, gallery: FaceGallery) -> int:
+        """
+        Write gallery (with every logged change applied) as a new snapshot generation
+        whose log starts with whatever was appended while it was written; returns the
+        new generation. Blocks for as long as the write takes, so run it off the event loop.
+        """
+        with self._compact_lock, self._file_lock("compact.lock"):
+            with self._lock, self._file_lock():
+                if self._stamp() != self._snapshot_stamp:
+                    self._open(gallery)
+                else:
+                    self._replay(gallery)
+                old_generation = self.generation
+                carry_from = self._log_offset
+                user_ids, matrix = gallery.snapshot()
+
+            # Unlocked: rows changed from here on may be written torn or stale, but every such
+            # change is in the old log past carry_from and is replayed over the new snapshot
+            generation = old_generation + 1
+            count = len(user_ids)
+            dimension = matrix.dimension if count else 0
+            capacity = count + max(self.min_headroom, int(count * self.headroom)) if count else 0
+            if count:
+                self._write_arrays(generation, user_ids, matrix.matrix, matrix.sq_norms, capacity)
+
+            with self._lock, self._file_lock():
+                self._switch_generation(gallery, old_generation, generation, count, dimension, capacity, carry_from)
+            return generation
+
+    def _switch_generation(self, gallery: FaceGallery, old_generation: int, generation: int, count: int,
+                           dimension: int, capacity: int, carry_from: int) -> None:
+        try:
+            with open(self._log_path(old_generation), "rb") as f:
+                f.seek(carry_from)
+                carried = f.read()
+        except FileNotFoundError:
+            carried = b""
+        if carried:
+            with open(self._log_path(generation), "wb") as f:
+                f.write(carried)
+                f.flush()
+                os.fsync(f.fileno())
+
+        meta = {"version": SNAPSHOT_FORMAT_VERSION, "generation": generation, "count": count,
+                "dimension": dimension, "capacity": capacity}
+        meta_tmp = self._meta_path() + ".tmp"
+        with open(meta_tmp, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(meta_tmp, self._meta_path())
+
+        # Workers that still map the old files keep them alive until they refresh
+        for name in ("encodings", "sq_norms", "user_ids"):
+            self._unlink(self._path(name, old_generation))
+        self._unlink(self._log_path(old_generation))
+
+        self._open(gallery)
+        logger.info("Compacted gallery into generation %d (%d users, %d bytes of log carried over)",
+                    generation, count, len(carried))
+
+    def _write_arrays(self, generation: int, user_ids, matrix: np.ndarray, sq_norms: np.ndarray,
+                      capacity: int) -> None:
+        # Written through memmaps so a large gallery is never held twice in memory
+        count = len(user_ids)
+        encodings = np.lib.format.open_memmap(
+            self._path("encodings", generation), mode="w+", dtype=np.float32, shape=(capacity, matrix.shape[1])
+        )
+        encodings[:count] = matrix
+        encodings.flush()
+        norms = np.lib.format.open_memmap(
+            self._path("sq_norms", generation), mode="w+", dtype=np.float32, shape=(capacity,)
+        )
+        norms[:count] = sq_norms
+        norms.flush()
+        np.save(self._path("user_ids", generation), np.asarray(user_ids, dtype=np.int64))
+
+    def _open(self, gallery: FaceGallery) -> None:
+        self._snapshot_stamp = self._stamp()
+        meta = self._read_meta()
+        self.generation = meta["generation"] if meta else 0
+        if meta and meta["count"]:
+            if meta["version"] != SNAPSHOT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported gallery snapshot version {meta['version']}")
+            # Copy-on-write maps: shared page cache until this worker writes a row
+            encodings = np.load(self._path("encodings", self.generation), mmap_mode="c")
+            sq_norms = np.load(self._path("sq_norms", self.generation), mmap_mode="c")
+            user_ids = np.load(self._path("user_ids", self.generation)).tolist()
+            gallery.adopt(user_ids, encodings, sq_norms)
+        else:
+            gallery.clear()
+        self._log_offset = 0
+        self.log_records = 0
+        self._replay(gallery)
+
+    def _replay(self, gallery: FaceGallery) -> None:
+        """Apply log records past _log_offset; a torn record at the tail is left for later"""
+        try:
+            with open(self._log_path(self.generation), "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        position = 0
+        while position + _RECORD.size <= len(data):
+            op, user_id, dimension = _RECORD.unpack_from(data, position)
+            end = position + _RECORD.size + dimension * 4
+            if end > len(data):
+                break
+            try:
+                if op == _UPSERT:
+                    gallery.upsert(user_id, np.frombuffer(data, dtype="<f4", count=dimension, offset=position + _RECORD.size))
+                elif op == _REMOVE:
+                    gallery.remove(user_id)
+            except ValueError as e:
+                logger.warning("Skipping gallery log record for user %s: %s", user_id, e)
+            position = end
+            self.log_records += 1
+        self._log_offset += position
+
+    def _append(self, record: bytes) -> None:
+        with self._lock, self._file_lock():
+            stale = self._stamp() != self._snapshot_stamp
+            # After a compaction elsewhere, log against the new generation; refresh() reloads it
+            generation = (self._read_meta() or {}).get("generation", 0) if stale else self.generation
+            fd = os.open(self._log_path(generation), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                start = os.fstat(fd).st_size
+                os.write(fd, record)
+            finally:
+                os.close(fd)
+            if not stale and start == self._log_offset:
+                # Nothing from other workers in between: the caller already applied this record
+                self._log_offset += len(record)
+                self.log_records += 1
+
+    def _user_id(self, user_id: int) -> int:
+        if not isinstance(user_id, (int, np.integer)):
+            raise ValueError(f"Gallery snapshots need integer user ids, got {user_id!r}")
+        return int(user_id)
+
+    @contextmanager
+    def _file_lock(self, name: str = "gallery.lock") -> Iterator[None]:
+        with open(os.path.join(self.directory, name), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self._meta_path())
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(self._meta_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.json")
+
+    def _path(self, name: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{name}.{generation}.npy")
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"gallery.{generation}.log")
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
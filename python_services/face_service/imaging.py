@@ -0,0 +1,79 @@
+import struct
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .metrics import timed_stage
+
+# EXIF orientation is ignored on every decode path, as PIL's base64 path always has: OpenCV
+# would otherwise rotate full-size decodes but not reduced ones, giving the same photo
+# different pixels (and encodings) depending on the endpoint and decode_max_side
+DECODE_FLAGS = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+
+# cv2.imdecode flags for decoding at 1/2, 1/4 and 1/8 size (native DCT scaling for JPEG)
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION,
+    4: cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION,
+    8: cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION,
+}
+
+# JPEG start-of-frame markers that carry the image dimensions
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_size(buffer: Union[bytes, memoryview]) -> Optional[Tuple[int, int]]:
+    """
+    (width, height) read from a JPEG or PNG header without decoding pixels
+    Returns None for other formats or malformed headers
+    """
+    view = memoryview(buffer)
+    if len(view) >= 24 and view[:8] == b"\x89PNG\r\n\x1a\n":
+        width, height = struct.unpack(">II", view[16:24])
+        return width, height
+
+    if len(view) < 4 or view[:2] != b"\xff\xd8":
+        return None
+    offset = 2
+    while offset + 9 <= len(view):
+        if view[offset] != 0xFF:
+            return None
+        marker = view[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        segment_length = struct.unpack(">H", view[offset + 2:offset + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", view[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + segment_length
+    return None
+
+
+def reduction_factor(size: Optional[Tuple[int, int]], max_side: Optional[int]) -> int:
+    """Largest of 1/2/4/8 that keeps the longer side at or above max_side"""
+    if not size or not max_side:
+        return 1
+    longest = max(size)
+    factor = 1
+    for candidate in (2, 4, 8):
+        if longest // candidate >= max_side:
+            factor = candidate
+    return factor
+
+
+def decode_image_buffer(buffer: Union[bytes, memoryview], max_side: Optional[int] = None) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Decode encoded image bytes straight into an RGB array with cv2.imdecode
+    When max_side is given and the image is at least twice that size, decode
+    at 1/2, 1/4 or 1/8 resolution instead of decoding everything and resizing.
+    Returns (rgb_array or None if OpenCV cannot decode it, reduction factor)
+    """
+    with timed_stage("decode"):
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        factor = reduction_factor(image_size(buffer), max_side)
+        bgr = cv2.imdecode(data, REDUCED_DECODE_FLAGS.get(factor, DECODE_FLAGS))
+    if bgr is None:
+        return None, 1
+    with timed_stage("color"):
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), factor
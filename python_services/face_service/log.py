@@ -0,0 +1,80 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let at most `burst` records per message template through every `interval`
+    seconds; the next record after a quiet period reports how many were dropped.
+    Keyed by the unformatted message, so "Error encoding face: %s" is limited
+    as one stream however many different errors it carries.
+    """
+
+    def __init__(self, interval: float = 10.0, burst: int = 5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (str(record.msg), record.levelno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+PACKAGE_LOGGER = "face_service"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class _PackageHandler(logging.StreamHandler):
+    """stderr handler on the face_service logger (a type of its own so it is installed once)"""
+
+
+def _configure_package_logger() -> None:
+    """
+    Without a handler of its own, INFO records (request and stage timings) only reach
+    logging.lastResort, which drops everything below WARNING. FACE_LOG_HANDLER=none
+    leaves output to the host's logging configuration instead.
+    """
+    package = logging.getLogger(PACKAGE_LOGGER)
+    package.setLevel(os.environ.get("FACE_LOG_LEVEL", "INFO").upper())
+    if os.environ.get("FACE_LOG_HANDLER", "stderr").lower() == "none":
+        return
+    if not any(isinstance(handler, _PackageHandler) for handler in package.handlers):
+        handler = _PackageHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        package.addHandler(handler)
+        # Records are written here; propagating too would print them twice under a configured root
+        package.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Module logger for the face service, rate limited and levelled by FACE_LOG_LEVEL
+    Call once per module at import time.
+    """
+    _configure_package_logger()
+    logger = logging.getLogger(name)
+    if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter(
+            interval=float(os.environ.get("FACE_LOG_RATE_INTERVAL", "10")),
+            burst=int(os.environ.get("FACE_LOG_RATE_BURST", "5")),
+        ))
+    logger.setLevel(os.environ.get("FACE_LOG_LEVEL", "INFO").upper())
+    return logger
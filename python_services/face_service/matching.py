@@ -0,0 +1,165 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Lowest confidence that authenticates a user, on every matching path
+MIN_AUTH_CONFIDENCE = 0.5
+
+
+def cosine_threshold(face_recognition_backend: bool) -> float:
+    """compare_faces' cosine match threshold: looser for dlib vectors than for the OpenCV features"""
+    return 0.3 if face_recognition_backend else 0.7
+
+
+def match_scores(values: Any, metric: str, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (confidences, matches) the way compare_faces scores them, for any shape of scores:
+    a euclidean distance d has confidence max(0, 1 - d) and matches within threshold
+    (the tolerance); a cosine similarity s has confidence max(0, s) and matches at or above it
+    """
+    values = np.asarray(values)
+    if metric == "euclidean":
+        return np.maximum(0, 1 - values), values <= threshold
+    confidences = np.maximum(0, values)
+    return confidences, confidences >= threshold
+
+
+class EncodingMatrix:
+    """
+    Stacked (N, D) float32 encodings with precomputed squared norms.
+    Scores a probe against every row with a single matrix-vector product.
+    """
+
+    def __init__(self, matrix: np.ndarray, sq_norms: Optional[np.ndarray] = None):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if self.matrix.ndim != 2:
+            raise ValueError("Encoding matrix must be two-dimensional")
+        if sq_norms is None:
+            sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self.sq_norms = np.asarray(sq_norms, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def dimension(self) -> int:
+        return self.matrix.shape[1]
+
+    @classmethod
+    def from_encodings(cls, encodings: Sequence[Sequence[float]]) -> "EncodingMatrix":
+        return cls(np.asarray(encodings, dtype=np.float32).reshape(len(encodings), -1))
+
+    def euclidean_distances(self, probe: np.ndarray) -> np.ndarray:
+        """Same metric as face_recognition.face_distance, for a probe of equal dimension"""
+        probe = np.asarray(probe, dtype=np.float32)
+        sq = self.sq_norms - 2.0 * (self.matrix @ probe) + float(probe @ probe)
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq)
+
+    def cosine_similarities(self, probe: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity with the zero-padding semantics of
+        FaceService._compare_with_cosine_similarity for mismatched dimensions
+        """
+        probe = np.asarray(probe, dtype=np.float32)
+        shared = min(self.dimension, probe.size)
+        dots = self.matrix[:, :shared] @ probe[:shared]
+        denom = np.sqrt(self.sq_norms) * np.float32(np.linalg.norm(probe))
+        similarities = np.zeros(len(self), dtype=np.float32)
+        np.divide(dots, denom, out=similarities, where=denom > 0)
+        return similarities
+
+    def euclidean_distance_matrix(self, probes: np.ndarray) -> np.ndarray:
+        """(M, N) distances from each of M equal-dimension probes to every row, in one matrix product"""
+        probes = np.asarray(probes, dtype=np.float32)
+        sq = self.sq_norms[None, :] - 2.0 * (probes @ self.matrix.T)
+        sq += np.einsum("ij,ij->i", probes, probes)[:, None]
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq)
+
+    def cosine_similarity_matrix(self, probes: np.ndarray) -> np.ndarray:
+        """(M, N) cosine similarities with the zero-padding semantics of cosine_similarities"""
+        probes = np.asarray(probes, dtype=np.float32)
+        shared = min(self.dimension, probes.shape[1])
+        dots = probes[:, :shared] @ self.matrix[:, :shared].T
+        probe_norms = np.sqrt(np.einsum("ij,ij->i", probes, probes))
+        denom = probe_norms[:, None] * np.sqrt(self.sq_norms)[None, :]
+        similarities = np.zeros(dots.shape, dtype=np.float32)
+        np.divide(dots, denom, out=similarities, where=denom > 0)
+        return similarities
+
+
+def best_candidate(confidences: np.ndarray, matches: np.ndarray) -> Optional[int]:
+    """
+    Row with the highest confidence among matches, or None
+    Ties resolve to the earliest row, like a sequential strict '>' scan
+    """
+    eligible = matches & (confidences > 0)
+    if not eligible.any():
+        return None
+    return int(np.argmax(np.where(eligible, confidences, -np.inf)))
+
+
+def group_by_dimension(candidates: Sequence[Tuple[Any, Any]]) -> Dict[int, Tuple[List[Any], List[int], EncodingMatrix]]:
+    """
+    Split (user_id, encoding) pairs into one EncodingMatrix per dimension
+    Returns {dimension: (user_ids, original_positions, matrix)}; unusable encodings are skipped
+    """
+    groups: Dict[int, Tuple[List[Any], List[int], List[np.ndarray]]] = {}
+    for position, (user_id, encoding) in enumerate(candidates):
+        try:
+            vector = np.asarray(encoding, dtype=np.float32).ravel()
+        except (TypeError, ValueError):
+            continue
+        if vector.size == 0:
+            continue
+        user_ids, positions, rows = groups.setdefault(vector.size, ([], [], []))
+        user_ids.append(user_id)
+        positions.append(position)
+        rows.append(vector)
+
+    return {
+        dimension: (user_ids, positions, EncodingMatrix(np.stack(rows)))
+        for dimension, (user_ids, positions, rows) in groups.items()
+    }
+
+
+def top_columns(confidences: np.ndarray, eligible: np.ndarray, k: int) -> np.ndarray:
+    """
+    Sorted union of each row's k best eligible columns
+    With distinct user ids per column, greedy one-to-one assignment of k rows
+    never needs anything outside this set, so the rest can be dropped first
+    """
+    if confidences.shape[1] <= k:
+        return np.arange(confidences.shape[1])
+    scores = np.where(eligible, confidences, -np.inf)
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best = best[np.isfinite(np.take_along_axis(scores, best, axis=1))]
+    return np.unique(best)
+
+
+def assign_one_to_one(confidences: np.ndarray, eligible: np.ndarray, user_ids: Sequence[Any]) -> List[Optional[int]]:
+    """
+    Greedy one-to-one assignment of M probes (rows) to candidates (columns)
+    Pairs are taken in descending confidence, skipping probes that already have
+    a user and users already given to another probe, so a user is matched at
+    most once even when several columns belong to them. Ties resolve to the
+    earlier probe, then the earlier column. Returns each probe's column, or None.
+    """
+    rows, columns = np.nonzero(eligible & (confidences > 0))
+    assigned: List[Optional[int]] = [None] * confidences.shape[0]
+    if rows.size == 0:
+        return assigned
+    order = np.lexsort((columns, rows, -confidences[rows, columns]))
+    taken = set()
+    remaining = confidences.shape[0]
+    for row, column in zip(rows[order].tolist(), columns[order].tolist()):
+        user_id = user_ids[column]
+        if assigned[row] is not None or user_id in taken:
+            continue
+        assigned[row] = column
+        taken.add(user_id)
+        remaining -= 1
+        if remaining == 0:
+            break
+    return assigned
@@ -0,0 +1,120 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Endpoint the current request is serving; set by the API's metrics middleware
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar("current_endpoint", default="none")
+
+StageTimings = List[Tuple[str, float]]
+
+# Stage timings of the call running on this thread (see traced_call)
+_trace = threading.local()
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram keyed by a tuple of label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # One counter per bucket plus +Inf, then the running sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def count(self, labels: Tuple[str, ...]) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-1]!r}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Request and per-stage latency histograms of the face service"""
+
+    def __init__(self):
+        self.requests = Histogram(
+            "face_request_duration_seconds", "End-to-end request latency.", ("endpoint", "status"),
+        )
+        self.stages = Histogram(
+            "face_stage_duration_seconds",
+            "Time spent in one pipeline stage (decode, color, detect, encode, match).",
+            ("endpoint", "stage", "backend"),
+        )
+
+    def observe_request(self, endpoint: str, status: int, seconds: float) -> None:
+        self.requests.observe((endpoint, str(status)), seconds)
+
+    def observe_stages(self, stages: StageTimings, backend: str, endpoint: Optional[str] = None) -> None:
+        endpoint = endpoint or current_endpoint.get()
+        for stage, seconds in stages:
+            self.stages.observe((endpoint, stage, backend), seconds)
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        return "\n".join(self.requests.render() + self.stages.render()) + "\n"
+
+
+# Process-wide registry served by /metrics
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    """Time a block as `stage` if a traced_call is collecting on this thread"""
+    timings = getattr(_trace, "timings", None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((stage, time.perf_counter() - start))
+
+
+def traced_call(function: Callable[..., Any], *args: Any) -> Tuple[Any, StageTimings]:
+    """
+    Run function(*args) and return (result, [(stage, seconds), ...])
+    Worker processes cannot write to the parent's registry, so timings travel
+    back with the result and are recorded by the executor.
+    """
+    previous = getattr(_trace, "timings", None)
+    _trace.timings = []
+    try:
+        return function(*args), _trace.timings
+    finally:
+        _trace.timings = previous
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,123 @@
+import importlib
+import importlib.util
+import os
+import threading
+import time
+from types import ModuleType
+from typing import Optional
+
+import cv2
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+BACKENDS = ("auto", "face_recognition", "opencv")
+
+
+class LazyModule:
+    """Stands in for a module that is only imported on first attribute access"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+
+def resolve_backend(requested: str) -> str:
+    """face_recognition or opencv; "auto" picks face_recognition when it is installed, without importing it"""
+    if requested not in BACKENDS:
+        raise ValueError(f"Unknown face backend {requested!r}; expected one of {BACKENDS}")
+    if requested != "auto":
+        return requested
+    return "face_recognition" if importlib.util.find_spec("face_recognition") is not None else "opencv"
+
+
+class ModelRegistry:
+    """
+    Process-wide home of the detection and encoding models.
+
+    Only the active backend is ever imported: face_recognition (and the dlib
+    models it loads at import) stays untouched on the OpenCV fallback, and is
+    otherwise imported on first use or by load(). The Haar cascade, which
+    /detect uses on either backend, and the optional YuNet ONNX detector are
+    loaded once per thread because neither OpenCV object is thread-safe.
+    """
+
+    def __init__(self, backend: str = "auto", yunet_path: Optional[str] = None):
+        self.backend = resolve_backend(backend)
+        self.face_recognition = LazyModule("face_recognition")
+        self.cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        self.yunet_path = yunet_path
+        self.load_seconds: Optional[float] = None
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls) -> "ModelRegistry":
+        return cls(os.environ.get("FACE_BACKEND", "auto"), os.environ.get("FACE_YUNET_MODEL") or None)
+
+    @property
+    def default_detector(self) -> str:
+        """Detector that pairs with the encoding backend: HOG for face_recognition, Haar otherwise"""
+        return "hog" if self.backend == "face_recognition" else "haar"
+
+    def detector_available(self, name: str) -> bool:
+        """Whether detector name can run here, without loading it"""
+        if name == "haar":
+            return True
+        if name == "hog":
+            return self.backend == "face_recognition" or importlib.util.find_spec("face_recognition") is not None
+        if name == "yunet":
+            return bool(self.yunet_path) and os.path.isfile(self.yunet_path)
+        return False
+
+    def yunet(self) -> "cv2.FaceDetectorYN":
+        """This thread's YuNet detector, read from FACE_YUNET_MODEL"""
+        detector = getattr(self._local, "yunet", None)
+        if detector is None:
+            if not self.detector_available("yunet"):
+                raise RuntimeError("YuNet detector needs FACE_YUNET_MODEL pointing at its ONNX model")
+            # Input size is reset per image; 0.7 score / 0.3 NMS are the model's usual settings
+            detector = cv2.FaceDetectorYN.create(self.yunet_path, "", (320, 320), 0.7, 0.3, 5000)
+            self._local.yunet = detector
+        return detector
+
+    def haar_cascade(self) -> cv2.CascadeClassifier:
+        """This thread's Haar face cascade"""
+        cascade = getattr(self._local, "face_cascade", None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(self.cascade_path)
+            if cascade.empty():
+                raise RuntimeError(f"Failed to load Haar cascade at {self.cascade_path}")
+            self._local.face_cascade = cascade
+        return cascade
+
+    def load(self) -> float:
+        """Import the active backend's models now instead of on the first request; returns seconds taken"""
+        started = time.perf_counter()
+        if self.backend == "face_recognition":
+            self.face_recognition.load()
+        self.haar_cascade()
+        if self.detector_available("yunet"):
+            self.yunet()
+        self.load_seconds = time.perf_counter() - started
+        logger.info("Loaded %s models in %.2fs", self.backend, self.load_seconds)
+        return self.load_seconds
+
+
+# Shared by every FaceService in the process
+MODELS = ModelRegistry.from_env()
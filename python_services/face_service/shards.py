@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .gallery import FaceGallery
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+SHARD_NAME = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+
+
+@dataclass
+class _Shard:
+    members: List[int]
+    stamp: Optional[int] = None  # mtime_ns of the membership file this was read from
+    gallery: Optional[FaceGallery] = None
+    built_version: int = -1  # source gallery version the gallery was cut from
+
+
+class GalleryShards:
+    """
+    Named subsets of the resident gallery, e.g. one per event or tenant.
+
+    A shard is a membership list of user ids. The first match against it
+    copies those users' rows out of the gallery into a contiguous
+    FaceGallery of their own, so a scan touches only the shard's roster;
+    later upserts and removals of its members are applied to the copy row
+    by row, and it is only re-cut when the gallery was replaced wholesale
+    or changed too much since to replay (see FaceGallery.changes_since). Loaded
+    shards are evicted least-recently-used once together they exceed
+    max_bytes, and are re-cut on next use. With a directory, memberships
+    are kept there as JSON so every worker (and restart) sees them; each
+    lookup re-reads a membership file whose mtime changed.
+    """
+
+    def __init__(self, gallery: FaceGallery, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.gallery = gallery
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._shards: "OrderedDict[str, _Shard]" = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, gallery: FaceGallery) -> "GalleryShards":
+        gallery_dir = os.environ.get("FACE_GALLERY_DIR")
+        max_mb = float(os.environ.get("FACE_SHARD_MAX_MB", "0"))
+        return cls(
+            gallery,
+            directory=os.path.join(gallery_dir, "shards") if gallery_dir else None,
+            max_bytes=int(max_mb * 2**20) or None,
+        )
+
+    def set_members(self, name: str, user_ids: List[int]) -> List[int]:
+        """Create or replace shard name's membership; returns it without duplicates"""
+        self._check_name(name)
+        members = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+        with self._lock:
+            stamp = None
+            if self.directory:
+                path = self._path(name)
+                with open(path + ".tmp", "w") as f:
+                    json.dump({"name": name, "user_ids": members}, f)
+                os.replace(path + ".tmp", path)
+                stamp = os.stat(path).st_mtime_ns
+            self._shards[name] = _Shard(members, stamp)
+            return members
+
+    def remove(self, name: str) -> bool:
+        self._check_name(name)
+        with self._lock:
+            removed = self._shards.pop(name, None) is not None
+            if self.directory:
+                try:
+                    os.unlink(self._path(name))
+                    removed = True
+                except FileNotFoundError:
+                    pass
+            return removed
+
+    def members(self, name: str) -> Optional[List[int]]:
+        """Shard name's user ids, or None when there is no such shard"""
+        with self._lock:
+            shard = self._sync(name)
+            return None if shard is None else list(shard.members)
+
+    def gallery_for(self, name: str) -> Optional[FaceGallery]:
+        """Contiguous gallery of shard name's enrolled members (cut now if needed), or None for an unknown shard"""
+        with self._lock:
+            shard = self._sync(name)
+            if shard is None:
+                return None
+            self._shards.move_to_end(name)
+            if shard.gallery is None or shard.built_version != self.gallery.version:
+                # Read the version first: a change made meanwhile is applied (again) next time
+                version = self.gallery.version
+                changed = None if shard.gallery is None else self.gallery.changes_since(shard.built_version)
+                if changed is None:
+                    shard.gallery = self.gallery.subset(shard.members)
+                else:
+                    self._apply_changes(shard, changed)
+                shard.built_version = version
+                self._evict_over_budget(keep=name)
+            return shard.gallery
+
+    def evict(self, name: str) -> bool:
+        """Drop shard name's loaded rows (the membership stays); True if it was loaded"""
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None or shard.gallery is None:
+                return False
+            shard.gallery = None
+            return True
+
+    def stats(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """{name, members, loaded, enrolled, bytes} for one shard, or for every known shard"""
+        with self._lock:
+            if name is not None:
+                names = [name] if self._sync(name) is not None else []
+            else:
+                names = sorted(set(self._shards) | set(self._stored_names()))
+                names = [shard_name for shard_name in names if self._sync(shard_name) is not None]
+            return [self._stats(shard_name, self._shards[shard_name]) for shard_name in names]
+
+    @staticmethod
+    def _stats(name: str, shard: _Shard) -> Dict[str, Any]:
+        loaded = shard.gallery is not None
+        return {
+            "name": name,
+            "members": len(shard.members),
+            "loaded": loaded,
+            "enrolled": len(shard.gallery) if loaded else None,
+            "bytes": shard.gallery.nbytes if loaded else 0,
+        }
+
+    def _sync(self, name: str) -> Optional[_Shard]:
+        """The in-memory shard, refreshed from its membership file when another worker changed it"""
+        shard = self._shards.get(name)
+        if not self.directory or not SHARD_NAME.match(name):
+            return shard
+        try:
+            stamp = os.stat(self._path(name)).st_mtime_ns
+        except FileNotFoundError:
+            self._shards.pop(name, None)
+            return None
+        if shard is not None and shard.stamp == stamp:
+            return shard
+        with open(self._path(name)) as f:
+            members = [int(user_id) for user_id in json.load(f)["user_ids"]]
+        shard = _Shard(members, stamp)
+        self._shards[name] = shard
+        return shard
+
+    def _apply_changes(self, shard: _Shard, changed: set) -> None:
+        """Bring a loaded shard's rows up to date with the changed user ids among its members"""
+        for user_id in changed.intersection(shard.members):
+            encoding = self.gallery.get(user_id)
+            if encoding is None:
+                shard.gallery.remove(user_id)
+            else:
+                shard.gallery.upsert(user_id, encoding)
+
+    def _evict_over_budget(self, keep: str) -> None:
+        if not self.max_bytes:
+            return
+        loaded = sum(shard.gallery.nbytes for shard in self._shards.values() if shard.gallery is not None)
+        for name, shard in self._shards.items():
+            if loaded <= self.max_bytes:
+                break
+            if name != keep and shard.gallery is not None:
+                loaded -= shard.gallery.nbytes
+                shard.gallery = None
+                logger.info("Evicted gallery shard %s to stay within %d bytes", name, self.max_bytes)
+
+    def _stored_names(self) -> List[str]:
+        if not self.directory:
+            return []
+        return [entry[:-5] for entry in os.listdir(self.directory) if entry.endswith(".json")]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    @staticmethod
+    def _check_name(name: str) -> None:
+        if not SHARD_NAME.match(name):
+            raise ValueError(f"Invalid shard name {name!r}; use up to 64 letters, digits, '_', '.', ':' or '-'")
@@ -0,0 +1,214 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .detection import Box
+
+# Corner features followed per box, and how many must survive for its shift to count
+MAX_FLOW_POINTS = 30
+MIN_FLOW_POINTS = 4
+
+
+def iou(a: Box, b: Box) -> float:
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    width = min(ax + aw, bx + bw) - max(ax, bx)
+    height = min(ay + ah, by + bh) - max(ay, by)
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / float(aw * ah + bw * bh - intersection)
+
+
+def flow_frame(image: np.ndarray, factor: int, side: int) -> Tuple[np.ndarray, float]:
+    """
+    (greyscale copy of an RGB frame whose longer side is side pixels, full-resolution
+    pixels per copy pixel); image was decoded at 1/factor of full resolution
+    """
+    height, width = image.shape[:2]
+    scale = max(1.0, max(height, width) * factor / side)
+    size = (max(1, round(width * factor / scale)), max(1, round(height * factor / scale)))
+    small = cv2.resize(image, size, interpolation=cv2.INTER_AREA) if size != (width, height) else image
+    return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY), scale
+
+
+def flow_shifts(previous: np.ndarray, current: np.ndarray, boxes: List[Box]) -> List[Optional[Tuple[float, float]]]:
+    """
+    Median Lucas-Kanade displacement (dx, dy) of the corner features inside each box
+    from one greyscale frame to the next, or None for a box with too few features followed
+    """
+    starts, owners = [], []
+    for index, (x, y, w, h) in enumerate(boxes):
+        mask = np.zeros(previous.shape, dtype=np.uint8)
+        mask[max(0, y):max(0, y + h), max(0, x):max(0, x + w)] = 255
+        corners = cv2.goodFeaturesToTrack(previous, MAX_FLOW_POINTS, 0.01, 3, mask=mask)
+        if corners is not None:
+            starts.append(corners.reshape(-1, 2))
+            owners.extend([index] * len(corners))
+    shifts: List[Optional[Tuple[float, float]]] = [None] * len(boxes)
+    if not starts:
+        return shifts
+
+    start = np.concatenate(starts).astype(np.float32).reshape(-1, 1, 2)
+    end, status, _ = cv2.calcOpticalFlowPyrLK(previous, current, start, None, winSize=(15, 15), maxLevel=3)
+    followed = status.ravel() == 1
+    deltas = (end - start).reshape(-1, 2)
+    owners = np.asarray(owners)
+    for index in range(len(boxes)):
+        selected = followed & (owners == index)
+        if selected.sum() >= MIN_FLOW_POINTS:
+            dx, dy = np.median(deltas[selected], axis=0)
+            shifts[index] = (float(dx), float(dy))
+    return shifts
+
+
+@dataclass
+class Track:
+    track_id: int
+    box: Box  # full-resolution coordinates, as reported to clients
+    decoded_box: Box  # coordinates in the decoded frame, passed back to skip detection when encoding
+    # IoU between the last two boxes associated with this track; low overlap means the identity may have changed
+    overlap: float = 1.0
+    misses: int = 0
+    identified: bool = False
+    stale: bool = False  # identified, but the box jumped enough that the identity needs re-checking
+    user_id: Optional[Any] = None
+    confidence: Optional[float] = None
+    distance: Optional[float] = None
+    attempts: int = 0  # match attempts so far; 1 right after the first
+    retry_round: int = 0  # detection round from which an unidentified track is matched again
+
+    def event(self, kind: str, frame: int) -> Dict[str, Any]:
+        x, y, w, h = self.box
+        return {
+            "event": kind,
+            "frame": frame,
+            "track_id": self.track_id,
+            "box": {"x": x, "y": y, "w": w, "h": h},
+            "authenticated": self.identified,
+            "user_id": self.user_id,
+            "confidence": self.confidence,
+            "distance": self.distance,
+        }
+
+
+class FaceTracker:
+    """
+    IoU tracker for a stream of detections from one camera.
+
+    Each update() associates the frame's detections with live tracks,
+    greedily by overlap. Detections left over start new tracks; tracks that
+    go max_misses detection rounds without one are dropped. Only tracks that
+    still need an identity (new, unmatched, or whose box jumped so far that
+    overlap fell below reverify_iou) are returned for encoding, so a face that
+    stays in view is encoded and matched once. A face that stays unmatched
+    (someone not enrolled) is retried with exponential backoff: after 1, 2,
+    4, ... detection rounds, at most max_retry_interval apart.
+
+    Between detection rounds, follow() moves every box with the optical flow
+    of a small greyscale copy of each frame (flow_side pixels on the longer
+    side), so clients see boxes keep up with faces and a face that moved
+    several box widths between detections still overlaps its own track.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, reverify_iou: float = 0.5, max_misses: int = 2,
+                 max_retry_interval: int = 16, flow_side: int = 320):
+        self.iou_threshold = iou_threshold
+        self.reverify_iou = reverify_iou
+        self.max_misses = max_misses
+        self.max_retry_interval = max_retry_interval
+        self.flow_side = flow_side
+        self.tracks: List[Track] = []
+        self._next_id = 1
+        self._round = 0
+        # Previous frame's flow copy and its full-resolution pixels per pixel
+        self._flow: Optional[np.ndarray] = None
+        self._flow_scale = 1.0
+
+    def follow(self, frame: np.ndarray, scale: float) -> None:
+        """
+        Shift every track's box by the optical flow from the previous frame to this one
+        frame and scale come from flow_frame(); call it for every frame, detection frames
+        included (before update()), so the flow always spans consecutive frames
+        """
+        previous, previous_scale = self._flow, self._flow_scale
+        if previous is not None and previous.shape != frame.shape:
+            # Off-by-one sizes from decoding at a different reduction; a new camera just restarts the flow
+            if abs(previous.shape[0] - frame.shape[0]) > 2 or abs(previous.shape[1] - frame.shape[1]) > 2:
+                previous = None
+            else:
+                frame = cv2.resize(frame, (previous.shape[1], previous.shape[0]), interpolation=cv2.INTER_AREA)
+                scale = previous_scale
+        self._flow, self._flow_scale = frame, scale
+        if previous is None or not self.tracks:
+            return
+
+        boxes = [tuple(int(round(v / previous_scale)) for v in track.box) for track in self.tracks]
+        for track, shift in zip(self.tracks, flow_shifts(previous, frame, boxes)):
+            if shift is None:
+                continue
+            x, y, w, h = track.box
+            track.box = (x + int(round(shift[0] * scale)), y + int(round(shift[1] * scale)), w, h)
+
+    def update(self, faces: List[Box], boxes: List[Box]) -> Tuple[List[Track], List[Track]]:
+        """
+        Feed one detection round; faces are full-resolution boxes and boxes the
+        same detections in decoded-frame coordinates. Returns (tracks to encode, lost tracks)
+        """
+        self._round += 1
+        pairs = sorted(
+            ((iou(track.box, face), t, d) for t, track in enumerate(self.tracks) for d, face in enumerate(faces)),
+            key=lambda pair: (-pair[0], pair[1], pair[2]),
+        )
+        matched_tracks, matched_faces = set(), set()
+        for overlap, t, d in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t in matched_tracks or d in matched_faces:
+                continue
+            matched_tracks.add(t)
+            matched_faces.add(d)
+            track = self.tracks[t]
+            track.box, track.decoded_box = tuple(faces[d]), tuple(boxes[d])
+            track.overlap, track.misses = overlap, 0
+            if overlap < self.reverify_iou:
+                track.stale = True
+
+        lost = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    lost.append(track)
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for d, face in enumerate(faces):
+            if d not in matched_faces:
+                self.tracks.append(Track(track_id=self._next_id, box=tuple(face), decoded_box=tuple(boxes[d])))
+                self._next_id += 1
+
+        return [track for track in self.tracks if track.misses == 0 and self._needs_match(track)], lost
+
+    def _needs_match(self, track: Track) -> bool:
+        return track.stale or (not track.identified and self._round >= track.retry_round)
+
+    def identify(self, track: Track, match: Optional[Dict[str, Any]]) -> bool:
+        """
+        Record a match result ({authenticated, user_id, confidence, distance}) for track
+        Returns True when the track's identity changed
+        """
+        authenticated = bool(match and match.get("authenticated"))
+        user_id = match.get("user_id") if authenticated else None
+        changed = authenticated != track.identified or user_id != track.user_id
+        track.attempts += 1
+        track.stale = False
+        track.identified = authenticated
+        track.user_id = user_id
+        track.confidence = match.get("confidence") if authenticated else None
+        track.distance = match.get("distance") if authenticated else None
+        if not authenticated:
+            track.retry_round = self._round + min(2 ** (track.attempts - 1), self.max_retry_interval)
+        return changed
@@ -0,0 +1,39 @@
+import io
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from face_service import api
+from face_service.cache import EncodingCache
+from face_service.executor import FaceExecutor
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Run face work on the loop so monkeypatched FaceService methods are honoured
+    monkeypatch.setattr(api, "face_executor", FaceExecutor(api.face_service, mode="inline"))
+    monkeypatch.setattr(api, "encoding_cache", EncodingCache())
+    return TestClient(api.app)
+
+
+@pytest.fixture
+def jpeg_bytes():
+    """Factory for small flat-colour JPEGs"""
+    def make(value: int) -> bytes:
+        buf = io.BytesIO()
+        Image.fromarray(np.full((32, 32, 3), value, dtype=np.uint8)).save(buf, format="JPEG")
+        return buf.getvalue()
+
+    return make
+
+
+@pytest.fixture
+def fake_encoder(monkeypatch):
+    """Encode an image as its mean brightness so tests don't need a real face"""
+    def encode_image(image_np, policy=None, boxes=None):
+        mean = float(image_np.mean())
+        return None if mean < 10 else [mean] * 4
+
+    monkeypatch.setattr(api.face_service, "encode_image", encode_image)
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+from face_service.ann import IVFFlatIndex, PQIndex
+from face_service.face_service import FaceService
+from face_service.gallery import FaceGallery
+
+
+def _vectors(size=2000, dimension=32, seed=3):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(size, dimension)).astype(np.float32)
+
+
+def test_full_probe_search_is_exact():
+    vectors = _vectors()
+    index = IVFFlatIndex(nlist=16)
+    index.build(list(range(len(vectors))), vectors, "euclidean")
+
+    probe = vectors[123] + 0.01
+    expected = np.argsort(np.linalg.norm(vectors - probe, axis=1))[:5].tolist()
+
+    assert index.search(probe, 5, nprobe=16) == expected
+
+
+def test_incremental_add_and_remove():
+    vectors = _vectors()
+    index = IVFFlatIndex(nlist=16, nprobe=16)
+    index.build(list(range(1000)), vectors[:1000], "cosine")
+
+    index.add("new", vectors[1500])
+    assert index.search(vectors[1500], 1) == ["new"]
+
+    assert index.remove("new")
+    assert not index.remove("new")
+    assert "new" not in index.search(vectors[1500], 10)
+    assert len(index) == 1000
+
+
+def test_gallery_index_matches_exact_scan(monkeypatch):
+    vectors = np.abs(_vectors(size=3000, dimension=64))
+    exact = FaceService()
+    indexed = FaceService(gallery=FaceGallery(index=IVFFlatIndex(nlist=32, nprobe=8), index_min_size=100))
+    for user_id, vector in enumerate(vectors):
+        exact.gallery.upsert(user_id, vector)
+        indexed.gallery.upsert(user_id, vector)
+
+    # The first match scans exactly and trains the index in the background
+    assert indexed.match_encoding((vectors[5] + 0.01).tolist())["user_id"] == 5
+    assert indexed.gallery.wait_for_index(timeout=30)
+    assert indexed.gallery.index.is_trained
+
+    for target in (5, 777, 2999):
+        probe = (vectors[target] + 0.01).tolist()
+        expected = exact.match_encoding(probe)
+        result = indexed.match_encoding(probe)
+        assert result["user_id"] == expected["user_id"] == target
+        assert result["confidence"] == expected["confidence"]
+
+    # Updates after training are routed into the index too
+    indexed.gallery.upsert(5000, vectors[10] * 3)
+    indexed.gallery.remove(10)
+    assert indexed.match_encoding((vectors[10] * 3).tolist())["user_id"] == 5000
+
+
+def test_pq_search_shortlists_the_exact_neighbours():
+    vectors = _vectors(size=3000)
+    index = PQIndex(subspaces=8)
+    index.build(list(range(len(vectors))), vectors, "euclidean")
+
+    for target in (0, 1234, 2999):
+        probe = vectors[target] + 0.01
+        assert index.search(probe, 10)[0] == target
+    assert index.nbytes == 8 * 3000 + 8 * 256 * 4 * 4
+
+
+def test_pq_incremental_add_and_remove():
+    vectors = _vectors()
+    index = PQIndex(subspaces=8)
+    index.build(list(range(1000)), vectors[:1000], "cosine")
+
+    index.add("new", vectors[1500])
+    assert index.search(vectors[1500], 1) == ["new"]
+
+    assert index.remove("new")
+    assert index.remove(0)
+    assert not index.remove("new")
+    assert "new" not in index.search(vectors[1500], 10)
+    assert len(index) == 999
+
+
+@pytest.mark.parametrize("dimension", [128, 256])
+def test_pq_gallery_keeps_exact_scores_and_gates(dimension):
+    vectors = np.abs(_vectors(size=3000, dimension=dimension))
+    exact = FaceService()
+    indexed = FaceService(gallery=FaceGallery(index=PQIndex(subspaces=16), index_min_size=100))
+    for user_id, vector in enumerate(vectors):
+        exact.gallery.upsert(user_id, vector)
+        indexed.gallery.upsert(user_id, vector)
+    indexed.build_gallery_index()
+
+    rng = np.random.default_rng(dimension)
+    for target in rng.integers(0, len(vectors), 20):
+        probe = (vectors[target] + rng.normal(scale=0.05, size=dimension)).tolist()
+        expected = exact.match_encoding(probe)
+        result = indexed.match_encoding(probe)
+        assert result["user_id"] == expected["user_id"] == target
+        assert result["confidence"] == expected["confidence"]
+        assert result["distance"] == expected["distance"]
+
+    # Below the 0.5 confidence gate nothing is authenticated, indexed or not
+    negative = (-vectors[0]).tolist()
+    assert not exact.match_encoding(negative)["authenticated"]
+    assert not indexed.match_encoding(negative)["authenticated"]
+
+
+def test_changes_made_while_the_index_trains_are_replayed_into_it(monkeypatch):
+    vectors = _vectors(size=1000)
+    gallery = FaceGallery(index=IVFFlatIndex(nlist=8, nprobe=8), index_min_size=100)
+    for user_id, vector in enumerate(vectors[:900]):
+        gallery.upsert(user_id, vector)
+
+    build = IVFFlatIndex.build
+
+    def build_while_enrolling(index, ids, matrix, metric):
+        gallery.upsert("late", vectors[950])
+        gallery.remove(3)
+        build(index, ids, matrix, metric)
+
+    monkeypatch.setattr(IVFFlatIndex, "build", build_while_enrolling)
+    assert gallery.candidates(vectors[0], "euclidean") is None
+    assert gallery.wait_for_index(timeout=30)
+
+    assert gallery.candidates(vectors[950], "euclidean")[0][0] == "late"
+    assert 3 not in gallery.index.search(vectors[3], 8)
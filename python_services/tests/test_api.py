@@ -0,0 +1,197 @@
+import asyncio
+import base64
+
+import cv2
+import numpy as np
+
+from face_service import api
+
+
+def test_encode_batch_json_reports_per_item_results(client, fake_encoder, jpeg_bytes):
+    images = [base64.b64encode(jpeg_bytes(200)).decode(), base64.b64encode(jpeg_bytes(0)).decode(), "not-an-image"]
+
+    body = client.post("/encode/batch", json={"images_base64": images}).json()
+
+    assert body["count"] == 3
+    assert body["encoded"] == 1
+    first, second, third = body["results"]
+    assert first["success"] and len(first["encoding"]) == 4
+    assert second["error"] == "No face detected in image"
+    assert third["error"].startswith("Invalid image")
+
+
+def test_encode_batch_multipart_keeps_filenames(client, fake_encoder, jpeg_bytes):
+    files = [("images", ("a.jpg", jpeg_bytes(120))), ("images", ("b.jpg", jpeg_bytes(220)))]
+
+    body = client.post("/encode/batch", files=files).json()
+
+    assert [item["filename"] for item in body["results"]] == ["a.jpg", "b.jpg"]
+    assert body["encoded"] == 2
+
+
+def test_encode_batch_rejects_non_file_images_parts(client, fake_encoder, jpeg_bytes):
+    files = [("images", ("a.jpg", jpeg_bytes(120)))]
+
+    response = client.post("/encode/batch", files=files, data={"images": "not a file"})
+
+    assert response.status_code == 400
+
+
+def test_encode_batch_rejects_oversized_batches(client, monkeypatch):
+    monkeypatch.setattr(api, "MAX_ENCODE_BATCH", 1)
+
+    response = client.post("/encode/batch", json={"images_base64": ["a", "b"]})
+
+    assert response.status_code == 413
+
+
+def test_saturated_executor_returns_503(client, monkeypatch, jpeg_bytes):
+    monkeypatch.setattr(api.face_executor, "max_pending", 0)
+
+    response = client.post("/encode", json={"image_base64": base64.b64encode(jpeg_bytes(200)).decode()})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_encode_batch_items_count_against_max_pending(client, monkeypatch, jpeg_bytes):
+    monkeypatch.setattr(api.face_executor, "max_pending", 4)
+    images = [base64.b64encode(jpeg_bytes(200)).decode()] * 3
+
+    monkeypatch.setattr(api.face_executor, "pending", 2)
+    assert client.post("/encode/batch", json={"images_base64": images}).status_code == 503
+    monkeypatch.setattr(api.face_executor, "pending", 1)
+    assert client.post("/encode/batch", json={"images_base64": images}).status_code == 200
+    assert api.face_executor.pending == 1
+
+
+def test_raw_endpoints_accept_octet_stream_and_multipart(client, fake_encoder, jpeg_bytes):
+    image = jpeg_bytes(200)
+
+    raw = client.post("/encode/raw", content=image, headers={"content-type": "application/octet-stream"}).json()
+    multipart = client.post("/encode/raw", files={"image": ("probe.jpg", image)}).json()
+
+    assert raw["success"] and multipart["success"]
+    assert raw["encoding"] == multipart["encoding"]
+
+
+def test_authenticate_raw_uses_gallery_or_known_encodings(client, fake_encoder, monkeypatch, jpeg_bytes):
+    monkeypatch.setattr(api.face_service, "gallery", api.FaceGallery())
+    image = jpeg_bytes(200)
+    encoding = client.post("/encode/raw", content=image).json()["encoding"]
+    api.face_service.gallery.upsert(7, encoding)
+
+    from_gallery = client.post("/authenticate/raw", content=image).json()
+    from_known = client.post(
+        "/authenticate/raw",
+        files={"image": ("probe.jpg", image)},
+        data={"known_encodings": '[{"user_id": 9, "encoding": %s}]' % encoding},
+    ).json()
+
+    assert from_gallery["user_id"] == 7
+    assert from_known["user_id"] == 9
+
+
+def test_gallery_matching_runs_off_the_event_loop(client, fake_encoder, monkeypatch, jpeg_bytes):
+    loops = []
+    match_encoding = api.face_service.match_encoding
+
+    def recording_match(*args):
+        try:
+            loops.append(asyncio.get_running_loop())
+        except RuntimeError:
+            loops.append(None)
+        return match_encoding(*args)
+
+    monkeypatch.setattr(api.face_service, "match_encoding", recording_match)
+    client.post("/authenticate/raw", content=jpeg_bytes(200))
+
+    assert loops == [None]
+
+
+def test_raw_endpoint_rejects_empty_body(client):
+    assert client.post("/encode/raw", content=b"").status_code == 400
+
+
+def test_authenticate_group_matches_each_user_once(client, monkeypatch, jpeg_bytes):
+    # Three faces; the first two both look most like user 1
+    boxes = [(0, 0, 10, 10), (12, 0, 10, 10), (0, 12, 10, 10)]
+    encodings = {boxes[0]: [1.0, 0.0, 0.0], boxes[1]: [0.95, 0.3, 0.0], boxes[2]: [0.0, 0.0, 1.0]}
+    monkeypatch.setattr(api.face_service, "locate_faces", lambda image_np, policy=None: boxes)
+    monkeypatch.setattr(api.face_service, "encode_image_faces", lambda image_np, found: [encodings[b] for b in found])
+    monkeypatch.setattr(api.face_service, "gallery", api.FaceGallery())
+    api.face_service.gallery.upsert(1, [1.0, 0.0, 0.0])
+    api.face_service.gallery.upsert(2, [0.9, 0.44, 0.0])
+
+    body = client.post("/authenticate/group/raw", content=jpeg_bytes(200)).json()
+
+    assert body["success"] and body["count"] == 3 and body["authenticated"] == 2
+    assert [face["user_id"] for face in body["faces"]] == [1, 2, None]
+    assert body["faces"][1]["box"] == {"x": 12, "y": 0, "w": 10, "h": 10}
+    assert not body["faces"][2]["authenticated"]
+
+
+def test_authenticate_stream_detects_every_nth_frame_and_encodes_new_tracks(client, monkeypatch, jpeg_bytes):
+    detections, encoded = [], []
+    boxes = [(0, 0, 10, 10)]
+
+    def locate_faces(image_np, policy=None):
+        detections.append(1)
+        return list(boxes)
+
+    def encode_image_faces(image_np, found):
+        encoded.extend(found)
+        return [[1.0, 0.0, 0.0] for _ in found]
+
+    monkeypatch.setattr(api.face_service, "locate_faces", locate_faces)
+    monkeypatch.setattr(api.face_service, "encode_image_faces", encode_image_faces)
+    monkeypatch.setattr(api.face_service, "gallery", api.FaceGallery())
+    api.face_service.gallery.upsert(3, [1.0, 0.0, 0.0])
+    frame = jpeg_bytes(200)
+
+    with client.websocket_connect("/authenticate/stream?detect_every=2") as ws:
+        ws.send_bytes(frame)
+        first = ws.receive_json()
+        for _ in range(4):
+            ws.send_bytes(frame)
+        boxes.clear()
+        for _ in range(6):
+            ws.send_bytes(frame)
+        lost = ws.receive_json()
+
+    assert first["event"] == "track" and first["user_id"] == 3 and first["box"] == {"x": 0, "y": 0, "w": 10, "h": 10}
+    assert lost["event"] == "lost" and lost["track_id"] == first["track_id"]
+    assert len(detections) == 6 and encoded == [(0, 0, 10, 10)]
+
+
+def test_authenticate_stream_moves_boxes_between_detections(client, monkeypatch):
+    noise = cv2.GaussianBlur((np.random.default_rng(1).random((240, 480)) * 255).astype(np.uint8), (5, 5), 0)
+    frames = [cv2.imencode(".png", noise[:, 80 - 6 * i:400 - 6 * i])[1].tobytes() for i in range(3)]
+    monkeypatch.setattr(api.face_service, "locate_faces", lambda image_np, policy=None: [(100, 80, 40, 40)])
+    monkeypatch.setattr(api.face_service, "encode_image_faces",
+                        lambda image_np, found: [[1.0, 0.0, 0.0] for _ in found])
+    monkeypatch.setattr(api.face_service, "gallery", api.FaceGallery())
+
+    with client.websocket_connect("/authenticate/stream?detect_every=5") as ws:
+        for frame in frames:
+            ws.send_bytes(frame)
+        events = [ws.receive_json() for _ in frames]
+
+    assert [event["event"] for event in events] == ["track", "move", "move"]
+    assert [event["box"]["x"] for event in events] == [100, 106, 112]
+
+
+def test_detector_is_selectable_per_request(client, monkeypatch, jpeg_bytes):
+    seen = []
+    monkeypatch.setattr(api.MODELS, "detector_available", lambda name: name != "yunet")
+    monkeypatch.setattr(api.face_service, "_detect", lambda image_np, policy: seen.append(policy.detector) or [])
+    image = jpeg_bytes(200)
+
+    assert client.post("/detect/raw", content=image).json()["count"] == 0
+    assert client.post("/detect/raw?detector=hog", content=image).json()["count"] == 0
+    assert seen == ["haar", "hog"]
+
+    response = client.post("/detect/raw?detector=yunet", content=image)
+    assert response.status_code == 400
+    assert "not available" in response.json()["detail"]
+    assert client.post("/detect/raw?detector=mtcnn", content=image).status_code == 422
@@ -0,0 +1,165 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic_faces import scene
+from benchmarks.suite import jpeg
+from face_service import api
+from face_service import face_service as face_service_module
+from face_service.batching import MicroBatcher
+from face_service.executor import ExecutorSaturated, FaceExecutor
+from face_service.face_service import FaceService
+
+
+def test_concurrent_submits_share_batches():
+    calls = []
+
+    async def run_batch(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(run_batch, max_batch=3, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5))), batcher.stats()
+
+    results, stats = asyncio.run(run())
+
+    assert results == [0, 10, 20, 30, 40]
+    # The first three fill a batch; the last two go when max_wait expires
+    assert calls == [[0, 1, 2], [3, 4]]
+    assert stats["batches"] == 2 and stats["mean_batch_size"] == 2.5
+
+
+def test_batch_failure_reaches_every_caller():
+    async def run_batch(items):
+        raise api.ExecutorSaturated("busy")
+
+    async def run():
+        batcher = MicroBatcher(run_batch, max_batch=4, max_wait=0.001)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(2)), return_exceptions=True)
+
+    assert all(isinstance(result, api.ExecutorSaturated) for result in asyncio.run(run()))
+
+
+def test_disabled_batcher_runs_each_item_alone():
+    calls = []
+
+    async def run_batch(items):
+        calls.append(items)
+        return items
+
+    async def run():
+        batcher = MicroBatcher(run_batch, max_batch=1)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert calls == [["a"], ["b"]]
+
+
+def test_batches_are_split_across_workers_above_min_chunk_and_count_per_item():
+    class Service:
+        backend = "test"
+        chunks = []
+
+        def double_batch(self, items):
+            self.chunks.append(list(items))
+            return [item * 2 for item in items]
+
+    executor = FaceExecutor(Service(), mode="thread", workers=3, max_pending=8, min_chunk=2)
+
+    async def run():
+        results = await executor.run_chunked("double_batch", list(range(7)))
+        assert await executor.run_chunked("double_batch", [7, 8, 9]) == [14, 16, 18]
+        executor.pending = 2
+        try:
+            await executor.run_chunked("double_batch", list(range(7)))
+        except ExecutorSaturated:
+            return results
+        finally:
+            executor.pending = 0
+
+    assert asyncio.run(run()) == [0, 2, 4, 6, 8, 10, 12]
+    assert sorted(Service.chunks) == [[0, 1, 2], [3, 4, 5], [6], [7, 8, 9]]
+    executor.shutdown()
+
+
+def test_stream_yields_in_order_and_claims_slots_up_front():
+    class Service:
+        backend = "test"
+
+        def scale(self, item, factor):
+            time.sleep(0.01 * (3 - item))
+            return item * factor
+
+    executor = FaceExecutor(Service(), mode="thread", workers=3, max_pending=4)
+
+    async def run():
+        results = executor.stream("scale", [0, 1, 2], 10)
+        assert executor.pending == 3
+        with pytest.raises(ExecutorSaturated):
+            executor.stream("scale", [0, 1], 10)
+        collected = [result async for result in results]
+        await asyncio.sleep(0)
+        return collected, executor.pending
+
+    assert asyncio.run(run()) == ([0, 10, 20], 0)
+    executor.shutdown()
+
+
+def test_analyze_face_batch_matches_analyze_face():
+    service = FaceService()
+    images = [jpeg(scene(640, 480, 300)), b"not an image", jpeg(scene(400, 300, 60)), jpeg(scene(800, 600, 350))]
+
+    batched = service.analyze_face_batch([(image, None, None, None) for image in images])
+
+    assert batched == [service.analyze_face(image) for image in images]
+    assert batched[0]["encoding"] is not None and batched[1]["boxes"] is None
+
+
+def test_encode_batch_matches_per_image_encoding():
+    service = FaceService()
+    images = [scene(160, 120, 70), scene(120, 100, 90), scene(200, 150, 40)]
+    boxes = [(10, 12, 60, 60), (0, 0, 100, 90), (40, 30, 24, 30)]
+
+    assert service.encode_batch(images, boxes) == [service.encode_image(image, boxes=[box])
+                                                   for image, box in zip(images, boxes)]
+
+
+def test_face_recognition_batch_encodes_a_mosaic_in_one_call(monkeypatch):
+    calls = []
+
+    class FakeFaceRecognition:
+        @staticmethod
+        def face_encodings(image, locations):
+            calls.append(len(locations))
+            # Summing each location's pixels shows whether the mosaic kept every face where the box says
+            return [np.array([int(image[top:bottom, left:right].sum()), bottom - top, right - left])
+                    for top, right, bottom, left in locations]
+
+    monkeypatch.setattr(face_service_module, "face_recognition", FakeFaceRecognition)
+    images = [scene(160, 120, 70), scene(120, 100, 90), scene(200, 150, 40)]
+    boxes = [(10, 12, 60, 60), (0, 0, 100, 90), (40, 30, 24, 30)]
+
+    encodings = FaceService()._encode_batch_with_face_recognition(images, boxes)
+
+    assert calls == [3]
+    assert encodings == [[int(image[y:y + h, x:x + w].sum()), h, w] for image, (x, y, w, h) in zip(images, boxes)]
+
+
+def test_authenticate_goes_through_the_batchers(client, fake_encoder, monkeypatch, jpeg_bytes):
+    encode_batcher = MicroBatcher(lambda requests: api.face_executor.run("analyze_face_batch", requests), 4, 0.001)
+    match_batcher = MicroBatcher(api._match_gallery_batch, 4, 0.001)
+    monkeypatch.setattr(api, "encode_batcher", encode_batcher)
+    monkeypatch.setattr(api, "match_batcher", match_batcher)
+    monkeypatch.setattr(api.face_service, "locate_faces", lambda image_np, policy=None: [(0, 0, 32, 32)])
+    monkeypatch.setattr(api.face_service, "encode_batch",
+                        lambda images, boxes: [api.face_service.encode_image(image) for image in images])
+    monkeypatch.setattr(api.face_service, "gallery", api.FaceGallery())
+    api.face_service.gallery.upsert(7, [200.0] * 4)
+
+    body = client.post("/authenticate/raw", content=jpeg_bytes(200)).json()
+
+    assert body["authenticated"] and body["user_id"] == 7
+    assert encode_batcher.stats()["items"] == match_batcher.stats()["items"] == 1
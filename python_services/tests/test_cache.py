@@ -0,0 +1,70 @@
+import base64
+
+from face_service import api
+from face_service.cache import EncodingCache, content_digest
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_and_ttl_expiry():
+    clock = _Clock()
+    cache = EncodingCache(max_entries=2, ttl=10, clock=clock)
+    cache.put("a", {"v": 1})
+    cache.put("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}
+    cache.put("c", {"v": 3})  # evicts b, the least recently used
+
+    assert cache.get("b") is None
+    clock.now = 11
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["expirations"]) == (1, 2, 1, 1)
+
+
+def test_base64_is_keyed_by_its_text(jpeg_bytes):
+    image = jpeg_bytes(90)
+    encoded = base64.b64encode(image).decode()
+
+    assert content_digest(encoded) == content_digest("data:image/jpeg;base64," + encoded)
+    assert content_digest(encoded) != content_digest(jpeg_bytes(91))
+    assert EncodingCache(enabled=False).image_key(image) is None
+    # Same bytes, different decoders: PIL and OpenCV pixels are not guaranteed identical
+    assert EncodingCache().image_key(image) != EncodingCache().image_key(encoded)
+
+
+def test_repeated_images_skip_the_encoder(client, fake_encoder, monkeypatch, jpeg_bytes):
+    calls = []
+    encode_image = api.face_service.encode_image
+    monkeypatch.setattr(api.face_service, "encode_image", lambda *a, **kw: calls.append(1) or encode_image(*a, **kw))
+    image = jpeg_bytes(200)
+    encoded = base64.b64encode(image).decode()
+
+    first = client.post("/encode/raw", content=image).json()
+    second = client.post("/encode/raw", content=image).json()
+    client.post("/encode", json={"image_base64": encoded})
+    client.post("/encode", json={"image_base64": encoded})
+
+    assert first["encoding"] == second["encoding"]
+    # One encode per decoder: raw bytes and base64 do not share entries
+    assert len(calls) == 2
+    stats = client.get("/cache").json()
+    # One hit or miss per request, however many keys it looked up
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+
+
+def test_disabled_cache_stores_nothing(client, fake_encoder, monkeypatch, jpeg_bytes):
+    monkeypatch.setattr(api, "encoding_cache", EncodingCache(enabled=False))
+    image = jpeg_bytes(200)
+
+    client.post("/encode/raw", content=image)
+    client.post("/encode/raw", content=image)
+
+    stats = client.get("/cache").json()
+    assert not stats["enabled"]
+    assert stats["size"] == stats["hits"] == stats["misses"] == 0
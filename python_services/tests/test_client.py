@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from face_client import FaceServiceClient, FaceServiceError
+
+
+def _batch_response(request):
+    count = request.content.count(b'name="images"')
+    results = [{"index": i, "success": True, "encoding": [float(i)], "error": None} for i in range(count)]
+    return httpx.Response(200, json={"success": True, "count": count, "encoded": count, "results": results})
+
+
+def test_concurrent_encodes_share_batch_requests():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return _batch_response(request)
+
+    async def run():
+        async with FaceServiceClient(batch_size=3, transport=httpx.MockTransport(handler)) as client:
+            return await client.encode_many([b"a", b"b", b"c", b"d"])
+
+    results = asyncio.run(run())
+
+    assert calls == ["/encode/batch", "/encode/batch"]
+    assert [r["encoding"] for r in results] == [[0.0], [1.0], [2.0], [0.0]]
+
+
+def test_retries_transient_failures_with_backoff():
+    attempts = []
+
+    def handler(request):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("refused")
+        if len(attempts) == 2:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"success": True, "authenticated": True, "user_id": 4})
+
+    async def run():
+        async with FaceServiceClient(backoff=0.001, transport=httpx.MockTransport(handler)) as client:
+            return await client.authenticate(b"jpeg")
+
+    assert asyncio.run(run())["user_id"] == 4
+    assert len(attempts) == 3
+
+
+def test_gives_up_after_retries_and_does_not_retry_client_errors():
+    statuses = iter([503, 503, 400])
+
+    def handler(request):
+        return httpx.Response(next(statuses), json={"detail": "nope"})
+
+    async def run():
+        async with FaceServiceClient(retries=1, backoff=0.001, transport=httpx.MockTransport(handler)) as client:
+            with pytest.raises(FaceServiceError, match="after 2 attempts"):
+                await client.request("POST", "/encode/batch")
+            with pytest.raises(FaceServiceError, match="400"):
+                await client.request("POST", "/encode/batch")
+
+    asyncio.run(run())
+
+
+def test_in_flight_limit():
+    active = peak = 0
+
+    async def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return httpx.Response(200, json={"known": json.loads(request.content)})
+
+    async def run():
+        async with FaceServiceClient(max_in_flight=2, transport=httpx.MockTransport(handler)) as client:
+            await asyncio.gather(*(client.authenticate(b"x", known_encodings=[]) for _ in range(6)))
+
+    asyncio.run(run())
+    assert peak == 2
+
+
+def test_short_batch_response_fails_every_caller():
+    def handler(request):
+        results = [{"index": 0, "success": True, "encoding": [0.0], "error": None}]
+        return httpx.Response(200, json={"success": True, "count": 1, "encoded": 1, "results": results})
+
+    async def run():
+        async with FaceServiceClient(batch_size=2, transport=httpx.MockTransport(handler)) as client:
+            return await asyncio.wait_for(
+                asyncio.gather(client.encode(b"a"), client.encode(b"b"), return_exceptions=True), 5
+            )
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, FaceServiceError) for result in results)
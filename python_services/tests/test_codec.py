@@ -0,0 +1,87 @@
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from face_service import api
+from face_service.codec import pack_encoding, pack_encoding_base64, unpack_encoding
+from face_service.face_service import FaceService
+
+
+def test_round_trip_keeps_header_and_values():
+    vector = np.random.default_rng(0).normal(size=128).astype(np.float32)
+
+    exact = unpack_encoding(pack_encoding(vector, "float32", "dlib-128"))
+    half = unpack_encoding(pack_encoding_base64(vector, "float16", "dlib-128"))
+
+    assert (exact.dtype, exact.backend, exact.model_version) == ("float32", "dlib-128", 1)
+    np.testing.assert_array_equal(exact.vector, vector)
+    assert half.dtype == "float16"
+    np.testing.assert_allclose(half.vector, vector, atol=2e-3)
+
+
+def test_packed_is_several_times_smaller_than_json():
+    vector = np.random.default_rng(1).normal(size=128)
+
+    json_size = len(json.dumps(vector.tolist()))
+
+    # Raw bytes are 5x/10x smaller; base64 text still 3.8x/7.5x
+    assert json_size / len(pack_encoding(vector, "float32")) > 5
+    assert json_size / len(pack_encoding(vector, "float16")) > 10
+    assert json_size / len(pack_encoding_base64(vector, "float16")) > 7
+
+
+@pytest.mark.parametrize("data", [b"", b"XX" + bytes(6), pack_encoding([1.0, 2.0])[:-1], "not base64!"])
+def test_malformed_packed_encodings_raise(data):
+    with pytest.raises(ValueError):
+        unpack_encoding(data)
+
+
+def test_service_rejects_other_backends():
+    service = FaceService()
+    other = "dlib-128" if service.encoding_backend == "opencv-256" else "opencv-256"
+    foreign = pack_encoding_base64([0.1] * 128, backend=other)
+
+    with pytest.raises(ValueError, match="produced by"):
+        service.load_encoding(foreign)
+    assert len(service.load_encoding(pack_encoding_base64([0.1] * 4))) == 4
+
+
+def test_unusable_known_encodings_are_skipped_not_fatal():
+    service = FaceService()
+    other = "dlib-128" if service.encoding_backend == "opencv-256" else "opencv-256"
+    probe = [0.2, 0.4, 0.6, 0.8]
+    known = [
+        {"user_id": 1, "encoding": pack_encoding_base64(probe, backend=other)},
+        {"user_id": 2, "encoding": "not base64!"},
+        {"user_id": 3, "encoding": pack_encoding_base64(probe)},
+    ]
+
+    match = service.match_encoding(probe, known)
+    group = service.identify_encodings([probe], known)
+
+    assert match["success"] and match["user_id"] == 3
+    assert group["success"] and group["faces"][0]["user_id"] == 3
+
+
+def test_api_emits_and_accepts_packed_encodings(client, fake_encoder, jpeg_bytes, monkeypatch):
+    monkeypatch.setattr(api.face_service, "gallery", api.FaceGallery())
+    image = jpeg_bytes(200)
+    image_b64 = base64.b64encode(image).decode()
+
+    packed = client.post("/encode", json={"image_base64": image_b64, "encoding_format": "float16"}).json()
+    raw = client.post("/encode/raw?encoding_format=float32", content=image,
+                      headers={"accept": "application/octet-stream"})
+
+    assert packed["encoding"] is None
+    assert unpack_encoding(raw.content).backend == api.face_service.encoding_backend
+    enrolled = client.post("/gallery", json={"user_id": 3, "encoding": packed["encoding_packed"]})
+    assert enrolled.json()["dimension"] == 4
+    assert client.post("/authenticate/raw", content=image).json()["user_id"] == 3
+    known = client.post("/authenticate", json={
+        "image_base64": image_b64,
+        "known_encodings": [{"user_id": 5, "encoding": base64.b64encode(raw.content).decode()}],
+    }).json()
+    assert known["user_id"] == 5
+    assert client.post("/gallery", json={"user_id": 4, "encoding": "bogus"}).status_code == 400
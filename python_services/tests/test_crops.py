@@ -0,0 +1,92 @@
+import base64
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.suite import face_image
+from face_service import api
+from face_service.crops import CropOptions, cut_crop, encode_crop
+
+
+def test_box_crops_are_the_box():
+    image = np.arange(100 * 120 * 3, dtype=np.uint8).reshape(100, 120, 3)
+
+    assert np.array_equal(cut_crop(image, (10, 20, 30, 40), CropOptions()), image[20:60, 10:40])
+
+
+def test_square_crops_are_padded_and_resized():
+    image = np.full((100, 120, 3), 7, dtype=np.uint8)
+
+    # Box at the corner: the widened square leaves the image and is padded by replication
+    crop = cut_crop(image, (0, 0, 40, 60), CropOptions(size=32, margin=0.25))
+
+    assert crop.shape == (32, 32, 3)
+    assert (crop == 7).all()
+
+
+@pytest.mark.parametrize("crop_format", ["jpeg", "png", "webp"])
+def test_encoded_crops_decode_back(crop_format):
+    crop = np.full((32, 32, 3), (200, 40, 90), dtype=np.uint8)
+
+    decoded = cv2.imdecode(np.frombuffer(encode_crop(crop, CropOptions(format=crop_format, size=32)), np.uint8),
+                           cv2.IMREAD_COLOR)
+
+    assert decoded.shape == (32, 32, 3)
+    assert np.abs(cv2.cvtColor(decoded, cv2.COLOR_BGR2RGB).astype(int) - crop).max() < 8
+
+
+def test_raw_crops_need_a_size():
+    assert len(encode_crop(np.zeros((16, 16, 3), np.uint8), CropOptions(format="raw", size=16))) == 16 * 16 * 3
+    with pytest.raises(ValueError, match="fixed crop size"):
+        CropOptions(format="raw")
+
+
+def test_detect_returns_fixed_size_crops(client):
+    body = client.post("/detect/raw?return_crops=true&crop_size=96&crop_format=webp", content=face_image(640)).json()
+
+    assert body["count"] == 1
+    header, data = body["crops"][0].split(",", 1)
+    assert header == "data:image/webp;base64"
+    crop = cv2.imdecode(np.frombuffer(base64.b64decode(data), np.uint8), cv2.IMREAD_COLOR)
+    assert crop.shape == (96, 96, 3)
+
+
+def test_detect_streams_ndjson_and_multipart(client):
+    image = face_image(640)
+    url = "/detect/raw?return_crops=true&crop_size=64&crop_format=raw"
+
+    response = client.post(url, content=image, headers={"Accept": "application/x-ndjson"})
+    summary, face = [json.loads(line) for line in response.text.splitlines()]
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert summary["count"] == 1 and face["index"] == 0
+    assert face["box"] == summary["faces"][0] and (face["width"], face["height"]) == (64, 64)
+    assert len(base64.b64decode(face["crop"])) == 64 * 64 * 3
+
+    response = client.post(url, content=image, headers={"Accept": "multipart/mixed"})
+    boundary = response.headers["content-type"].split("boundary=")[1]
+    parts = response.content.split(f"--{boundary}".encode())
+    assert parts[-1] == b"--\r\n"
+    head, payload = parts[2].split(b"\r\n\r\n", 1)
+    assert b"X-Crop-Size: 64x64" in head and len(payload) == 64 * 64 * 3 + 2
+
+
+def test_crops_are_encoded_one_task_per_crop(client, monkeypatch):
+    encoded = []
+    encode = api.face_service.encode_crop
+    monkeypatch.setattr(api.face_service, "encode_crop",
+                        lambda crop, options: encoded.append(crop.shape) or encode(crop, options))
+    url = "/detect/raw?return_crops=true&crop_size=64"
+
+    streamed = client.post(url, content=face_image(640), headers={"Accept": "application/x-ndjson"})
+    buffered = client.post(url, content=face_image(640)).json()
+
+    assert len(streamed.text.splitlines()) == 2 and buffered["count"] == 1
+    assert encoded == [(64, 64, 3), (64, 64, 3)]
+
+
+def test_detect_rejects_raw_crops_without_size(client):
+    response = client.post("/detect/raw?return_crops=true&crop_format=raw", content=face_image(640))
+
+    assert response.status_code == 400
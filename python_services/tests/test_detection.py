@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic_faces import scene
+from face_service.detection import DetectionPolicy, detect_haar, detect_hog, detect_yunet, scale_box
+from face_service.face_service import FaceService
+
+
+def _gray(image):
+    return np.ascontiguousarray(image[..., 0])
+
+
+def test_downscale_respects_max_side():
+    image = np.zeros((3000, 4000), dtype=np.uint8)
+
+    small, scale = DetectionPolicy(max_side=1000).downscale(image)
+    assert small.shape == (750, 1000)
+    assert scale == 0.25
+
+    same, scale = DetectionPolicy(max_side=None).downscale(image)
+    assert same is image and scale == 1.0
+
+
+def test_scale_box_maps_back_and_clips():
+    assert scale_box((10, 20, 30, 40), 0.5, (200, 200)) == (20, 40, 60, 80)
+    assert scale_box((40, 40, 20, 20), 0.5, (100, 100)) == (80, 80, 20, 20)
+
+
+def test_downscaled_detection_finds_the_same_face():
+    service = FaceService()
+    gray = _gray(scene(3000, 2000, 800))
+
+    full = detect_haar(service.face_cascade, gray, DetectionPolicy(max_side=None, scale_factor=1.1))
+    downscaled = detect_haar(service.face_cascade, gray, DetectionPolicy(max_side=640, scale_factor=1.1))
+
+    assert len(full) == len(downscaled) == 1
+    (fx, fy, fw, fh), (dx, dy, dw, dh) = full[0], downscaled[0]
+    # Same face, located to within a few percent of its size
+    assert abs(fx - dx) < 0.05 * fw and abs(fy - dy) < 0.05 * fh
+    assert abs(fw - dw) < 0.1 * fw
+
+
+def test_min_face_size_is_in_full_resolution_pixels():
+    service = FaceService()
+    gray = _gray(scene(2400, 1600, 300))
+
+    assert len(detect_haar(service.face_cascade, gray, DetectionPolicy(max_side=600, min_face_size=200))) == 1
+    assert len(detect_haar(service.face_cascade, gray, DetectionPolicy(max_side=600, min_face_size=400))) == 0
+
+
+class FakeYuNet:
+    def __init__(self, rows):
+        self.rows = np.array(rows, dtype=np.float32)
+
+    def setInputSize(self, size):
+        self.size = size
+
+    def setScoreThreshold(self, threshold):
+        self.threshold = threshold
+
+    def detect(self, image):
+        rows = self.rows[self.rows[:, -1] >= self.threshold]
+        return 1, rows if len(rows) else None
+
+
+def test_yunet_boxes_are_clipped_filtered_and_mapped_to_full_resolution():
+    landmarks = [0.0] * 10
+    fake = FakeYuNet([
+        [-10, 20, 200, 220, *landmarks, 0.95],  # overhangs the left edge
+        [400, 100, 30, 30, *landmarks, 0.9],    # smaller than min_face_size
+        [300, 300, 150, 150, *landmarks, 0.5],  # below min_confidence
+    ])
+    image = np.zeros((1200, 1600, 3), dtype=np.uint8)
+
+    boxes = detect_yunet(fake, image, DetectionPolicy(detector="yunet", max_side=800, min_face_size=100))
+
+    assert fake.size == (800, 600) and fake.threshold == 0.7
+    assert boxes == [(0, 40, 380, 440)]
+
+
+def test_hog_locations_are_converted_and_scaled():
+    image = np.zeros((1000, 2000, 3), dtype=np.uint8)
+    seen = []
+
+    def face_locations(small):
+        seen.append(small.shape)
+        return [(10, 60, 50, 20)]  # top, right, bottom, left
+
+    assert detect_hog(face_locations, image, DetectionPolicy(detector="hog", max_side=1000)) == [(40, 20, 80, 80)]
+    assert seen == [(500, 1000, 3)]
+
+
+def test_unknown_detector_is_rejected():
+    with pytest.raises(ValueError, match="Unknown face detector"):
+        DetectionPolicy(detector="mtcnn")
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from face_service.face_service import FaceService
+from face_service.gallery import FaceGallery
+
+
+def test_upsert_and_remove_keep_matrix_contiguous():
+    gallery = FaceGallery(initial_capacity=2)
+    for user_id in range(5):
+        assert gallery.upsert(user_id, [float(user_id)] * 4)
+
+    assert len(gallery) == 5
+    assert gallery.matrix.dtype == np.float32
+    assert gallery.matrix.shape == (5, 4)
+
+    assert gallery.remove(1)
+    assert not gallery.remove(1)
+    assert 1 not in gallery
+    # The last row was moved into the removed slot
+    assert gallery.user_ids == [0, 4, 2, 3]
+    assert gallery.get(4) == [4.0] * 4
+
+    assert not gallery.upsert(4, [9.0] * 4)
+    assert gallery.get(4) == [9.0] * 4
+
+
+def test_rejects_dimension_mismatch():
+    gallery = FaceGallery()
+    gallery.upsert(1, [0.1] * 128)
+    with pytest.raises(ValueError):
+        gallery.upsert(2, [0.1] * 256)
+
+
+def test_authenticate_against_resident_gallery(monkeypatch):
+    service = FaceService()
+    rng = np.random.default_rng(0)
+    encodings = rng.random((3, 256))
+    for user_id, encoding in enumerate(encodings, start=1):
+        service.gallery.upsert(user_id, encoding.tolist())
+
+    monkeypatch.setattr(service, "encode_face", lambda image: encodings[1].tolist())
+    result = service.authenticate_face("probe")
+
+    assert result["authenticated"]
+    assert result["user_id"] == 2
+
+
+def test_authenticate_with_empty_gallery(monkeypatch):
+    service = FaceService()
+    monkeypatch.setattr(service, "encode_face", lambda image: [0.5] * 256)
+
+    result = service.authenticate_face("probe")
+
+    assert not result["success"]
+    assert result["error"] == "No known faces to compare against"
@@ -0,0 +1,126 @@
+import os
+import time
+
+import numpy as np
+
+from face_service import api
+from face_service.gallery import FaceGallery
+from face_service.gallery_store import _RECORD, GalleryStore
+
+
+def _vectors(count, dimension=8, seed=0):
+    return np.random.default_rng(seed).random((count, dimension), dtype=np.float32)
+
+
+def _worker(directory, **kwargs):
+    """A (store, gallery) pair as one service worker would hold them"""
+    store = GalleryStore(str(directory), **kwargs)
+    gallery = FaceGallery()
+    store.open(gallery)
+    return store, gallery
+
+
+def _enroll(store, gallery, user_id, vector):
+    gallery.upsert(user_id, vector)
+    store.append_upsert(user_id, vector)
+
+
+def test_compacted_snapshot_is_memory_mapped_with_spare_rows(tmp_path):
+    vectors = _vectors(50)
+    store, gallery = _worker(tmp_path, min_headroom=16)
+    for user_id, vector in enumerate(vectors):
+        _enroll(store, gallery, user_id, vector)
+
+    assert store.compact(gallery) == 1
+    _, loaded = _worker(tmp_path)
+
+    assert isinstance(loaded._matrix, np.memmap)
+    assert loaded.user_ids == list(range(50))
+    np.testing.assert_array_equal(loaded.matrix, vectors)
+    # Enrollment fills a spare row of the map instead of growing into a private copy
+    loaded.upsert(99, vectors[0])
+    assert isinstance(loaded._matrix, np.memmap)
+    assert sorted(os.listdir(tmp_path)) == ["compact.lock", "encodings.1.npy", "gallery.lock", "snapshot.json", "sq_norms.1.npy", "user_ids.1.npy"]
+
+
+def test_workers_see_each_others_appends_and_compactions(tmp_path):
+    vectors = _vectors(4)
+    store_a, gallery_a = _worker(tmp_path)
+    store_b, gallery_b = _worker(tmp_path)
+
+    _enroll(store_a, gallery_a, 1, vectors[0])
+    _enroll(store_a, gallery_a, 2, vectors[1])
+    gallery_a.remove(1)
+    store_a.append_remove(1)
+    store_b.refresh(gallery_b)
+    assert gallery_b.user_ids == [2]
+
+    _enroll(store_b, gallery_b, 3, vectors[2])
+    store_b.compact(gallery_b)
+    _enroll(store_b, gallery_b, 4, vectors[3])
+    store_a.refresh(gallery_a)
+
+    assert sorted(gallery_a.user_ids) == [2, 3, 4]
+    np.testing.assert_array_equal(gallery_a.get(4), vectors[3])
+    assert store_a.generation == store_b.generation == 1
+
+
+def test_changes_made_while_compacting_are_carried_into_the_new_log(tmp_path, monkeypatch):
+    vectors = _vectors(4)
+    store, gallery = _worker(tmp_path)
+    other, other_gallery = _worker(tmp_path)
+    _enroll(store, gallery, 1, vectors[0])
+    _enroll(store, gallery, 2, vectors[1])
+    write_arrays = store._write_arrays
+
+    def write_while_enrolling(*args):
+        # Neither lock is held while the arrays are written
+        _enroll(store, gallery, 1, vectors[2])
+        _enroll(other, other_gallery, 3, vectors[3])
+        write_arrays(*args)
+
+    monkeypatch.setattr(store, "_write_arrays", write_while_enrolling)
+    assert store.compact(gallery) == 1
+
+    _, restarted = _worker(tmp_path)
+    assert sorted(restarted.user_ids) == sorted(gallery.user_ids) == [1, 2, 3]
+    np.testing.assert_array_equal(restarted.get(1), vectors[2])
+    assert not os.path.exists(tmp_path / "gallery.0.log")
+
+
+def test_torn_log_tail_waits_for_the_rest_of_the_record(tmp_path):
+    store, gallery = _worker(tmp_path)
+    vector = _vectors(1)[0]
+    _enroll(store, gallery, 1, vector)
+    log_path = tmp_path / "gallery.0.log"
+    record = _RECORD.pack(1, 2, vector.size) + vector.tobytes()
+
+    with open(log_path, "ab") as f:
+        f.write(record[:-5])
+    reader, reader_gallery = _worker(tmp_path)
+    assert reader_gallery.user_ids == [1]
+
+    with open(log_path, "ab") as f:
+        f.write(record[-5:])
+    reader.refresh(reader_gallery)
+    assert reader_gallery.user_ids == [1, 2]
+
+
+def test_api_logs_enrollments_and_compacts(client, monkeypatch, tmp_path):
+    store = GalleryStore(str(tmp_path), compact_after=2)
+    monkeypatch.setattr(api, "gallery_store", store)
+    monkeypatch.setattr(api.face_service, "gallery", FaceGallery())
+
+    client.post("/gallery", json={"user_id": 1, "encoding": [0.1] * 4})
+    assert store.generation == 0
+    client.put("/gallery/1", json={"encoding": [0.2] * 4})
+
+    # Compaction runs in the background; the enrollment that triggered it does not wait
+    for _ in range(200):
+        if store.generation == 1:
+            break
+        time.sleep(0.01)
+    assert store.generation == 1
+    _, restarted = _worker(tmp_path)
+    np.testing.assert_allclose(restarted.get(1), [0.2] * 4)
+    assert client.post("/gallery/compact").json()["count"] == 1
@@ -0,0 +1,66 @@
+import base64
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from face_service.face_service import FaceService
+from face_service.imaging import decode_image_buffer, image_size, reduction_factor
+
+
+def _encoded(width, height, fmt):
+    buf = io.BytesIO()
+    pixels = np.random.default_rng(0).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
+def test_image_size_reads_headers(fmt):
+    assert image_size(_encoded(321, 123, fmt)) == (321, 123)
+
+
+def test_image_size_unknown_format():
+    assert image_size(_encoded(10, 10, "BMP")) is None
+    assert image_size(b"") is None
+
+
+def test_reduction_factor_keeps_longer_side_above_target():
+    assert reduction_factor((4000, 3000), 1000) == 4
+    assert reduction_factor((4000, 3000), 300) == 8
+    assert reduction_factor((1500, 1000), 1000) == 1
+    assert reduction_factor((4000, 3000), None) == 1
+    assert reduction_factor(None, 1000) == 1
+
+
+def test_decode_matches_pil_orientation_and_reduces():
+    data = _encoded(800, 600, "PNG")
+    full, factor = decode_image_buffer(data)
+    assert factor == 1
+    np.testing.assert_array_equal(full, np.array(Image.open(io.BytesIO(data)).convert("RGB")))
+
+    reduced, factor = decode_image_buffer(_encoded(800, 600, "JPEG"), max_side=200)
+    assert factor == 4
+    assert reduced.shape == (150, 200, 3)
+
+
+def test_exif_orientation_is_ignored_on_every_decode_path():
+    buf = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees clockwise to display
+    pixels = np.random.default_rng(0).integers(0, 256, size=(40, 80, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(buf, format="JPEG", exif=exif)
+    data = buf.getvalue()
+
+    full, _ = decode_image_buffer(data)
+    reduced, factor = decode_image_buffer(data, max_side=40)
+    pil = FaceService().decode_image(base64.b64encode(data).decode())
+
+    assert full.shape == pil.shape == (40, 80, 3)
+    assert factor == 2 and reduced.shape == (20, 40, 3)
+    assert np.abs(full.astype(int) - pil.astype(int)).mean() < 2
+
+
+def test_decode_returns_none_for_garbage():
+    assert decode_image_buffer(b"definitely not an image") == (None, 1)
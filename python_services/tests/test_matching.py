@@ -0,0 +1,173 @@
+import types
+
+import numpy as np
+import pytest
+
+from face_service import face_service as face_service_module
+from face_service.face_service import FaceService
+from face_service.matching import EncodingMatrix, assign_one_to_one, match_scores, top_columns
+
+
+def _fake_face_recognition():
+    """Minimal stand-in with face_recognition's distance semantics"""
+    def face_distance(faces, face):
+        return np.linalg.norm(faces - face, axis=1)
+
+    def compare_faces(faces, face, tolerance=0.6):
+        return list(face_distance(faces, face) <= tolerance)
+
+    return types.SimpleNamespace(face_distance=face_distance, compare_faces=compare_faces)
+
+
+def _sequential_best_match(service, probe, known_encodings):
+    """The per-candidate loop FaceService used before batched matching"""
+    best_match = None
+    best_confidence = 0.0
+    for known_face in known_encodings:
+        comparison = service.compare_faces(known_face["encoding"], probe)
+        if comparison["match"] and comparison["confidence"] > best_confidence:
+            best_match = known_face["user_id"], comparison["confidence"], comparison["distance"]
+            best_confidence = comparison["confidence"]
+    return best_match
+
+
+@pytest.fixture
+def dlib_backend(monkeypatch):
+    monkeypatch.setattr(face_service_module, "USE_FACE_RECOGNITION", True)
+    monkeypatch.setattr(face_service_module, "face_recognition", _fake_face_recognition(), raising=False)
+
+
+def test_encoding_matrix_distances_match_numpy():
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(size=(50, 128)).astype(np.float32)
+    probe = rng.normal(size=128).astype(np.float32)
+    encodings = EncodingMatrix(matrix)
+
+    expected = np.linalg.norm(matrix - probe, axis=1)
+    np.testing.assert_allclose(encodings.euclidean_distances(probe), expected, rtol=1e-4)
+
+    expected = matrix @ probe / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(probe))
+    np.testing.assert_allclose(encodings.cosine_similarities(probe), expected, rtol=1e-4, atol=1e-6)
+
+
+@pytest.mark.parametrize("dimension", [128, 256])
+def test_cosine_matching_parity_with_sequential_scan(dimension):
+    rng = np.random.default_rng(dimension)
+    service = FaceService()
+    base = rng.random(dimension)
+    known = [
+        {"user_id": i, "encoding": (base + rng.normal(scale=0.3, size=dimension)).tolist()}
+        for i in range(200)
+    ]
+    probe = (base + rng.normal(scale=0.1, size=dimension)).tolist()
+
+    user_id, confidence, distance = _sequential_best_match(service, probe, known)
+    match = service._find_best_match_in(probe, [(k["user_id"], k["encoding"]) for k in known])
+
+    assert match["user_id"] == user_id
+    assert match["confidence"] == pytest.approx(confidence, abs=1e-6)
+    assert match["distance"] == pytest.approx(distance, abs=1e-6)
+
+
+def test_euclidean_matching_parity_with_sequential_scan(dlib_backend):
+    rng = np.random.default_rng(7)
+    service = FaceService(tolerance=0.6)
+    known = [{"user_id": i, "encoding": (rng.normal(scale=0.1, size=128)).tolist()} for i in range(500)]
+    probe = (np.asarray(known[321]["encoding"]) + rng.normal(scale=0.01, size=128)).tolist()
+
+    user_id, confidence, distance = _sequential_best_match(service, probe, known)
+    match = service._find_best_match_in(probe, [(k["user_id"], k["encoding"]) for k in known])
+
+    assert match["user_id"] == user_id == 321
+    assert match["confidence"] == pytest.approx(confidence, abs=1e-6)
+    assert match["distance"] == pytest.approx(distance, abs=1e-6)
+
+
+def test_mixed_dimensions_and_no_match():
+    service = FaceService()
+    probe = [1.0] * 256
+    candidates = [(1, [1.0] * 128), (2, [-1.0] * 256), (3, "not an encoding")]
+
+    # Zero-padded 128-d row: cos = 128 / (sqrt(128) * 16) ~= 0.707 >= 0.7
+    match = service._find_best_match_in(probe, candidates)
+    assert match["user_id"] == 1
+
+    assert service._find_best_match_in(probe, [(2, [-1.0] * 256)]) is None
+
+
+def test_encoding_matrix_probe_matrices_match_single_probe():
+    rng = np.random.default_rng(3)
+    encodings = EncodingMatrix(rng.normal(size=(40, 128)).astype(np.float32))
+    probes = rng.normal(size=(5, 128)).astype(np.float32)
+
+    np.testing.assert_allclose(encodings.euclidean_distance_matrix(probes),
+                               np.stack([encodings.euclidean_distances(p) for p in probes]), rtol=1e-4)
+    np.testing.assert_allclose(encodings.cosine_similarity_matrix(probes),
+                               np.stack([encodings.cosine_similarities(p) for p in probes]), rtol=1e-4, atol=1e-6)
+
+
+def test_assignment_gives_each_user_to_one_probe():
+    confidences = np.array([[0.9, 0.8, 0.1], [0.95, 0.6, 0.2], [0.7, 0.65, 0.0]])
+    eligible = confidences >= 0.5
+
+    # Probe 1 takes user a, probe 0 falls back to b, probe 2 is left without a user
+    assert assign_one_to_one(confidences, eligible, ["a", "b", "c"]) == [1, 0, None]
+    # Two columns of the same user still count as one user
+    assert assign_one_to_one(confidences, eligible, ["a", "a", "c"]) == [None, 0, None]
+
+
+def test_top_columns_keeps_what_assignment_needs():
+    rng = np.random.default_rng(5)
+    confidences = rng.random((4, 1000)).astype(np.float32)
+    eligible = confidences >= 0.5
+    user_ids = list(range(1000))
+
+    columns = top_columns(confidences, eligible, 4)
+    pruned = assign_one_to_one(confidences[:, columns], eligible[:, columns], [user_ids[c] for c in columns])
+
+    assert [columns[c] for c in pruned] == assign_one_to_one(confidences, eligible, user_ids)
+
+
+@pytest.mark.parametrize("use_gallery", [True, False])
+def test_group_identification_agrees_with_single_face_matching(use_gallery):
+    rng = np.random.default_rng(11)
+    service = FaceService()
+    known = rng.random((300, 256)).astype(np.float32)
+    for user_id, encoding in enumerate(known):
+        service.gallery.upsert(user_id, encoding)
+    known_encodings = None if use_gallery else [{"user_id": i, "encoding": e.tolist()} for i, e in enumerate(known)]
+    probes = [(known[i] + rng.normal(scale=0.01, size=256)).tolist() for i in (17, 42, 256)] + [None]
+
+    result = service.identify_encodings(probes, known_encodings)
+
+    faces = result["faces"]
+    assert [face["user_id"] for face in faces] == [17, 42, 256, None]
+    for probe, face in zip(probes[:3], faces):
+        single = service.match_encoding(probe, known_encodings)
+        assert face["confidence"] == pytest.approx(single["confidence"], abs=1e-6)
+        assert face["distance"] == pytest.approx(single["distance"], abs=1e-6)
+
+
+@pytest.mark.parametrize("dimension", [128, 256])
+def test_batched_gallery_matching_agrees_with_single_probe(dimension, dlib_backend):
+    rng = np.random.default_rng(5)
+    service = FaceService(tolerance=0.6)
+    known = rng.random((200, dimension)).astype(np.float32) / 8
+    for user_id, encoding in enumerate(known):
+        service.gallery.upsert(user_id, encoding)
+    probes = [(known[i] + rng.normal(scale=0.005, size=dimension)).tolist() for i in (3, 150)]
+    probes += [rng.random(dimension).tolist(), [1.0, 2.0]]
+
+    assert service.match_encodings(probes) == [service.match_encoding(probe) for probe in probes]
+
+
+def test_match_scores_agree_for_scalars_and_matrices():
+    distances = np.array([[0.2, 0.7], [1.4, 0.6]])
+
+    confidences, matches = match_scores(distances, "euclidean", 0.6)
+    assert np.allclose(confidences, [[0.8, 0.3], [0.0, 0.4]])
+    assert matches.tolist() == [[True, False], [False, True]]
+    assert match_scores(0.2, "euclidean", 0.6)[0] == confidences[0, 0]
+
+    confidences, matches = match_scores(np.array([-0.2, 0.7, 0.9]), "cosine", 0.7)
+    assert confidences.tolist() == [0.0, 0.7, 0.9] and matches.tolist() == [False, True, True]
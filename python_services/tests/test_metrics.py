@@ -0,0 +1,66 @@
+import logging
+
+from face_service import api
+from face_service.log import RateLimitFilter
+from face_service.metrics import Histogram, timed_stage, traced_call
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("demo_seconds", "Demo.", ("endpoint",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(("/x",), value)
+
+    lines = histogram.render()
+
+    assert 'demo_seconds_bucket{endpoint="/x",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{endpoint="/x",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{endpoint="/x",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{endpoint="/x"} 3' in lines
+
+
+def test_traced_call_collects_only_its_own_stages():
+    def work():
+        with timed_stage("decode"):
+            pass
+        with timed_stage("detect"):
+            return "done"
+
+    result, stages = traced_call(work)
+
+    assert result == "done"
+    assert [stage for stage, _ in stages] == ["decode", "detect"]
+    # Outside a traced call timed_stage is a no-op
+    with timed_stage("decode"):
+        pass
+
+
+def test_metrics_endpoint_reports_stages_per_endpoint(client, jpeg_bytes, monkeypatch):
+    monkeypatch.setattr(api.face_service, "gallery", api.FaceGallery())
+    api.face_service.gallery.upsert(1, [0.5] * 8)
+    histogram = api.REGISTRY.stages
+    backend = api.face_service.backend
+    before = histogram.count(("/detect/raw", "detect", backend))
+
+    client.post("/detect/raw", content=jpeg_bytes(120))
+    client.post("/authenticate/raw", content=jpeg_bytes(130))
+    body = client.get("/metrics").text
+
+    assert histogram.count(("/detect/raw", "detect", backend)) == before + 1
+    assert histogram.count(("/detect/raw", "decode", backend)) >= 1
+    assert f'face_stage_duration_seconds_count{{endpoint="/detect/raw",stage="color",backend="{backend}"}}' in body
+    assert 'face_request_duration_seconds_count{endpoint="/authenticate/raw",status="200"}' in body
+
+
+def test_rate_limit_filter_drops_bursts_and_reports_them(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("face_service.log.time.monotonic", lambda: clock[0])
+    limiter = RateLimitFilter(interval=10, burst=2)
+
+    def record():
+        return logging.LogRecord("face", logging.WARNING, __file__, 1, "Error encoding face: %s", ("x",), None)
+
+    assert [limiter.filter(record()) for _ in range(4)] == [True, True, False, False]
+    clock[0] = 11
+    resumed = record()
+    assert limiter.filter(resumed)
+    assert "2 similar messages suppressed" in resumed.getMessage()
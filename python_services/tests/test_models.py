@@ -0,0 +1,49 @@
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from face_service import api
+from face_service.executor import FaceExecutor
+from face_service.models import LazyModule, ModelRegistry, resolve_backend
+
+
+def test_lazy_module_imports_on_first_use():
+    module = LazyModule("json")
+    assert not module.loaded
+
+    assert module.dumps([1]) == "[1]"
+    assert module.loaded and module.load() is sys.modules["json"]
+
+
+def test_backend_resolution():
+    assert resolve_backend("opencv") == "opencv"
+    assert resolve_backend("auto") in ("face_recognition", "opencv")
+    with pytest.raises(ValueError):
+        resolve_backend("dlib")
+
+
+def test_registry_shares_one_cascade_per_thread():
+    registry = ModelRegistry("opencv")
+    assert registry.load() >= 0
+    assert registry.haar_cascade() is registry.haar_cascade()
+    assert not registry.face_recognition.loaded
+
+
+def test_readiness_follows_warm_up(monkeypatch):
+    monkeypatch.setattr(api, "face_executor", FaceExecutor(api.face_service, mode="inline"))
+    monkeypatch.setattr(api, "startup", {"status": "starting", "warmup_s": None, "error": None})
+    client = TestClient(api.app)
+
+    assert client.get("/health/live").json() == {"status": "ok"}
+    assert client.get("/health/ready").status_code == 503
+
+    with client:
+        deadline = time.monotonic() + 10
+        while client.get("/health/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        body = client.get("/health/ready").json()
+
+    assert body["status"] == "ready" and body["backend"] == api.face_service.backend
+    assert body["warmup_s"] is not None
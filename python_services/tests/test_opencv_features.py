@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+import pytest
+
+from face_service.face_service import FaceService
+
+
+def _reference_lbp_features(face_roi):
+    """Original per-pixel LBP loop, kept as the parity oracle"""
+    lbp_values = []
+    height, width = face_roi.shape
+    for i in range(1, height - 1):
+        for j in range(1, width - 1):
+            center = face_roi[i, j]
+            code = 0
+            for k, (di, dj) in enumerate([(-1,-1), (-1,0), (-1,1), (0,1), (1,1), (1,0), (1,-1), (0,-1)]):
+                if face_roi[i+di, j+dj] > center:
+                    code += 2 ** k
+            lbp_values.append(code)
+    hist, _ = np.histogram(lbp_values, bins=32, range=(0, 256))
+    hist = hist / (hist.sum() + 1e-7)
+    return hist.tolist()
+
+
+def _reference_patch_features(face_roi):
+    """Original per-patch statistics loop, kept as the parity oracle"""
+    patches = []
+    patch_size = 16
+    height, width = face_roi.shape
+    for i in range(0, height - patch_size, patch_size // 2):
+        for j in range(0, width - patch_size, patch_size // 2):
+            patch = face_roi[i:i+patch_size, j:j+patch_size]
+            if patch.shape == (patch_size, patch_size):
+                patches.extend([patch.mean(), patch.std(), patch.min(), patch.max()])
+    return patches[:64]
+
+
+def _reference_features(face_roi):
+    """Original per-face histogram and cv2.Sobel gradient features, ahead of the LBP and patch oracles"""
+    hist = cv2.calcHist([face_roi], [0], None, [32], [0, 256])
+    hist = hist.flatten() / (hist.sum() + 1e-7)
+    grad_x = cv2.Sobel(face_roi, cv2.CV_64F, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(face_roi, cv2.CV_64F, 0, 1, ksize=3)
+    features = list(hist) + [grad_x.mean(), grad_x.std(), grad_x.min(), grad_x.max(),
+                             grad_y.mean(), grad_y.std(), grad_y.min(), grad_y.max()]
+    features += _reference_lbp_features(face_roi) + _reference_patch_features(face_roi)
+    return [float(value) for value in features] + [0.0] * (256 - len(features))
+
+
+def _rois():
+    rng = np.random.default_rng(42)
+    yield rng.integers(0, 256, size=(128, 128), dtype=np.uint8)
+    # Coarse values produce many equal neighbours, exercising the strict '>' comparison
+    yield (rng.integers(0, 4, size=(128, 128)) * 85).astype(np.uint8)
+    yield np.tile(np.arange(128, dtype=np.uint8), (128, 1))
+    yield np.full((128, 128), 200, dtype=np.uint8)
+    yield rng.integers(0, 256, size=(40, 23), dtype=np.uint8)
+    yield rng.integers(0, 256, size=(17, 17), dtype=np.uint8)
+    yield rng.integers(0, 256, size=(16, 30), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("face_roi", list(_rois()))
+def test_lbp_features_are_bit_identical(face_roi):
+    assert FaceService()._compute_lbp_features(face_roi) == _reference_lbp_features(face_roi)
+
+
+@pytest.mark.parametrize("face_roi", list(_rois()))
+def test_patch_features_are_bit_identical(face_roi):
+    expected = [float(value) for value in _reference_patch_features(face_roi)]
+    assert FaceService()._compute_patch_features(face_roi) == expected
+
+
+def test_feature_batch_is_bit_identical_per_face():
+    rois = np.stack([face_roi for face_roi in _rois() if face_roi.shape == (128, 128)])
+
+    features = FaceService()._opencv_feature_batch(rois)
+
+    assert [row.tolist() for row in features] == [_reference_features(face_roi) for face_roi in rois]
@@ -0,0 +1,122 @@
+import base64
+
+import numpy as np
+import pytest
+
+from face_service import api
+from face_service.gallery import FaceGallery
+from face_service.shards import GalleryShards
+
+
+def make_gallery(count: int, dimension: int = 4) -> FaceGallery:
+    gallery = FaceGallery()
+    rng = np.random.default_rng(0)
+    for user_id in range(count):
+        gallery.upsert(user_id, rng.random(dimension).tolist())
+    return gallery
+
+
+def test_subset_is_a_contiguous_copy_of_enrolled_members():
+    gallery = make_gallery(6)
+
+    subset = gallery.subset([4, 1, 99, 4])
+
+    assert subset.user_ids == [4, 1]
+    assert subset.matrix.flags["C_CONTIGUOUS"]
+    assert subset.get(1) == gallery.get(1)
+    gallery.upsert(1, [0.0] * 4)
+    assert subset.get(1) != [0.0] * 4
+
+
+def test_shard_gallery_follows_gallery_changes_in_place():
+    gallery = make_gallery(6)
+    shards = GalleryShards(gallery)
+    shards.set_members("event-1", [0, 2, 7])
+
+    first = shards.gallery_for("event-1")
+    assert first.user_ids == [0, 2]
+    assert shards.gallery_for("event-1") is first
+
+    gallery.upsert(7, [0.5] * 4)
+    gallery.upsert(2, [0.25] * 4)
+    gallery.remove(0)
+    gallery.upsert(3, [1.0] * 4)
+    assert shards.gallery_for("event-1") is first
+    assert sorted(first.user_ids) == [2, 7]
+    assert first.get(2) == [0.25] * 4 and first.get(7) == [0.5] * 4
+    assert shards.gallery_for("unknown") is None
+
+    gallery.clear()
+    gallery.upsert(2, [0.0] * 4)
+    recut = shards.gallery_for("event-1")
+    assert recut is not first and recut.user_ids == [2]
+
+
+def test_changes_since_covers_only_the_logged_versions():
+    gallery = FaceGallery(change_log_size=2)
+    gallery.upsert(1, [1.0])
+    start = gallery.version
+    gallery.upsert(2, [2.0])
+    gallery.remove(1)
+
+    assert gallery.changes_since(start) == {1, 2}
+    assert gallery.changes_since(gallery.version) == set()
+    gallery.upsert(3, [3.0])
+    assert gallery.changes_since(start) is None
+    gallery.clear()
+    assert gallery.changes_since(gallery.version - 1) is None
+
+
+def test_least_recently_used_shards_are_evicted_over_budget():
+    gallery = make_gallery(8)
+    one_shard = gallery.subset([0, 1]).nbytes
+    shards = GalleryShards(gallery, max_bytes=2 * one_shard)
+    for name, members in (("a", [0, 1]), ("b", [2, 3]), ("c", [4, 5])):
+        shards.set_members(name, members)
+
+    shards.gallery_for("a")
+    shards.gallery_for("b")
+    shards.gallery_for("a")
+    shards.gallery_for("c")
+
+    loaded = {row["name"]: row["loaded"] for row in shards.stats()}
+    assert loaded == {"a": True, "b": False, "c": True}
+    assert shards.members("b") == [2, 3]
+
+
+def test_memberships_are_shared_through_the_directory(tmp_path):
+    gallery = make_gallery(4)
+    writer = GalleryShards(gallery, directory=str(tmp_path))
+    reader = GalleryShards(gallery, directory=str(tmp_path))
+
+    writer.set_members("event-1", [1, 2])
+    assert reader.members("event-1") == [1, 2]
+
+    writer.remove("event-1")
+    assert reader.members("event-1") is None
+    with pytest.raises(ValueError):
+        writer.set_members("../escape", [1])
+
+
+def test_authenticate_scoped_to_shard_with_fallback(client, monkeypatch, jpeg_bytes):
+    gallery = FaceGallery()
+    gallery.upsert(1, [1.0, 0.0, 0.0])
+    gallery.upsert(2, [0.0, 1.0, 0.0])
+    monkeypatch.setattr(api.face_service, "gallery", gallery)
+    monkeypatch.setattr(api, "gallery_shards", GalleryShards(gallery))
+    monkeypatch.setattr(api.face_service, "encode_image", lambda image_np, policy=None, boxes=None: [0.0, 1.0, 0.0])
+    image = jpeg_bytes(200)
+    assert client.put("/gallery/shards/event-1", json={"user_ids": [1]}).json()["shards"][0]["members"] == 1
+
+    body = {"image_base64": base64.b64encode(image).decode(), "shard": "event-1"}
+    scoped = client.post("/authenticate", json=body).json()
+    widened = client.post("/authenticate", json={**body, "fallback": True}).json()
+    candidates = client.post("/authenticate/raw?candidates=2&candidates=3", content=image).json()
+
+    assert not scoped["authenticated"] and scoped["scope"] == "shard"
+    assert widened["user_id"] == 2 and widened["scope"] == "all"
+    assert candidates["user_id"] == 2 and candidates["scope"] == "candidates"
+    assert client.post("/authenticate", json={**body, "shard": "missing"}).status_code == 404
+    assert client.post("/gallery/shards/event-1/load").json()["shards"][0]["loaded"]
+    assert client.delete("/gallery/shards/event-1").status_code == 200
+    assert client.get("/gallery/shards").json()["shards"] == []
@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+import pytest
+
+from face_service.tracking import FaceTracker, flow_frame, iou
+
+
+def test_iou():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert iou((0, 0, 10, 10), (20, 0, 10, 10)) == 0.0
+    assert iou((0, 0, 10, 10), (5, 0, 10, 10)) == pytest.approx(50 / 150)
+
+
+def _update(tracker, faces):
+    return tracker.update(faces, faces)
+
+
+def test_tracks_are_encoded_once_while_the_face_stays():
+    tracker = FaceTracker()
+    pending, lost = _update(tracker, [(0, 0, 100, 100)])
+    assert [track.track_id for track in pending] == [1] and not lost
+    assert tracker.identify(pending[0], {"authenticated": True, "user_id": 7, "confidence": 0.9, "distance": 0.1})
+
+    # Small movement keeps the identity; a new face gets its own track
+    pending, _ = _update(tracker, [(5, 0, 100, 100), (300, 0, 100, 100)])
+    assert [track.track_id for track in pending] == [2]
+    assert tracker.tracks[0].box == (5, 0, 100, 100) and tracker.tracks[0].user_id == 7
+
+
+def test_large_jumps_are_reverified_without_losing_identity():
+    tracker = FaceTracker(reverify_iou=0.5)
+    pending, _ = _update(tracker, [(0, 0, 100, 100)])
+    match = {"authenticated": True, "user_id": 7, "confidence": 0.9, "distance": 0.1}
+    tracker.identify(pending[0], match)
+
+    pending, _ = _update(tracker, [(40, 0, 100, 100)])
+
+    assert [track.track_id for track in pending] == [1]
+    assert not tracker.identify(pending[0], match)
+
+
+def test_tracks_are_lost_after_max_misses():
+    tracker = FaceTracker(max_misses=1)
+    _update(tracker, [(0, 0, 100, 100)])
+
+    assert _update(tracker, []) == ([], [])
+    pending, lost = _update(tracker, [])
+
+    assert [track.track_id for track in lost] == [1] and tracker.tracks == []
+
+
+def test_unknown_faces_are_retried_with_backoff():
+    tracker = FaceTracker(max_retry_interval=4)
+    retried = []
+    for detection_round in range(1, 21):
+        pending, _ = _update(tracker, [(0, 0, 100, 100)])
+        if pending:
+            retried.append(detection_round)
+            tracker.identify(pending[0], {"authenticated": False})
+
+    assert retried == [1, 2, 4, 8, 12, 16, 20]
+
+    # A jump re-checks at once, whatever the backoff
+    pending, _ = _update(tracker, [(40, 0, 100, 100)])
+    assert [track.track_id for track in pending] == [1]
+
+
+def _textured_frame(shift: int) -> np.ndarray:
+    """A 240x320 RGB frame of blurred noise, moved shift pixels to the right"""
+    noise = (np.random.default_rng(1).random((240, 480)) * 255).astype(np.uint8)
+    gray = cv2.GaussianBlur(noise, (5, 5), 0)[:, 80 - shift:400 - shift]
+    return np.dstack([gray] * 3)
+
+
+def test_flow_carries_tracks_across_moves_wider_than_the_box():
+    tracker = FaceTracker()
+    tracker.follow(*flow_frame(_textured_frame(0), 1, tracker.flow_side))
+    pending, _ = _update(tracker, [(100, 80, 40, 40)])
+    tracker.identify(pending[0], {"authenticated": True, "user_id": 7, "confidence": 0.9, "distance": 0.1})
+
+    # Four frames of 12 px each: 48 px, more than a box width, so IoU alone would start a new track
+    for step in range(1, 5):
+        tracker.follow(*flow_frame(_textured_frame(12 * step), 1, tracker.flow_side))
+    assert abs(tracker.tracks[0].box[0] - 148) <= 2
+
+    pending, lost = _update(tracker, [(148, 80, 40, 40)])
+    assert not pending and not lost
+    assert [track.user_id for track in tracker.tracks] == [7]
+
+
+def test_flow_frame_scales_to_full_resolution():
+    gray, scale = flow_frame(np.zeros((300, 400, 3), np.uint8), 2, 320)
+
+    assert gray.shape == (240, 320) and scale == 2.5